@@ -1,15 +1,20 @@
 import argparse
-from multiprocessing import Pool
 from pathlib import Path
 
 from src.utils.montecarlo import (
     gibbs_rbm,
     exchange_rbm,
     hybrid_mcmc,
+    importance_sampling,
     neural_mcmc,
+    neural_mcmc_betas,
+    nfold_way,
+    parallel_tempering,
+    replica_spin_flip,
     seq_hybrid_mcmc,
     single_spin_flip,
 )
+from src.utils.parallel import run_grid
 
 parser = argparse.ArgumentParser()
 
@@ -33,6 +38,25 @@ parser.add_argument(
     default=None,
     help="Number of steps to skip before starting to save (default: 0)",
 )
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=None,
+    help="Number of processes running the seed and beta grid (default: available cores)",
+)
+parser.add_argument(
+    "--reorder",
+    dest="reorder",
+    action="store_true",
+    help="Relabel the spins to improve memory locality on irregular couplings (single, nfold and pt only)",
+)
+parser.add_argument(
+    "--precision",
+    type=str,
+    default="double",
+    choices=["single", "double"],
+    help="Floating point precision of couplings and local fields (single, nfold and pt only, default: double)",
+)
 parser.add_argument(
     "--burnt",
     type=int,
@@ -43,7 +67,16 @@ parser.add_argument(
 parser_single = subparsers.add_parser(
     "single", help="Single Spin Flip Monte Carlo Simulation"
 )
+parser_nfold = subparsers.add_parser(
+    "nfold", help="Rejection-free n-fold way Monte Carlo Simulation"
+)
+parser_pt = subparsers.add_parser(
+    "pt", help="Parallel Tempering with Single Spin Flip across the beta list"
+)
 parser_neural = subparsers.add_parser("neural", help="Neural MCMC")
+parser_importance = subparsers.add_parser(
+    "importance", help="Importance sampling of the neural proposals, without a chain"
+)
 parser_hybrid = subparsers.add_parser("hybrid", help="Hybrid MCMC")
 parser_gibbs = subparsers.add_parser("gibbs", help="Gibbs MCMC via RBM")
 parser_exchange_rbm = subparsers.add_parser(
@@ -61,10 +94,83 @@ parser_single.add_argument(
     "--seed-startpoint",
     nargs="+",
     type=int,
-    default=42,
+    default=[42],
+    help="Seed to sample the starting point configuration, may be a list (default: 42)",
+)
+parser_single.add_argument(
+    "--replicas",
+    type=int,
+    default=1,
+    help="Number of independent chains advanced together by each process (default: 1)",
+)
+parser_single.add_argument(
+    "--update",
+    type=str,
+    default="random",
+    choices=["random", "checkerboard"],
+    help="Random site updates or parallel updates of one colour class at a time (default: random)",
+)
+parser_single.add_argument(
+    "--houdayer-every",
+    type=int,
+    default=0,
+    help="Number of steps between two Houdayer cluster moves of pairs of replicas, 0 to disable them (default: 0)",
+)
+
+parser_nfold.add_argument("--type", type=str, default="nfold", help=argparse.SUPPRESS)
+parser_nfold.add_argument(
+    "--sweeps",
+    type=int,
+    default=0,
+    help="Number of attemps to flip each spin before save (default: 0)",
+)
+parser_nfold.add_argument(
+    "--seed-startpoint",
+    nargs="+",
+    type=int,
+    default=[42],
     help="Seed to sample the starting point configuration, may be a list (default: 42)",
 )
 
+parser_pt.add_argument("--type", type=str, default="pt", help=argparse.SUPPRESS)
+parser_pt.add_argument(
+    "--sweeps",
+    type=int,
+    default=0,
+    help="Number of attemps to flip each spin before save (default: 0)",
+)
+parser_pt.add_argument(
+    "--seed-startpoint",
+    nargs="+",
+    type=int,
+    default=[42],
+    help="Seed to sample the starting point configuration, may be a list (default: 42)",
+)
+parser_pt.add_argument(
+    "--replicas",
+    type=int,
+    default=1,
+    help="Number of chains at each temperature (default: 1)",
+)
+parser_pt.add_argument(
+    "--swap-every",
+    type=int,
+    default=1,
+    help="Number of steps between two swap attempts (default: 1)",
+)
+parser_pt.add_argument(
+    "--adapt-betas",
+    dest="adapt_betas",
+    action="store_true",
+    help="Adapt the inner temperatures during burn-in to equalize the swap rates, needs --burnt > 0",
+)
+parser_pt.add_argument(
+    "--houdayer-every",
+    type=int,
+    default=0,
+    help="Number of steps between two Houdayer cluster moves of pairs of replicas at the same temperature, 0 to disable them (default: 0)",
+)
+
 parser_neural.add_argument("--type", type=str, default="neural", help=argparse.SUPPRESS)
 parser_neural.add_argument(
     "--path", type=str, help="Path to the model or to the generated sample"
@@ -78,6 +184,77 @@ parser_neural.add_argument(
 parser_neural.add_argument(
     "--save-every", type=int, help="Number of steps to save", default=1
 )
+parser_neural.add_argument(
+    "--energy-backend",
+    type=str,
+    default="auto",
+    choices=["auto", "numba", "sparse", "stencil"],
+    help="Backend scoring the proposals, auto picks the stencil on regular lattices (default: auto)",
+)
+parser_neural.add_argument(
+    "--cache-size",
+    type=int,
+    default=0,
+    help="Number of distinct proposals whose energy is cached, 0 to disable the cache (default: 0)",
+)
+parser_neural.add_argument(
+    "--stream",
+    dest="stream",
+    action="store_true",
+    help="Generate the proposals in batches while the chain consumes them, instead of all at once",
+)
+parser_neural.add_argument(
+    "--queue-size",
+    type=int,
+    default=2,
+    help="Maximum number of streamed batches waiting in memory (default: 2)",
+)
+parser_neural.add_argument(
+    "--pool",
+    type=str,
+    default="none",
+    choices=["none", "sequential", "parallel"],
+    help="Generate and score the proposals once for all the betas, then run their chains one after the other or in parallel (default: none)",
+)
+parser_neural.add_argument(
+    "--tries",
+    type=int,
+    default=1,
+    help="Candidates scored together at each step, more than one for multiple-try Metropolis (default: 1)",
+)
+
+
+parser_importance.add_argument(
+    "--type", type=str, default="importance", help=argparse.SUPPRESS
+)
+parser_importance.add_argument(
+    "--path", type=str, help="Path to the model or to the generated sample"
+)
+parser_importance.add_argument(
+    "--model", type=str, choices=["made", "pixel", "rbm"], help="Model to use"
+)
+parser_importance.add_argument(
+    "--batch-size", type=int, default=20000, help="Size of each batch (default: 20000)"
+)
+parser_importance.add_argument(
+    "--energy-backend",
+    type=str,
+    default="auto",
+    choices=["auto", "numba", "sparse", "stencil"],
+    help="Backend scoring the proposals, auto picks the stencil on regular lattices (default: auto)",
+)
+parser_importance.add_argument(
+    "--cache-size",
+    type=int,
+    default=0,
+    help="Number of distinct proposals whose energy is cached, 0 to disable the cache (default: 0)",
+)
+parser_importance.add_argument(
+    "--min-ess",
+    type=float,
+    default=0.01,
+    help="Fraction of the proposals under which the effective sample size is flagged (default: 0.01)",
+)
 
 
 parser_hybrid.add_argument("--type", type=str, default="hybrid", help=argparse.SUPPRESS)
@@ -111,6 +288,31 @@ parser_hybrid.add_argument(
 parser_hybrid.add_argument(
     "--save-every", type=int, help="Number of steps to save", default=1
 )
+parser_hybrid.add_argument(
+    "--energy-backend",
+    type=str,
+    default="auto",
+    choices=["auto", "numba", "sparse", "stencil"],
+    help="Backend scoring the proposals, auto picks the stencil on regular lattices (default: auto)",
+)
+parser_hybrid.add_argument(
+    "--cache-size",
+    type=int,
+    default=0,
+    help="Number of distinct proposals whose energy is cached, 0 to disable the cache (default: 0)",
+)
+parser_hybrid.add_argument(
+    "--stream",
+    dest="stream",
+    action="store_true",
+    help="Generate the proposals in batches while the chain consumes them, instead of all at once",
+)
+parser_hybrid.add_argument(
+    "--queue-size",
+    type=int,
+    default=2,
+    help="Maximum number of streamed batches waiting in memory (default: 2)",
+)
 
 
 parser_gibbs.add_argument("--type", type=str, default="gibbs", help=argparse.SUPPRESS)
@@ -129,9 +331,6 @@ parser_exchange_rbm.add_argument(
 )
 
 
-MAX_CPUS = 32
-
-
 def main(args: argparse.ArgumentParser):
     print(args)
     disable_bar = False
@@ -141,27 +340,128 @@ def main(args: argparse.ArgumentParser):
     if args.type == "single":
         if len(args.seed_startpoint) > 1:
             disable_bar = True
-        pool = Pool(MAX_CPUS)
+        use_replicas = (
+            args.replicas > 1 or args.update != "random" or args.houdayer_every > 0
+        )
+        jobs = {}
         for seed in args.seed_startpoint:
             for beta in args.beta:
-                pool.apply_async(
-                    single_spin_flip,
-                    args=(
+                if use_replicas:
+                    jobs[(seed, beta)] = (
                         args.spins,
                         beta,
                         args.steps,
                         args.couplings_path,
+                        args.replicas,
                         args.sweeps,
                         args.burnt,
                         seed,
+                        args.update,
+                        args.houdayer_every,
                         args.verbose,
                         disable_bar,
                         args.save,
                         args.save_dir,
-                    ),
+                        args.reorder,
+                        args.precision,
+                    )
+                else:
+                    jobs[(seed, beta)] = (
+                        args.spins,
+                        beta,
+                        args.steps,
+                        args.couplings_path,
+                        args.sweeps,
+                        args.burnt,
+                        seed,
+                        args.verbose,
+                        disable_bar,
+                        args.save,
+                        args.save_dir,
+                        args.reorder,
+                        args.precision,
+                    )
+        run_grid(
+            replica_spin_flip if use_replicas else single_spin_flip,
+            jobs,
+            args.spins,
+            args.couplings_path,
+            processes=args.processes,
+        )
+
+    elif args.type == "nfold":
+        if len(args.seed_startpoint) > 1:
+            disable_bar = True
+        jobs = {}
+        for seed in args.seed_startpoint:
+            for beta in args.beta:
+                jobs[(seed, beta)] = (
+                    args.spins,
+                    beta,
+                    args.steps,
+                    args.couplings_path,
+                    args.sweeps,
+                    args.burnt,
+                    seed,
+                    args.verbose,
+                    disable_bar,
+                    args.save,
+                    args.save_dir,
+                    args.reorder,
+                    args.precision,
                 )
-        pool.close()
-        pool.join()
+        run_grid(
+            nfold_way, jobs, args.spins, args.couplings_path, processes=args.processes
+        )
+
+    elif args.type == "pt":
+        # a single process runs all the temperatures
+        disable_bar = len(args.seed_startpoint) > 1
+        jobs = {}
+        for seed in args.seed_startpoint:
+            jobs[seed] = (
+                args.spins,
+                args.beta,
+                args.steps,
+                args.couplings_path,
+                args.replicas,
+                args.sweeps,
+                args.burnt,
+                args.swap_every,
+                args.adapt_betas,
+                args.houdayer_every,
+                seed,
+                args.verbose,
+                disable_bar,
+                args.save,
+                args.save_dir,
+                args.reorder,
+                args.precision,
+            )
+        run_grid(
+            parallel_tempering,
+            jobs,
+            args.spins,
+            args.couplings_path,
+            processes=args.processes,
+        )
+
+    elif args.type == "neural" and args.pool != "none":
+        neural_mcmc_betas(
+            args.beta,
+            args.steps,
+            args.path,
+            args.couplings_path,
+            args.model,
+            args.batch_size,
+            args.verbose,
+            args.save,
+            args.save_every,
+            disable_bar,
+            energy_backend=args.energy_backend,
+            cache_size=args.cache_size,
+            parallel=args.pool == "parallel",
+        )
 
     elif args.type == "neural":
         for beta in args.beta:
@@ -176,8 +476,29 @@ def main(args: argparse.ArgumentParser):
                 args.save,
                 args.save_every,
                 disable_bar,
+                energy_backend=args.energy_backend,
+                cache_size=args.cache_size,
+                stream=args.stream,
+                queue_size=args.queue_size,
+                tries=args.tries,
             )
 
+    elif args.type == "importance":
+        # --steps is the number of proposals
+        importance_sampling(
+            args.beta,
+            args.steps,
+            args.path,
+            args.couplings_path,
+            args.model,
+            args.batch_size,
+            args.verbose,
+            args.save,
+            energy_backend=args.energy_backend,
+            cache_size=args.cache_size,
+            min_ess_ratio=args.min_ess,
+        )
+
     elif args.type == "hybrid":
         if args.len_seq_single is not None:
             for beta in args.beta:
@@ -194,6 +515,10 @@ def main(args: argparse.ArgumentParser):
                     args.save,
                     args.save_every,
                     disable_bar,
+                    energy_backend=args.energy_backend,
+                    cache_size=args.cache_size,
+                    stream=args.stream,
+                    queue_size=args.queue_size,
                 )
         else:
             for beta in args.beta:
@@ -210,6 +535,10 @@ def main(args: argparse.ArgumentParser):
                     args.save,
                     args.save_every,
                     disable_bar,
+                    energy_backend=args.energy_backend,
+                    cache_size=args.cache_size,
+                    stream=args.stream,
+                    queue_size=args.queue_size,
                 )
     elif args.type == "gibbs":
         for beta in args.beta:
@@ -239,4 +568,10 @@ def main(args: argparse.ArgumentParser):
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    if args.type == "neural" and args.pool != "none":
+        # the pooled chains are plain independent Metropolis on all the proposals at once
+        if args.tries != 1:
+            parser_neural.error("--tries is not supported with --pool")
+        if args.stream:
+            parser_neural.error("--stream is not supported with --pool")
     main(args)
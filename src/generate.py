@@ -1,6 +1,8 @@
+from typing import Dict, Iterator, Tuple
+
 import numpy as np
 import torch
-from pytorch_lightning import Trainer
+from pytorch_lightning import LightningModule, Trainer
 from torch.utils.data import DataLoader
 
 from src.datamodules.ising_datamodule import worker_init_fn
@@ -9,6 +11,68 @@ from src.models.pixel_cnn import PixelCNN
 from src.models.rbm import RBM
 
 
+def load_model(
+    ckpt_path: str, model: str, k_steps: int = 1
+) -> Tuple[LightningModule, Tuple[int, ...]]:
+    """Load a trained model from its checkpoint.
+
+    Args:
+        ckpt_path (str): Path to the checkpoint.
+        model (str): Name of the model, 'pixel', 'made' or 'rbm'.
+        k_steps (int, optional): Gibbs steps of the RBM. Defaults to 1.
+
+    Returns:
+        Tuple[LightningModule, Tuple[int, ...]]: Model and shape of one of its inputs.
+    """
+    if model == "pixel":
+        model = PixelCNN.load_from_checkpoint(ckpt_path)
+        shape = (1, model.hparams.input_size, model.hparams.input_size)
+    elif model == "made":
+        model = Made.load_from_checkpoint(ckpt_path)
+        shape = (model.hparams.input_size,)
+    else:
+        model = RBM.load_from_checkpoint(ckpt_path)
+        model.hparams["k"] = k_steps
+        shape = (model.hparams.input_size,)
+    return model, shape
+
+
+def generate_batches(
+    ckpt_path: str,
+    model: str,
+    num_sample: int,
+    k_steps: int = 1,
+    batch_size: int = 20000,
+    verbose: bool = False,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Generate samples one batch at a time, without keeping them all in memory.
+
+    Args:
+        ckpt_path (str): Path to the checkpoint.
+        model (str): Name of the model, 'pixel', 'made' or 'rbm'.
+        num_sample (int): Number of samples.
+        k_steps (int, optional): Gibbs steps of the RBM. Defaults to 1.
+        batch_size (int, optional): Size of each batch. Defaults to 20000.
+        verbose (bool, optional): Set verbose prints. Defaults to False.
+
+    Yields:
+        Iterator[Dict[str, np.ndarray]]: Samples and their log probability.
+    """
+    model, shape = load_model(ckpt_path, model, k_steps)
+    if verbose:
+        # print configs from trained model
+        print(model.hparams)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = model.to(device).eval()
+    for batch_idx, start in enumerate(range(0, num_sample, batch_size)):
+        size = min(batch_size, num_sample - start)
+        with torch.no_grad():
+            batch = model.predict_step(
+                torch.rand((size,) + shape, device=device), batch_idx
+            )
+        yield batch
+
+
 def generate(
     ckpt_path: str,
     model: str,
@@ -20,16 +84,8 @@ def generate(
     verbose: bool = False,
 ) -> np.ndarray:
     # choose the model and load all the argumets
-    if model == "pixel":
-        model = PixelCNN.load_from_checkpoint(ckpt_path)
-        shape = (num_sample, 1, model.hparams.input_size, model.hparams.input_size)
-    elif model == "made":
-        model = Made.load_from_checkpoint(ckpt_path)
-        shape = (num_sample, model.hparams.input_size)
-    else:
-        model = RBM.load_from_checkpoint(ckpt_path)
-        model.hparams["k"] = k_steps
-        shape = (num_sample, model.hparams.input_size)
+    model, shape = load_model(ckpt_path, model, k_steps)
+    shape = (num_sample,) + shape
 
     if verbose:
         # print configs from trained model
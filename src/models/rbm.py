@@ -30,7 +30,12 @@ class RBM(LightningModule):
         # loss function
         self.criterion = self._free_energy_loss
         # real energy
-        self.mean_energy_mae = MeanMAE()
+        self.mean_energy_mae = MeanMAE(
+            spins=self.hparams["input_size"],
+            couplings_path=self.hparams.get(
+                "couplings_path", "data/couplings/100spins_open-1nn.txt"
+            ),
+        )
 
     def _free_energy_loss(self, x: Tensor, x_gibbs: Tensor) -> Tensor:
         return self._free_energy(x) - self._free_energy(x_gibbs)
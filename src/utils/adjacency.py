@@ -3,6 +3,50 @@ from typing import Dict, List, Optional, Tuple, Union
 import numpy as np
 from scipy import sparse
 
+# bonds added by each connectivity level of the 2D lattice, as (row, column) offsets
+# towards the coupled spin, in the order their couplings are drawn
+OFFSETS_2D = {
+    1: [(0, 1), (1, 0)],
+    2: [(-1, 1), (1, 1)],
+    3: [(0, 2), (2, 0)],
+    4: [(-2, 1), (-1, 2), (1, 2), (2, 1)],
+    5: [(0, 3), (3, 0)],
+    6: [(-2, 2), (2, 2)],
+    7: [(-3, 1), (-1, 3), (1, 3), (3, 1)],
+}
+
+
+def lattice_offsets(level: int, dimensions: int) -> List[Tuple[int, ...]]:
+    """Offsets of the bonds added by a connectivity level. In 2D they follow OFFSETS_2D,
+    otherwise level k adds the k-th shell of neighbours by distance, one offset
+    for each pair of opposite directions.
+
+    Args:
+        level (int): Connectivity level, starting from 1 for nearest neighbours.
+        dimensions (int): Dimensions of the lattice.
+
+    Returns:
+        List[Tuple[int, ...]]: Offsets in the order their couplings are drawn.
+    """
+    if dimensions == 2:
+        if level not in OFFSETS_2D:
+            raise ValueError(f"Connectivity level {level} not implemented in 2D")
+        return OFFSETS_2D[level]
+    reach = int(np.ceil(np.sqrt(level))) + 1
+    grid = np.stack(
+        np.meshgrid(*[np.arange(-reach, reach + 1)] * dimensions, indexing="ij"), -1
+    ).reshape(-1, dimensions)
+    # keep one of each pair of opposite offsets, the one whose last nonzero entry is positive
+    last = grid[np.arange(grid.shape[0]), (grid != 0).cumsum(1).argmax(1)]
+    grid = grid[last > 0]
+    distances = (grid ** 2).sum(1)
+    shells = np.unique(distances)
+    if level > shells.shape[0]:
+        raise ValueError(f"Connectivity level {level} not implemented")
+    return [
+        tuple(int(o) for o in offset) for offset in grid[distances == shells[level - 1]]
+    ]
+
 
 class Adjacency:
     def __init__(
@@ -22,15 +66,25 @@ class Adjacency:
         self.Connectivity: Optional[Union[int, List[int]]] = None
         self.MaxNeighbours: Optional[int] = None
         self.AdjaMatrix: Optional[np.ndarray] = None
+        # (indptr, indices, couplings) of each spin's neighbours
+        self.CSR: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        # (i, j, coupling) arrays of the generated bonds
+        self.Edges: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
 
-    def create_adjacency(self, connectivity: Union[int, List[int]], seed: int = 12345):
-        assert connectivity <= 7, "Not implemented for connectivity greater than 7"
-        assert self.Dimensions == 2, "Random adjacency only implemented for dim=2"
+    def create_adjacency(
+        self,
+        connectivity: Union[int, List[int]],
+        seed: int = 12345,
+        periodic: bool = False,
+    ):
         self.Connectivity = connectivity
-        self._create_adjacency(connectivity, seed=seed)
+        self._create_adjacency(connectivity, seed=seed, periodic=periodic)
         self._create_neighbours()
 
     def get_adjadict(self) -> Dict[tuple, int]:
+        if not self.AdjaDict and self.Edges is not None:
+            i_vec, j_vec, couplings = self.Edges
+            self.AdjaDict = dict(zip(zip(i_vec.tolist(), j_vec.tolist()), couplings))
         return self.AdjaDict
 
     def get_neighbours(self) -> Tuple[np.ndarray, np.ndarray]:
@@ -38,6 +92,11 @@ class Adjacency:
             self._create_neighbours()
         return self.NeighboursCouplings[..., 0], self.NeighboursCouplings[..., 1]
 
+    def get_csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.CSR is None:
+            self._create_csr()
+        return self.CSR
+
     def get_adjamatrix(self) -> np.ndarray:
         if self.AdjaMatrix is None:
             self._create_adjamatrix()
@@ -48,16 +107,17 @@ class Adjacency:
             self._create_adjamatrix()
         return self.AdjaMatrix
 
-    def savetxt(self) -> None:
-        assert bool(
-            self.AdjaDict
+    def savetxt(self, txt_path: Optional[str] = None) -> None:
+        i_vec, j_vec, couplings = self._edges()
+        assert (
+            i_vec.shape[0] > 0
         ), "The connectivity dictionary is empty, instantiate first."
-        txtarr = []
-        for (i, j), coupling in self.AdjaDict.items():
-            # see http://mcsparse.uni-bonn.de/spinglass/ for the format style
-            # see loadtxt as well
-            txtarr.append([i + 1, j + 1, coupling])
-        np.savetxt(f"couplings-{self.SpinSide}spins", txtarr)
+        # see http://mcsparse.uni-bonn.de/spinglass/ for the format style
+        # see loadtxt as well
+        txtarr = np.stack([i_vec + 1, j_vec + 1, couplings], axis=1)
+        if txt_path is None:
+            txt_path = f"couplings-{self.SpinSide}spins"
+        np.savetxt(txt_path, txtarr)
 
     def loadtxt(self, txt_path: str) -> None:
         txt_file = np.loadtxt(txt_path)
@@ -66,169 +126,95 @@ class Adjacency:
         # for 3D lattice the elements are numbered sequentially
         # layer by layer starting with index 1
         # and so on
-        adjadict = {}
-        for i in range(txt_file.shape[0]):
-            adjadict.update(
-                {(int(txt_file[i, 0] - 1), int(txt_file[i, 1] - 1)): txt_file[i, 2]}
-            )
-        self.AdjaDict = adjadict
+        txt_file = np.reshape(txt_file, (-1, 3))
+        i_vec = txt_file[:, 0].astype(int) - 1
+        j_vec = txt_file[:, 1].astype(int) - 1
+        self.AdjaDict = dict(zip(zip(i_vec.tolist(), j_vec.tolist()), txt_file[:, 2]))
+
+    def _edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Edge list in the insertion order of the adjacency dictionary."""
+        if not self.AdjaDict and self.Edges is not None:
+            return self.Edges
+        if not self.AdjaDict:
+            return np.empty(0, int), np.empty(0, int), np.empty(0)
+        pairs = np.fromiter(
+            (k for pair in self.AdjaDict.keys() for k in pair),
+            dtype=int,
+            count=2 * len(self.AdjaDict),
+        ).reshape(-1, 2)
+        couplings = np.fromiter(self.AdjaDict.values(), dtype=float)
+        return pairs[:, 0], pairs[:, 1], couplings
+
+    def _create_csr(self) -> None:
+        spins = self.SpinSide ** self.Dimensions
+        i_vec, j_vec, couplings = self._edges()
+        # a null coupling is not a bond
+        bonds = couplings != 0
+        i_vec, j_vec, couplings = i_vec[bonds], j_vec[bonds], couplings[bonds]
+        # each bond appears in the rows of both its spins, in the order of the edge list
+        rows = np.stack([i_vec, j_vec], axis=1).ravel()
+        cols = np.stack([j_vec, i_vec], axis=1).ravel()
+        data = np.repeat(couplings, 2)
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(spins + 1, dtype=int)
+        np.cumsum(np.bincount(rows, minlength=spins), out=indptr[1:])
+        self.CSR = (indptr, cols[order], data[order])
 
     def _create_neighbours(self) -> None:
-        if self.MaxNeighbours is None:
-            self.MaxNeighbours = self.SpinSide ** 2
-        self.NeighboursCouplings = np.zeros((self.SpinSide ** 2, self.MaxNeighbours, 2))
-        for spins, coupling in self.AdjaDict.items():
-            num_nghb = np.where(self.NeighboursCouplings[spins[0], :, 1] == 0)[0]
-            self.NeighboursCouplings[spins[0], num_nghb[0]] = spins[1], coupling
-            num_nghb = np.where(self.NeighboursCouplings[spins[1], :, 1] == 0)[0]
-            self.NeighboursCouplings[spins[1], num_nghb[0]] = spins[0], coupling
-        mask = np.where((self.NeighboursCouplings == 0).all(0).all(1))
-        # the max number of neighbours is alway the minimum of zeros
-        # elements in the matrix
-        self.MaxNeighbours = mask[0]
-        self.NeighboursCouplings = np.delete(self.NeighboursCouplings, mask, axis=1)
+        if self.CSR is None:
+            self._create_csr()
+        indptr, indices, data = self.CSR
+        spins = indptr.shape[0] - 1
+        len_neighbours = np.diff(indptr)
+        self.MaxNeighbours = int(len_neighbours.max(initial=0))
+        # padded layout, missing neighbours have null index and coupling
+        self.NeighboursCouplings = np.zeros((spins, self.MaxNeighbours, 2))
+        rows = np.repeat(np.arange(spins), len_neighbours)
+        slots = np.arange(indices.shape[0]) - indptr[rows]
+        self.NeighboursCouplings[rows, slots, 0] = indices
+        self.NeighboursCouplings[rows, slots, 1] = data
 
     def _create_adjacency(
-        self, connectivity: Union[int, List[int]], seed: int = 12345
+        self,
+        connectivity: Union[int, List[int]],
+        seed: int = 12345,
+        periodic: bool = False,
     ) -> None:
         if isinstance(connectivity, int):
             connectivity = np.arange(connectivity) + 1
-        # get the number of neighbours
-        neighbs = np.zeros(connectivity[-1], dtype=int)
-        neighbs[connectivity - 1] = 4
-        # if connectivity is 4 or 7 we have 4 more neighbours
-        neighbs[np.logical_and(connectivity % 3 == 0, connectivity != 0)] *= 2
-        self.MaxNeighbours = neighbs.sum()
-        # set a seed to sample couplings
+        offsets = [
+            offset
+            for level in connectivity
+            for offset in lattice_offsets(level, self.Dimensions)
+        ]
+        if periodic and 2 * np.abs(offsets).max() >= self.SpinSide:
+            raise ValueError("Lattice too small for periodic boundaries")
+
+        # coordinates of each site, numbered row-wise (layer by layer in 3D)
+        shape = (self.SpinSide,) * self.Dimensions
+        coords = np.stack(
+            np.unravel_index(np.arange(self.SpinSide ** self.Dimensions), shape), axis=1
+        )
+        # coordinates of the coupled spin of each (site, offset)
+        targets = coords[:, None, :] + np.asarray(offsets)[None, :, :]
+        if periodic:
+            targets %= self.SpinSide
+            valid = np.ones(targets.shape[:2], dtype=bool)
+        else:
+            valid = ((targets >= 0) & (targets < self.SpinSide)).all(-1)
+        i_vec = np.broadcast_to(np.arange(coords.shape[0])[:, None], valid.shape)[valid]
+        j_vec = np.ravel_multi_index(tuple(targets[valid].T), shape)
+        # set a seed to sample couplings, drawn site by site in the order of the offsets
         np.random.seed(seed)
-        for i in range(self.SpinSide):
-            for j in range(self.SpinSide):
-                spin_num = j + i * self.SpinSide
-                # fill Adjacency dictionary
-                self._create_couplings(np.asarray([i, j]), spin_num, connectivity, seed)
-
-    def _create_couplings(
-        self,
-        idxs: np.ndarray,
-        spin_num: int,
-        connectivity: Union[int, List[int]],
-        seed: int,
-    ) -> None:
-        for connect in connectivity:
-            if connect == 1:
-                # right spin coupling
-                if idxs[1] + 1 < self.SpinSide:
-                    self.AdjaDict.update({(spin_num, spin_num + 1): np.random.normal()})
-                # down spin coupling
-                if idxs[0] + 1 < self.SpinSide:
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num + self.SpinSide): np.random.normal()}
-                    )
-            if connect == 2:
-                # up-right spin coupling
-                if (idxs[0] - 1 > -1) and (idxs[1] + 1 < self.SpinSide):
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num - self.SpinSide + 1): np.random.normal()}
-                    )
-                if (idxs + [1, 1] < [self.SpinSide, self.SpinSide]).all():
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num + self.SpinSide + 1): np.random.normal()}
-                    )
-            if connect == 3:
-                # 2-right spin coupling
-                if idxs[1] + 2 < self.SpinSide:
-                    self.AdjaDict.update({(spin_num, spin_num + 2): np.random.normal()})
-                # 2-down spin coupling
-                if idxs[0] + 2 < self.SpinSide:
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num + 2 * self.SpinSide): np.random.normal()}
-                    )
-            if connect == 4:
-                if (idxs[0] - 2 > -1) and (idxs[1] + 1 < self.SpinSide):
-                    self.AdjaDict.update(
-                        {
-                            (
-                                spin_num,
-                                spin_num - 2 * self.SpinSide + 1,
-                            ): np.random.normal()
-                        }
-                    )
-                if (idxs[0] - 1 > -1) and (idxs[1] + 2 < self.SpinSide):
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num - self.SpinSide + 2): np.random.normal()}
-                    )
-                if (idxs + [1, 2] < [self.SpinSide, self.SpinSide]).all():
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num + self.SpinSide + 2): np.random.normal()}
-                    )
-                if (idxs + [2, 1] < [self.SpinSide, self.SpinSide]).all():
-                    self.AdjaDict.update(
-                        {
-                            (
-                                spin_num,
-                                spin_num + 2 * self.SpinSide + 1,
-                            ): np.random.normal()
-                        }
-                    )
-            if connect == 5:
-                if idxs[1] + 3 < self.SpinSide:
-                    self.AdjaDict.update({(spin_num, spin_num + 3): np.random.normal()})
-                if idxs[0] + 3 < self.SpinSide:
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num + 3 * self.SpinSide): np.random.normal()}
-                    )
-            if connect == 6:
-                if (idxs[0] - 2 > -1) and (idxs[1] + 2 < self.SpinSide):
-                    self.AdjaDict.update(
-                        {
-                            (
-                                spin_num,
-                                spin_num - 2 * self.SpinSide + 2,
-                            ): np.random.normal()
-                        }
-                    )
-                if (idxs + [2, 2] < [self.SpinSide, self.SpinSide]).all():
-                    self.AdjaDict.update(
-                        {
-                            (
-                                spin_num,
-                                spin_num + 2 * self.SpinSide + 2,
-                            ): np.random.normal()
-                        }
-                    )
-            if connect == 7:
-                if (idxs[0] - 3 > -1) and (idxs[1] - 3 < self.SpinSide):
-                    self.AdjaDict.update(
-                        {
-                            (
-                                spin_num,
-                                spin_num - 3 * self.SpinSide + 1,
-                            ): np.random.normal()
-                        }
-                    )
-                if (idxs[0] - 1 > -1) and (idxs[1] + 3 < self.SpinSide):
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num - self.SpinSide + 3): np.random.normal()}
-                    )
-                if (idxs + [1, 3] < [self.SpinSide, self.SpinSide]).all():
-                    self.AdjaDict.update(
-                        {(spin_num, spin_num + self.SpinSide + 3): np.random.normal()}
-                    )
-                if (idxs + [3, 1] < [self.SpinSide, self.SpinSide]).all():
-                    self.AdjaDict.update(
-                        {
-                            (
-                                spin_num,
-                                spin_num + 3 * self.SpinSide + 1,
-                            ): np.random.normal()
-                        }
-                    )
+        couplings = np.random.normal(size=i_vec.shape[0])
+        self.Edges = (i_vec, j_vec, couplings)
+        self.AdjaDict = {}
 
     def _create_adjamatrix(self) -> None:
-        i_vec, j_vec = [], []
-        couplings = []
-        for (i, j), coupling in self.AdjaDict.items():
-            i_vec.extend([i, j])
-            j_vec.extend([j, i])
-            couplings.extend([coupling, coupling])
-        self.AdjaMatrix = sparse.coo_matrix((couplings, (i_vec, j_vec)))
+        if self.CSR is None:
+            self._create_csr()
+        spins = self.SpinSide ** self.Dimensions
+        indptr, indices, couplings = self.CSR
+        self.AdjaMatrix = sparse.csr_matrix(
+            (couplings, indices, indptr), shape=(spins, spins)
+        ).tocoo()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+
+def available_memory() -> int:
+    """Physical memory currently available, in bytes.
+
+    Returns:
+        int: Available memory, 4GB if it cannot be queried.
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 4 * 1024**3
+
+
+class SampleBuffer:
+    """Preallocated storage for the samples and energies saved along a Markov chain.
+    Samples are stored as int8 and energies as float64, sized from the number of
+    saved steps. If the samples do not fit in max_memory bytes they are backed by
+    a memory-mapped file in spill_dir, so the chain is streamed to disk chunk by chunk.
+
+    Args:
+        size (int): Maximum number of saved steps.
+        sample_shape (Union[int, Tuple[int, ...]]): Shape of a saved sample, e.g. the number of spins.
+        eng_shape (Tuple[int, ...], optional): Shape of a saved energy. Defaults to ().
+        max_memory (Optional[int], optional): Memory budget in bytes for the samples. Defaults to half of the available memory.
+        spill_dir (Optional[str], optional): Directory of the memory-mapped file. Defaults to the system temporary directory.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        sample_shape: Union[int, Tuple[int, ...]],
+        eng_shape: Tuple[int, ...] = (),
+        max_memory: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+    ):
+        if isinstance(sample_shape, int):
+            sample_shape = (sample_shape,)
+        shape = (max(size, 0),) + tuple(sample_shape)
+        if max_memory is None:
+            max_memory = available_memory() // 2
+
+        self.spilled = int(np.prod(shape)) > max_memory
+        if self.spilled:
+            fd, path = tempfile.mkstemp(suffix=".npy", dir=spill_dir)
+            os.close(fd)
+            self._samples = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.int8, shape=shape
+            )
+            # the mapping keeps the data alive, the disk space is
+            # released as soon as the buffer is garbage collected
+            os.remove(path)
+            print(
+                f"Samples do not fit in memory, streaming them to {os.path.dirname(path)}"
+            )
+        else:
+            self._samples = np.empty(shape, dtype=np.int8)
+        self._energies = np.empty((shape[0],) + tuple(eng_shape), dtype=np.double)
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, sample: np.ndarray, energy: Union[float, np.ndarray]) -> None:
+        """Store a sample and its energy in the next free slot.
+
+        Args:
+            sample (np.ndarray): Sample in {-1,+1}.
+            energy (Union[float, np.ndarray]): Energy of the sample.
+        """
+        self._samples[self._len] = sample
+        self._energies[self._len] = energy
+        self._len += 1
+
+    def extend(self, samples: np.ndarray, energies: np.ndarray) -> None:
+        """Store a batch of samples and their energies in the next free slots.
+
+        Args:
+            samples (np.ndarray): Samples in {-1,+1}, on the first axis.
+            energies (np.ndarray): Energies of the samples.
+        """
+        size = len(energies)
+        self._samples[self._len : self._len + size] = samples
+        self._energies[self._len : self._len + size] = energies
+        self._len += size
+
+    @property
+    def samples(self) -> np.ndarray:
+        return self._samples[: self._len]
+
+    @property
+    def energies(self) -> np.ndarray:
+        return self._energies[: self._len]
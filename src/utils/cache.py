@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+
+def pack_rows(samples: np.ndarray) -> np.ndarray:
+    """Configurations packed one bit per spin, each row viewed as a single opaque
+    value, so that whole configurations are compared, sorted and hashed at once.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1}, one per row once flattened.
+
+    Returns:
+        np.ndarray: Packed configurations of shape (n,).
+    """
+    samples = np.reshape(samples, (samples.shape[0], -1))
+    packed = np.ascontiguousarray(np.packbits(samples > 0, axis=1))
+    return packed.view(np.dtype((np.void, packed.shape[1]))).reshape(-1)
+
+
+class ProposalCache:
+    """Least recently used cache of the energy of the proposed configurations.
+    At low temperature autoregressive models propose the same configurations many
+    times, which are then scored once, also across batches and driver calls sharing
+    the cache, see get_proposal_cache.
+
+    Args:
+        max_size (int): Maximum number of configurations kept.
+
+    Raises:
+        ValueError: Non positive size.
+    """
+
+    def __init__(self, max_size: int):
+        if max_size < 1:
+            raise ValueError(f"Cache size must be positive, got {max_size}")
+        self.max_size = max_size
+        self.entries: "OrderedDict[bytes, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def get(self, key: bytes) -> Optional[float]:
+        """Energy of a configuration, marked as recently used.
+
+        Args:
+            key (bytes): Packed configuration, see pack_rows.
+
+        Returns:
+            Optional[float]: Energy, None if not cached.
+        """
+        eng = self.entries.get(key)
+        if eng is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return eng
+
+    def put(self, key: bytes, eng: float) -> None:
+        """Store a configuration, evicting the least recently used one if full.
+
+        Args:
+            key (bytes): Packed configuration, see pack_rows.
+            eng (float): Energy of the configuration.
+        """
+        self.entries[key] = eng
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def energies(
+        self, samples: np.ndarray, score: Callable[[np.ndarray], np.ndarray]
+    ) -> np.ndarray:
+        """Energies of a batch of configurations. The batch is deduplicated with np.unique,
+        the distinct configurations are looked up and the missing ones are scored in
+        a single call and cached.
+
+        Args:
+            samples (np.ndarray): Spin configurations in {-1,+1}, one per row once flattened.
+            score (Callable[[np.ndarray], np.ndarray]): Energies of a batch of configurations, e.g. batch_energies.
+
+        Returns:
+            np.ndarray: Energies of shape (n,).
+        """
+        samples = np.reshape(samples, (samples.shape[0], -1))
+        unique, first, inverse = np.unique(
+            pack_rows(samples), return_index=True, return_inverse=True
+        )
+        # repetitions inside the batch are scored once with their first occurrence
+        self.hits += samples.shape[0] - unique.shape[0]
+        keys = [key.tobytes() for key in unique]
+        engs = np.empty(unique.shape[0])
+        missing = []
+        for u, key in enumerate(keys):
+            eng = self.get(key)
+            if eng is None:
+                missing.append(u)
+            else:
+                engs[u] = eng
+        if missing:
+            missing = np.asarray(missing, dtype=np.int64)
+            engs[missing] = score(samples[first[missing]])
+            for u in missing:
+                self.put(keys[u], engs[u])
+        return engs[inverse.reshape(-1)]
+
+    def summary(self) -> str:
+        """Hit rate and occupancy, for the run summaries."""
+        return f"Proposal cache: hit rate {self.hit_rate * 100:2.2f}% ({self.hits} on {self.hits + self.misses})  size={len(self)}/{self.max_size}"
@@ -0,0 +1,171 @@
+from typing import Union
+
+import numpy as np
+
+from src.utils.utils import (
+    compute_local_fields,
+    flip_spin,
+    houdayer_sweep,
+    replica_spin_flip_sweep,
+)
+
+# sweeps between two recomputations of single precision local fields,
+# which accumulate rounding errors at every accepted flip
+REFRESH_SWEEPS = 100
+
+
+class ChainState:
+    """State of a batch of single spin flip chains with cached local fields.
+    The local field h_i = sum_j J_ij s_j of every spin is kept up to date, so the energy
+    change of a flip is a single multiply, -2 s_i h_i, and only the fields of the
+    neighbours of a flipped spin are updated, on acceptance.
+    Kernels flipping the spins without the fields, e.g. colour_sweep, must call
+    mark_stale, the fields are then recomputed the next time they are read.
+    Single precision fields are recomputed every REFRESH_SWEEPS sweeps as well.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1}, of shape (spins,) or (replicas, spins), stored as int8.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours, the local fields take their floating point type.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+    """
+
+    def __init__(
+        self,
+        samples: np.ndarray,
+        neighbours: np.ndarray,
+        couplings: np.ndarray,
+        len_neighbours: np.ndarray,
+    ):
+        self.samples = np.array(samples, dtype=np.int8, ndmin=2)
+        self.neighbours = neighbours
+        self.couplings = couplings
+        self.len_neighbours = len_neighbours
+        self._fields = np.empty(self.samples.shape, dtype=couplings.dtype)
+        self.engs = np.empty(self.samples.shape[0])
+        # flip attempts between two refreshes, double precision fields do not drift
+        self.refresh_every = 0
+        if self._fields.dtype == np.float32:
+            self.refresh_every = REFRESH_SWEEPS * self.samples.shape[1]
+        self.refresh()
+
+    @property
+    def replicas(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def fields(self) -> np.ndarray:
+        """Local fields of every spin, recomputed first if stale."""
+        if self.stale:
+            self.refresh()
+        return self._fields
+
+    def mark_stale(self) -> None:
+        """Flag the local fields as out of date, after the spins were flipped outside the chain."""
+        self.stale = True
+
+    def refresh(self) -> None:
+        """Recompute local fields and energies from scratch, in place."""
+        for r in range(self.replicas):
+            self._fields[r] = compute_local_fields(
+                self.samples[r], self.neighbours, self.couplings, self.len_neighbours
+            )
+        self.engs[:] = 0.5 * np.sum(self.samples * self._fields, -1, dtype=np.double)
+        self.stale = False
+        self._attempts = 0
+
+    def record(self, attempts: int) -> None:
+        """Count flip attempts made with the cached fields, marking them stale
+        once refresh_every attempts are reached.
+
+        Args:
+            attempts (int): Number of flip attempts of each replica.
+        """
+        if self.refresh_every > 0:
+            self._attempts += attempts
+            if self._attempts >= self.refresh_every:
+                self.stale = True
+
+    def delta_h(self, replica: int, num_spin: int) -> float:
+        """Energy change of flipping a single spin.
+
+        Args:
+            replica (int): Replica of the spin.
+            num_spin (int): Spin to flip.
+
+        Returns:
+            float: Energy change.
+        """
+        return -2.0 * self.samples[replica, num_spin] * self.fields[replica, num_spin]
+
+    def delta_energies(self) -> np.ndarray:
+        """Energy changes of all the single spin flips.
+
+        Returns:
+            np.ndarray: Energy changes, same shape of samples.
+        """
+        return -2.0 * self.samples * self.fields
+
+    def flip(self, replica: int, num_spin: int) -> None:
+        """Flip a spin, updating energy and local fields.
+
+        Args:
+            replica (int): Replica of the spin.
+            num_spin (int): Spin to flip.
+        """
+        deltah = self.delta_h(replica, num_spin)
+        self.engs[replica] += deltah
+        flip_spin(
+            num_spin,
+            self.samples[replica],
+            self.fields[replica],
+            self.neighbours[num_spin],
+            self.couplings[num_spin],
+            self.len_neighbours[num_spin],
+        )
+        self.record(1)
+
+    def sweep(self, betas: Union[float, np.ndarray], num_flips: int) -> np.ndarray:
+        """Metropolis single spin flip attempts on every replica.
+
+        Args:
+            betas (Union[float, np.ndarray]): Inverse temperature, shared or of each replica.
+            num_flips (int): Number of flip attempts for each replica.
+
+        Returns:
+            np.ndarray: Number of accepted flips of each replica.
+        """
+        betas = np.broadcast_to(np.asarray(betas, dtype=np.double), (self.replicas,))
+        accepted = replica_spin_flip_sweep(
+            self.samples,
+            self.fields,
+            self.engs,
+            np.ascontiguousarray(betas),
+            self.neighbours,
+            self.couplings,
+            self.len_neighbours,
+            num_flips,
+        )
+        self.record(num_flips)
+        return accepted
+
+    def cluster_move(self, replicas: int) -> int:
+        """Houdayer cluster moves between consecutive pairs of replicas.
+
+        Args:
+            replicas (int): Number of consecutive replicas sharing the same temperature.
+
+        Returns:
+            int: Total number of spins flipped in each replica of the pairs.
+        """
+        flipped = houdayer_sweep(
+            self.samples,
+            self.fields,
+            self.engs,
+            replicas,
+            self.neighbours,
+            self.couplings,
+            self.len_neighbours,
+        )
+        self.record(flipped)
+        return flipped
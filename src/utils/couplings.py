@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from src.utils.adjacency import Adjacency
+
+# arrays of the binary form, each saved as a .npy file in the cache directory
+FIELDS = (
+    "edges_i",
+    "edges_j",
+    "edges_coupling",
+    "indptr",
+    "indices",
+    "data",
+    "neighbours",
+    "couplings",
+    "len_neighbours",
+)
+# bump when the binary layout changes
+CACHE_VERSION = 2
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of the content of a file.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_dir(couplings_path: str, spin_side: int) -> str:
+    """Directory of the binary form, next to the text file."""
+    return f"{couplings_path}.cache/side{spin_side}"
+
+
+def compile_couplings(spin_side: int, couplings_path: str) -> Dict[str, np.ndarray]:
+    """Parse the text couplings into edge list, CSR and padded neighbours layouts.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the text couplings.
+
+    Returns:
+        Dict[str, np.ndarray]: Arrays of the binary form, see FIELDS.
+    """
+    adjacency = Adjacency(spin_side)
+    adjacency.loadtxt(couplings_path)
+    return adjacency_arrays(adjacency)
+
+
+def adjacency_arrays(adjacency: Adjacency) -> Dict[str, np.ndarray]:
+    """Edge list, CSR and padded neighbours layouts of an instance.
+
+    Args:
+        adjacency (Adjacency): Loaded or generated instance.
+
+    Returns:
+        Dict[str, np.ndarray]: Arrays of the binary form, see FIELDS.
+    """
+    edges_i, edges_j, edges_coupling = adjacency._edges()
+    indptr, indices, data = adjacency.get_csr()
+    neighbours, couplings = adjacency.get_neighbours()
+    return {
+        "edges_i": edges_i,
+        "edges_j": edges_j,
+        "edges_coupling": edges_coupling,
+        "indptr": indptr,
+        "indices": indices,
+        "data": data,
+        # 32 bit indices halve the memory traffic of the kernels
+        "neighbours": neighbours.astype(np.int32),
+        "couplings": np.ascontiguousarray(couplings),
+        "len_neighbours": np.sum(couplings != 0, axis=-1).astype(np.int32),
+    }
+
+
+def _read_meta(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _read_arrays(
+    directory: str, mmap_mode: Optional[str] = None
+) -> Optional[Dict[str, np.ndarray]]:
+    try:
+        return {
+            name: np.asarray(
+                np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            )
+            for name in FIELDS
+        }
+    except (OSError, ValueError, EOFError):
+        # missing or truncated file
+        return None
+
+
+def _write_cache(directory: str, arrays: Dict[str, np.ndarray], meta: dict) -> None:
+    os.makedirs(directory, exist_ok=True)
+    # write then rename, so concurrent readers never see a partial file
+    for name in FIELDS:
+        tmp = os.path.join(directory, f".{name}.{os.getpid()}.npy")
+        np.save(tmp, arrays[name])
+        os.replace(tmp, os.path.join(directory, f"{name}.npy"))
+    tmp = os.path.join(directory, f".meta.{os.getpid()}.json")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, "meta.json"))
+
+
+def load_couplings(
+    spin_side: int, couplings_path: str
+) -> Tuple[Dict[str, np.ndarray], str]:
+    """Load the binary form of the couplings, memory-mapped from the cache next to
+    the text file. The cache is rebuilt when the text file changes or one of its
+    files is missing or truncated, and the couplings are parsed in memory if the
+    cache cannot be written. The memory-mapped arrays are read-only.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the text couplings.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], str]: Arrays of the binary form and content hash of the text file.
+    """
+    stat = os.stat(couplings_path)
+    directory = cache_dir(couplings_path, spin_side)
+    meta = _read_meta(directory)
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    if meta.get("version") == CACHE_VERSION and meta.get("source") == source:
+        arrays = _read_arrays(directory, mmap_mode="r")
+        if arrays is not None:
+            return arrays, meta["hash"]
+        # damaged cache, compile it again
+        meta = {}
+
+    content_hash = file_hash(couplings_path)
+    arrays = None
+    if meta.get("version") == CACHE_VERSION and meta.get("hash") == content_hash:
+        # touched but not changed, keep the compiled arrays
+        arrays = _read_arrays(directory)
+    if arrays is None:
+        arrays = compile_couplings(spin_side, couplings_path)
+    meta = {"version": CACHE_VERSION, "hash": content_hash, "source": source}
+    try:
+        _write_cache(directory, arrays, meta)
+    except OSError as e:
+        print(f"Couplings cache not written in {directory}: {e}")
+        return arrays, content_hash
+
+    mapped = _read_arrays(directory, mmap_mode="r")
+    if mapped is None:
+        # removed meanwhile, keep the arrays in memory
+        return arrays, content_hash
+    return mapped, content_hash
+
+
+def save_binary(adjacency: Adjacency, directory: str) -> str:
+    """Write the binary form of an instance, e.g. a freshly generated one too large
+    to go through the text format.
+
+    Args:
+        adjacency (Adjacency): Loaded or generated instance.
+        directory (str): Directory of the .npy files.
+
+    Returns:
+        str: Content hash of the edge list.
+    """
+    arrays = adjacency_arrays(adjacency)
+    digest = hashlib.sha256()
+    for name in ("edges_i", "edges_j", "edges_coupling"):
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    content_hash = digest.hexdigest()
+    _write_cache(directory, arrays, {"version": CACHE_VERSION, "hash": content_hash})
+    return content_hash
+
+
+def load_binary(directory: str) -> Tuple[Dict[str, np.ndarray], str]:
+    """Memory-map the binary form written by save_binary.
+
+    Args:
+        directory (str): Directory of the .npy files.
+
+    Raises:
+        ValueError: The directory does not hold a binary form of this version.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], str]: Arrays of the binary form and content hash of the edge list.
+    """
+    meta = _read_meta(directory)
+    if meta.get("version") != CACHE_VERSION:
+        raise ValueError(f"No binary couplings of version {CACHE_VERSION} in {directory}")
+    arrays = {
+        name: np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        for name in FIELDS
+    }
+    return arrays, meta["hash"]
@@ -0,0 +1,112 @@
+from typing import Dict, Tuple
+
+import numpy as np
+from scipy.special import logsumexp
+
+
+def log_weights(
+    log_probs: np.ndarray, engs: np.ndarray, betas: np.ndarray
+) -> np.ndarray:
+    """Unnormalized log importance weights of independent proposals with respect to
+    the Boltzmann distribution, log w = -beta E - log q. Proposals with non finite
+    log probability or energy get a null weight.
+
+    Args:
+        log_probs (np.ndarray): Model log-probabilities of the proposals, of shape (n,).
+        engs (np.ndarray): Energies of the proposals, of shape (n,).
+        betas (np.ndarray): Inverse temperatures, of shape (betas,).
+
+    Returns:
+        np.ndarray: Log weights of shape (betas, n).
+    """
+    weights = -np.multiply.outer(betas, engs) - log_probs
+    weights[:, ~(np.isfinite(log_probs) & np.isfinite(engs))] = -np.inf
+    return weights
+
+
+def effective_sample_size(weights: np.ndarray) -> np.ndarray:
+    """Kish effective sample size (sum w)^2 / sum w^2, from the log weights.
+
+    Args:
+        weights (np.ndarray): Log weights of shape (betas, n).
+
+    Returns:
+        np.ndarray: Effective sample size of each beta.
+    """
+    return np.exp(2 * logsumexp(weights, axis=-1) - logsumexp(2 * weights, axis=-1))
+
+
+def reweight(
+    observables: np.ndarray, weights: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Self-normalized importance sampling estimate of observables, with the error
+    of the delta method, sqrt(sum w_i^2 (x_i - mean)^2) for normalized weights.
+
+    Args:
+        observables (np.ndarray): Observables of the proposals, of shape (n,) or (n, k).
+        weights (np.ndarray): Log weights of shape (betas, n).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Estimates and their errors, of shape (betas,) or (betas, k).
+    """
+    normalized = np.exp(weights - logsumexp(weights, axis=-1, keepdims=True))
+    values = observables.reshape(observables.shape[0], -1)
+    # weights with null probability times non finite observables do not count
+    values = np.where(np.isfinite(values), values, 0.0)
+    means = normalized @ values
+    errors = np.sqrt(
+        np.einsum("bn,bnk->bk", normalized**2, (values[None] - means[:, None]) ** 2)
+    )
+    shape = (weights.shape[0],) + observables.shape[1:]
+    return means.reshape(shape), errors.reshape(shape)
+
+
+def importance_estimates(
+    log_probs: np.ndarray,
+    engs: np.ndarray,
+    betas: np.ndarray,
+    spins: int,
+    max_elements: int = 1 << 24,
+) -> Dict[str, np.ndarray]:
+    """Energy, specific heat, free energy and effective sample size at many
+    temperatures from one set of independent proposals. Betas are processed in
+    blocks, so that at most max_elements weights are in memory.
+
+    Args:
+        log_probs (np.ndarray): Model log-probabilities of the proposals, of shape (n,).
+        engs (np.ndarray): Energies of the proposals, of shape (n,).
+        betas (np.ndarray): Inverse temperatures, of shape (betas,).
+        spins (int): Number of spins, the estimates are per spin.
+        max_elements (int, optional): Maximum number of weights held at once. Defaults to 2**24.
+
+    Returns:
+        Dict[str, np.ndarray]: For each beta: 'energy' and 'energy_err' per spin, 'heat' the specific heat
+            per spin, 'free_energy' per spin, 'ess' the effective sample size and 'ess_ratio' its fraction of the proposals.
+    """
+    betas = np.atleast_1d(np.asarray(betas, dtype=np.double))
+    num_sample = engs.shape[0]
+    eng_per_spin = engs / spins
+    observables = np.stack([eng_per_spin, eng_per_spin**2], axis=1)
+    block = max(max_elements // max(num_sample, 1), 1)
+
+    out = {
+        key: np.empty(betas.shape[0])
+        for key in ("energy", "energy_err", "heat", "free_energy", "ess")
+    }
+    for start in range(0, betas.shape[0], block):
+        batch = slice(start, start + block)
+        weights = log_weights(log_probs, engs, betas[batch])
+        means, errors = reweight(observables, weights)
+        out["energy"][batch] = means[:, 0]
+        out["energy_err"][batch] = errors[:, 0]
+        # fluctuations of the energy, C = beta^2 N (<e^2> - <e>^2)
+        out["heat"][batch] = (
+            betas[batch] ** 2 * spins * (means[:, 1] - means[:, 0] ** 2)
+        )
+        # log Z = log mean w, F = -log Z / beta
+        log_z = logsumexp(weights, axis=-1) - np.log(num_sample)
+        out["free_energy"][batch] = -log_z / (betas[batch] * spins)
+        out["ess"][batch] = effective_sample_size(weights)
+    out["ess_ratio"] = out["ess"] / num_sample
+    out["beta"] = betas
+    return out
@@ -2,46 +2,80 @@ import torch
 import numpy as np
 from torchmetrics import Metric
 
-from src.utils.utils import get_couplings, compute_energy
+from src.utils.utils import get_couplings, get_sparse_couplings
+
+
+def get_torch_couplings(
+    neighbours: np.ndarray, couplings: np.ndarray, len_neighbours: np.ndarray
+) -> torch.Tensor:
+    """Upper triangle of the coupling matrix as a sparse COO tensor, so that
+    each bond is counted once and E = s^T U s.
+
+    Args:
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        torch.Tensor: Sparse tensor of shape (spins, spins).
+    """
+    matrix = get_sparse_couplings(neighbours, couplings, len_neighbours).tocoo()
+    upper = matrix.col > matrix.row
+    indices = np.stack([matrix.row[upper], matrix.col[upper]])
+    return torch.sparse_coo_tensor(
+        torch.from_numpy(indices).long(),
+        torch.from_numpy(matrix.data[upper]),
+        size=matrix.shape,
+    ).coalesce()
+
+
+def compute_energy_torch(samples: torch.Tensor, couplings: torch.Tensor) -> torch.Tensor:
+    """Energies of a batch of configurations on the device of the couplings.
+
+    Args:
+        samples (torch.Tensor): Spin configurations in {-1,+1} of shape (n, spins).
+        couplings (torch.Tensor): Sparse couplings, see get_torch_couplings.
+
+    Returns:
+        torch.Tensor: Energies of shape (n,).
+    """
+    samples = samples.to(couplings.dtype).t()
+    return (samples * torch.sparse.mm(couplings, samples)).sum(0)
 
 
 class MeanMAE(Metric):
-    def __init__(self, dist_sync_on_step=False):
+    def __init__(
+        self,
+        spins: int = 100,
+        couplings_path: str = "data/couplings/100spins_open-1nn.txt",
+        dist_sync_on_step=False,
+    ):
         super().__init__(dist_sync_on_step=dist_sync_on_step)
 
-        self.spins = 100
-        self.couplings_path = "data/couplings/100spins_open-1nn.txt"
+        self.spins = spins
+        self.couplings_path = couplings_path
 
-        self.neighbours, self.couplings, self.len_neighbours = get_couplings(
-            spin_side=int(np.sqrt(self.spins)),
-            couplings_path=self.couplings_path,
+        # follows the metric to the model's device
+        self.register_buffer(
+            "couplings",
+            get_torch_couplings(
+                *get_couplings(
+                    spin_side=int(np.sqrt(self.spins)),
+                    couplings_path=self.couplings_path,
+                )
+            ),
+            persistent=False,
         )
 
         self.add_state("correct", default=torch.tensor(0.0), dist_reduce_fx="sum")
         self.add_state("total", default=torch.tensor(0), dist_reduce_fx="sum")
 
     def update(self, preds: torch.Tensor, targets: torch.Tensor):
-        preds = preds.detach().cpu().numpy() * 2 - 1
-        targets = targets.detach().cpu().numpy() * 2 - 1
-
-        pred_engs = np.apply_along_axis(
-            compute_energy,
-            1,
-            preds,
-            neighbours=self.neighbours,
-            couplings=self.couplings,
-            len_neighbours=self.len_neighbours,
-        )
-        target_engs = np.apply_along_axis(
-            compute_energy,
-            1,
-            targets,
-            neighbours=self.neighbours,
-            couplings=self.couplings,
-            len_neighbours=self.len_neighbours,
-        )
-        pred_engs = torch.tensor(pred_engs, device=self.device) / self.spins
-        target_engs = torch.tensor(target_engs, device=self.device) / self.spins
+        preds = preds.detach() * 2 - 1
+        targets = targets.detach() * 2 - 1
+
+        pred_engs = compute_energy_torch(preds, self.couplings) / self.spins
+        target_engs = compute_energy_torch(targets, self.couplings) / self.spins
 
         self.correct += torch.sum(torch.abs(pred_engs - target_engs))
 
@@ -1,8 +1,9 @@
 from cmath import exp
+import itertools
 import math
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, Tuple, Union
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -10,15 +11,157 @@ from tqdm import tqdm
 
 from src.models.made import Made
 from src.models.rbm import RBM
+from src.utils.buffer import SampleBuffer
+from src.utils.cache import ProposalCache
+from src.utils.chain import ChainState
+from src.utils.importance import importance_estimates
+from src.utils.multispin import (
+    LANES,
+    acceptance_table,
+    multispin_energies,
+    multispin_sweep,
+    pack_spins,
+    pm_j_magnitude,
+    sign_masks,
+    unpack_spins,
+)
+from src.utils.stencil import Stencil
+from src.utils.stream import BatchProducer, ProposalStream
 from src.utils.utils import (
+    PRECISIONS,
+    batch_energies,
+    build_rate_tree,
+    colour_sweep,
     compute_boltz_prob,
     compute_delta_h,
     compute_energy,
+    get_colour_classes,
     get_couplings,
+    get_proposal_cache,
+    first_finite,
+    get_reordered_couplings,
+    greedy_colouring,
+    independent_mh_betas,
+    independent_mh_scan,
     load_data,
+    multiple_try_scan,
+    nfold_way_sweep,
+    proposal_batches,
+    replica_exchange,
+    seed_kernels,
 )
 
 
+def _load_couplings(
+    spin_side: int, couplings_path: str, reorder: bool, precision: str
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Couplings of the local update algorithms, optionally relabelled.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the couplings.
+        reorder (bool): Relabel the spins, see reorder_couplings.
+        precision (str): Floating point precision of couplings and local fields, see PRECISIONS.
+
+    Raises:
+        ValueError: Unknown precision.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]: Neighbours, couplings and number of neighbours of each spin, and the original label of each spin if relabelled.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'")
+    if reorder:
+        neighbours, couplings, len_neighbours, order = get_reordered_couplings(
+            spin_side, couplings_path
+        )
+    else:
+        neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
+        order = None
+    couplings = couplings.astype(PRECISIONS[precision], copy=False)
+    return neighbours, couplings, len_neighbours, order
+
+
+def _proposal_scorer(
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+    energy_backend: str,
+    cache: Optional[ProposalCache] = None,
+) -> Callable[[np.ndarray], np.ndarray]:
+    """Energies of batches of neural proposals, scoring repeated configurations once
+    through the proposal cache if given. The lattice stencil is detected once here,
+    not at every batch.
+
+    Args:
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        energy_backend (str): Backend scoring the proposals, see batch_energies.
+        cache (Optional[ProposalCache], optional): Proposal cache. Defaults to None.
+
+    Returns:
+        Callable[[np.ndarray], np.ndarray]: Energies of a batch of proposals.
+    """
+    stencil = None
+    if energy_backend in ("auto", "stencil"):
+        stencil = Stencil.from_couplings(neighbours, couplings, len_neighbours)
+        if stencil is None and energy_backend == "auto":
+            energy_backend = "numba"
+
+    def energies(samples: np.ndarray) -> np.ndarray:
+        return batch_energies(
+            samples,
+            neighbours,
+            couplings,
+            len_neighbours,
+            backend=energy_backend,
+            stencil=stencil,
+        )
+
+    def score(samples: np.ndarray) -> np.ndarray:
+        if cache is None:
+            return energies(samples)
+        return cache.energies(samples, energies)
+
+    return score
+
+
+def _open_proposals(
+    path: Union[str, Dict[str, np.ndarray]],
+    model: str,
+    num_sample: int,
+    batch_size: int,
+    verbose: bool,
+    stream: bool,
+    queue_size: int,
+) -> Tuple[Iterator[Tuple[np.ndarray, np.ndarray]], Optional[BatchProducer]]:
+    """Batches of neural proposals, either all loaded at once or streamed from a
+    background producer.
+
+    Args:
+        path (Union[str, Dict[str, np.ndarray]]): Path to the generated sample or path to the model to sample or sample itself.
+        model (str): Name of the model to use.
+        num_sample (int): Number of proposals to generate.
+        batch_size (int): Size of each generated batch.
+        verbose (bool): Set verbose prints.
+        stream (bool): Stream the batches instead of loading them all.
+        queue_size (int): Maximum number of streamed batches waiting in memory.
+
+    Returns:
+        Tuple[Iterator[Tuple[np.ndarray, np.ndarray]], Optional[BatchProducer]]: Batches of proposals and their log probability, and the producer to close if streaming.
+    """
+    if stream:
+        producer = BatchProducer(
+            proposal_batches(path, model, num_sample, batch_size, verbose), queue_size
+        )
+        return iter(producer), producer
+    proposals, log_probs = load_data(
+        path, model=model, steps=num_sample, batch_size=batch_size, verbose=verbose
+    )
+    return iter([(proposals, log_probs)]), None
+
+
 def single_spin_flip(
     spins: int,
     beta: float,
@@ -31,6 +174,8 @@ def single_spin_flip(
     disable_bar: bool = False,
     save: bool = False,
     save_dir: Optional[str] = None,
+    reorder: bool = False,
+    precision: str = "double",
 ) -> Tuple[np.ndarray, np.ndarray]:
     """The Single Spin Flip algorithm exploit a Markov Chain to explore the energy landscape
      of a given hamiltonian at a specified temperature.
@@ -47,6 +192,8 @@ def single_spin_flip(
         disable_bar (bool, optional): Set true to disable the bar. Defaults to False.
         save (bool, optional): Save the samples after MCMC. Defaults to False.
         save_dir (str, optional): Number of steps to skip before starting to save. Default to None.
+        reorder (bool, optional): Relabel the spins to improve memory locality, the samples keep the original order. Defaults to False.
+        precision (str, optional): Floating point precision of couplings and local fields, 'single' or 'double'. Defaults to 'double'.
 
     Returns:
         Tuple[np.ndarray, np.ndarray]: Sample and their energy.
@@ -61,18 +208,25 @@ def single_spin_flip(
 
     # get neighbourhood matrix
     spin_side = int(math.sqrt(spins))
-    neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
+    neighbours, couplings, len_neighbours, order = _load_couplings(
+        spin_side, couplings_path, reorder, precision
+    )
 
     # initialize starting point
     np.random.seed(seed)
-    sample = 2 * np.random.randint(2, size=(spins)) - 1.0
-
-    # initialize energy and config list
-    configs = []
-    energies = []
+    sample = (2 * np.random.randint(2, size=(spins)) - 1).astype(np.int8)
+    if order is not None:
+        # same starting point, in the new labels
+        sample = sample[order]
+    # the compiled sweep draws from its own random stream
+    seed_kernels(seed)
+
+    # initialize energy, local fields and config buffer
+    chain = ChainState(sample, neighbours, couplings, len_neighbours)
+    sample = chain.samples[0]
+    buffer = SampleBuffer(steps, spins)
     accepted = 0
     single_step = 0
-    eng_now = compute_energy(sample, neighbours, couplings, len_neighbours)
 
     # disable bar in parallel processing too
     disable = disable_bar + verbose
@@ -80,36 +234,28 @@ def single_spin_flip(
     # use sweeps to reduce correlation
     skip_steps = 1 if sweeps == 0 else sweeps * spins
     for step in pbar:
-        for _ in range(skip_steps):
-            single_step += 1
-            k = np.random.randint(0, spins)
-            # Metropolis-Hastings algorithm https://doi.org/10.2307/2334940
-            deltah = compute_delta_h(
-                k, sample, neighbours[k], couplings[k], len_neighbours[k]
-            )
-            # if delta change is negative, we accept.
-            # otherwise we accept based on the following probability
-            if deltah < 0.0 or np.random.ranf() < np.exp(-beta * deltah):
-                sample[k] = -sample[k]
-                # update energy
-                eng_now += deltah
-                accepted += 1
+        # the whole sweep runs in a single compiled call
+        accepted += chain.sweep(beta, skip_steps).sum()
+        eng_now = chain.engs[0]
+        single_step += skip_steps
 
         pbar.set_description(f"eng: {eng_now / spins:2.5f}", refresh=False)
 
         # do not save first N_burnt steps
         if step > burnt - 1:
             # save energies and step
-            energies.append(eng_now)
-            configs.append(sample.copy())
+            buffer.append(sample, eng_now)
 
         if verbose and step > 1:
             print(
-                f"{step-1:6d}  {eng_now / spins:2.4f}  {np.asarray(energies).mean():2.4f}  {np.asarray(energies).std(ddof=1):2.4f}"
+                f"{step-1:6d}  {eng_now / spins:2.4f}  {buffer.energies.mean():2.4f}  {buffer.energies.std(ddof=1):2.4f}"
             )
 
-    configs = np.asarray(configs).astype("int8")
-    energies = np.asarray(energies)
+    configs = buffer.samples
+    if order is not None:
+        # back to the original labels
+        configs = configs[..., np.argsort(order)]
+    energies = buffer.energies
     if save:
         file = f"{spins}spins-seed{seed}-sample{step+1}-sweeps{sweeps}-beta{beta}.npy"
         print(file)
@@ -129,6 +275,516 @@ def single_spin_flip(
     return configs, energies
 
 
+def replica_spin_flip(
+    spins: int,
+    beta: float,
+    steps: int,
+    couplings_path: str,
+    replicas: int = 1,
+    sweeps: int = 0,
+    burnt: int = 0,
+    seed: int = 42,
+    update: str = "random",
+    houdayer_every: int = 0,
+    verbose: bool = False,
+    disable_bar: bool = False,
+    save: bool = False,
+    save_dir: Optional[str] = None,
+    reorder: bool = False,
+    precision: str = "double",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Single Spin Flip algorithm on a batch of independent replicas, advanced together
+    in the same process to amortize the per-chain overhead.
+    With update='checkerboard' the lattice is swept one colour class at a time,
+    updating all the uncoupled spins of a class in parallel, with the lattice
+    stencil on regular square lattices.
+    With houdayer_every > 0 consecutive pairs of replicas undergo a Houdayer cluster
+    move every houdayer_every steps.
+    Random site updates of ±J instances with at least 64 replicas run on the
+    multi-spin coded backend, which packs 64 replicas in each machine word.
+    The replicas of a word visit the same sequence of sites.
+
+    Args:
+        spins (int): Number of spins of the ravel spin glass.
+        beta (float): Inverse temperature.
+        steps (int): Steps of the Monte Carlo simulation.
+        couplings_path (str): Path to the couplings, they define a Hamiltonian.
+        replicas (int, optional): Number of independent chains. Defaults to 1.
+        sweeps (int, optional): Number of attemps to flip each spin before save. Defaults to 0.
+        burnt (int, optional): Number of steps to skip before starting to save. Default to 0.
+        seed (int, optional): Seed to sample the starting point configurations. Defaults to 42.
+        update (str, optional): Either 'random' site or 'checkerboard' updates. Defaults to 'random'.
+        houdayer_every (int, optional): Steps between two cluster moves, 0 to disable them. Defaults to 0.
+        verbose (bool, optional): Set verbose prints. Defaults to False.
+        disable_bar (bool, optional): Set true to disable the bar. Defaults to False.
+        save (bool, optional): Save the samples after MCMC. Defaults to False.
+        save_dir (str, optional): Directory where to save the samples. Default to None.
+        reorder (bool, optional): Relabel the spins to improve memory locality, the samples keep the original order. Defaults to False.
+        precision (str, optional): Floating point precision of couplings and local fields, 'single' or 'double'. Defaults to 'double'.
+
+    Raises:
+        ValueError: Unknown update, or cluster moves with a single replica.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Sample and their energy, with the replicas on the first axis.
+    """
+    if update not in ("random", "checkerboard"):
+        raise ValueError(f"Unknown update '{update}'")
+    if houdayer_every > 0 and replicas < 2:
+        raise ValueError("Houdayer cluster moves need at least two replicas")
+
+    start_time = datetime.now()
+    print(
+        f"\nStart MCMC simulation {start_time}\nbeta={beta} seed={seed} replicas={replicas}"
+    )
+
+    if save_dir is not None:
+        if not Path(save_dir).is_dir():
+            print(f"'{save_dir}' not found")
+            raise FileNotFoundError
+
+    # get neighbourhood matrix
+    spin_side = int(math.sqrt(spins))
+    neighbours, couplings, len_neighbours, order = _load_couplings(
+        spin_side, couplings_path, reorder, precision
+    )
+    stencil = None
+    if update == "checkerboard":
+        colour_sites, colour_offsets = get_colour_classes(neighbours, len_neighbours)
+        # regular lattices are swept with shifted rows instead of neighbour lists
+        stencil = Stencil.from_couplings(neighbours, couplings, len_neighbours)
+        print(
+            f"Checkerboard update with {colour_offsets.shape[0] - 1} colours"
+            + (" on the lattice stencil" if stencil is not None else "")
+        )
+        if stencil is not None:
+            colours = greedy_colouring(neighbours, len_neighbours)
+    magnitude = None
+    if update == "random" and replicas >= LANES:
+        # fewer replicas would leave most of the lanes of a word idle
+        magnitude = pm_j_magnitude(couplings, len_neighbours)
+
+    # initialize starting points
+    np.random.seed(seed)
+    samples = 2 * np.random.randint(2, size=(replicas, spins)) - 1
+    samples = samples.astype(np.int8)
+    if order is not None:
+        # same starting point, in the new labels
+        samples = samples[:, order]
+    # the compiled sweep draws from its own random stream
+    seed_kernels(seed)
+
+    betas = np.full(replicas, beta, dtype=np.double)
+    chain = ChainState(samples, neighbours, couplings, len_neighbours)
+    samples, engs = chain.samples, chain.engs
+    if magnitude is not None:
+        words = pack_spins(samples)
+        lanes = pack_spins(-np.ones((replicas, 1)))[:, 0]
+        signs = sign_masks(couplings)
+        table = acceptance_table(beta, magnitude, neighbours.shape[1])
+        print(f"\u00B1J couplings, multi-spin coding on {words.shape[0]} words")
+    buffer = SampleBuffer(steps, (replicas, spins), eng_shape=(replicas,))
+    accepted = 0
+    cluster_flips, cluster_moves = 0, 0
+
+    # disable bar in parallel processing too
+    disable = disable_bar + verbose
+    pbar = tqdm(range(steps + burnt), disable=disable)
+    # use sweeps to reduce correlation
+    skip_steps = 1 if sweeps == 0 else sweeps * spins
+    if update == "checkerboard":
+        # a colour sweep attempts to flip every spin once
+        sweeps = max(sweeps, 1)
+        skip_steps = sweeps * spins
+    for step in pbar:
+        save_step = step > burnt - 1
+        houdayer_step = houdayer_every > 0 and (step + 1) % houdayer_every == 0
+        if stencil is not None:
+            accepted += stencil.colour_sweep(
+                samples, engs, betas, colours, sweeps
+            ).sum()
+            chain.mark_stale()
+        elif update == "checkerboard":
+            accepted += colour_sweep(
+                samples,
+                engs,
+                betas,
+                neighbours,
+                couplings,
+                len_neighbours,
+                colour_sites,
+                colour_offsets,
+                sweeps,
+            ).sum()
+            chain.mark_stale()
+        elif magnitude is not None:
+            accepted += multispin_sweep(
+                words, lanes, signs, neighbours, len_neighbours, table, skip_steps
+            )
+            if save_step or houdayer_step or verbose:
+                # unpack only the steps that read the spins, the bar shows the last ones
+                samples[:] = unpack_spins(words, replicas)
+                engs[:] = multispin_energies(
+                    words, signs, neighbours, len_neighbours, magnitude, replicas
+                )
+                chain.mark_stale()
+        else:
+            accepted += chain.sweep(betas, skip_steps).sum()
+
+        if houdayer_step:
+            cluster_flips += chain.cluster_move(replicas)
+            cluster_moves += replicas // 2
+            if magnitude is not None:
+                words = pack_spins(samples)
+
+        pbar.set_description(f"eng: {engs.mean() / spins:2.5f}", refresh=False)
+
+        # do not save first N_burnt steps
+        if save_step:
+            buffer.append(samples, engs)
+
+        if verbose:
+            print(
+                f"{step:6d}  {engs.mean() / spins:2.4f}  {engs.min() / spins:2.4f}  {engs.max() / spins:2.4f}"
+            )
+
+    # replicas on the first axis
+    configs = buffer.samples.swapaxes(0, 1)
+    if order is not None:
+        # back to the original labels
+        configs = configs[..., np.argsort(order)]
+    energies = buffer.energies.T
+    if save:
+        file = f"{spins}spins-seed{seed}-replicas{replicas}-sample{steps}-sweeps{sweeps}-beta{beta}.npy"
+        # add parent directory
+        if save_dir is not None:
+            file = save_dir + file
+        # Saves the configurations
+        np.save(file, configs)
+        print(f"Saved in {file}")
+
+    single_step = (steps + burnt) * skip_steps * replicas
+    # replicas are independent, the error is given by their spread
+    if replicas > 1:
+        err_eng = energies.mean(axis=1).std(ddof=1) / math.sqrt(replicas)
+    else:
+        err_eng = energies.std(ddof=1) / math.sqrt(steps)
+    print(f"\nMCMC: Beta={beta} Seed={seed} Replicas={replicas}")
+    print(
+        f"Steps: {steps + burnt:6d}  A_r={accepted / single_step * 100:2.2f}%  E={energies.mean() / spins:2.6f} \u00B1 {err_eng / spins:2.6f}  [\u03C3={(energies / spins).std(ddof=1):2.6f}  E_min={energies.min() / spins:2.6f}]"
+    )
+    if cluster_moves > 0:
+        print(
+            f"Cluster moves: {cluster_moves}  mean size={cluster_flips / cluster_moves / spins * 100:2.2f}%"
+        )
+    print(f"Duration {datetime.now() - start_time}")
+    return configs, energies
+
+
+def nfold_way(
+    spins: int,
+    beta: float,
+    steps: int,
+    couplings_path: str,
+    sweeps: int = 0,
+    burnt: int = 0,
+    seed: int = 42,
+    verbose: bool = False,
+    disable_bar: bool = False,
+    save: bool = False,
+    save_dir: Optional[str] = None,
+    reorder: bool = False,
+    precision: str = "double",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Rejection-free version of the Single Spin Flip algorithm, the n-fold way.
+    Every move flips a spin and the clock counts the equivalent single spin flip attempts,
+    so the samples are saved at the same times of single_spin_flip. Useful at low
+    temperature, where most of the single spin flip proposals are rejected.
+
+    Args:
+        spins (int): Number of spins of the ravel spin glass.
+        beta (float): Inverse temperature.
+        steps (int): Steps of the Monte Carlo simulation.
+        couplings_path (str): Path to the couplings, they define a Hamiltonian.
+        sweeps (int, optional): Number of attemps to flip each spin before save. Defaults to 0.
+        burnt (int, optional): Number of steps to skip before starting to save. Default to 0.
+        seed (int, optional): Seed to sample the starting point configuration. Defaults to 42.
+        verbose (bool, optional): Set verbose prints. Defaults to False.
+        disable_bar (bool, optional): Set true to disable the bar. Defaults to False.
+        save (bool, optional): Save the samples after MCMC. Defaults to False.
+        save_dir (str, optional): Directory where to save the samples. Default to None.
+        reorder (bool, optional): Relabel the spins to improve memory locality, the samples keep the original order. Defaults to False.
+        precision (str, optional): Floating point precision of couplings and local fields, 'single' or 'double'. Defaults to 'double'.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Sample and their energy.
+    """
+    start_time = datetime.now()
+    print(f"\nStart n-fold way simulation {start_time}\nbeta={beta} seed={seed}")
+
+    if save_dir is not None:
+        if not Path(save_dir).is_dir():
+            print(f"'{save_dir}' not found")
+            raise FileNotFoundError
+
+    # get neighbourhood matrix
+    spin_side = int(math.sqrt(spins))
+    neighbours, couplings, len_neighbours, order = _load_couplings(
+        spin_side, couplings_path, reorder, precision
+    )
+
+    # initialize starting point
+    np.random.seed(seed)
+    sample = (2 * np.random.randint(2, size=(spins)) - 1).astype(np.int8)
+    if order is not None:
+        # same starting point, in the new labels
+        sample = sample[order]
+    # the compiled kernel draws from its own random stream
+    seed_kernels(seed)
+
+    # initialize energy, local fields and flip rates
+    buffer = SampleBuffer(steps, spins)
+    flips = 0
+    clock = 0.0
+    chain = ChainState(sample, neighbours, couplings, len_neighbours)
+    sample, fields, eng_now = chain.samples[0], chain.fields[0], chain.engs[0]
+    tree = build_rate_tree(sample, fields, beta)
+
+    # disable bar in parallel processing too
+    disable = disable_bar + verbose
+    pbar = tqdm(range(steps + burnt), disable=disable)
+    # use sweeps to reduce correlation
+    skip_steps = 1 if sweeps == 0 else sweeps * spins
+    for step in pbar:
+        eng_now, clock, flips_step = nfold_way_sweep(
+            sample,
+            eng_now,
+            fields,
+            tree,
+            beta,
+            neighbours,
+            couplings,
+            len_neighbours,
+            clock,
+            clock + skip_steps,
+        )
+        flips += flips_step
+        chain.record(flips_step)
+        if chain.stale:
+            # single precision fields, recompute them with the flip rates
+            chain.refresh()
+            eng_now = chain.engs[0]
+            tree = build_rate_tree(sample, fields, beta)
+
+        pbar.set_description(f"eng: {eng_now / spins:2.5f}", refresh=False)
+
+        # do not save first N_burnt steps
+        if step > burnt - 1:
+            buffer.append(sample, eng_now)
+
+        if verbose:
+            print(f"{step:6d}  {eng_now / spins:2.4f}  {flips_step:6d}")
+
+    configs, energies = buffer.samples, buffer.energies
+    if order is not None:
+        # back to the original labels
+        configs = configs[..., np.argsort(order)]
+    if save:
+        file = (
+            f"{spins}spins-seed{seed}-sample{steps}-sweeps{sweeps}-beta{beta}-nfold.npy"
+        )
+        # add parent directory
+        if save_dir is not None:
+            file = save_dir + file
+        # Saves the configurations
+        np.save(file, configs)
+        print(f"Saved in {file}")
+
+    print(f"\nn-fold way: Beta={beta} Seed={seed}")
+    # the acceptance rate of the equivalent single spin flip simulation
+    print(
+        f"Steps: {step + 1:6d}  Flips: {flips}  A_r={flips / clock * 100:2.2f}%  E={energies.mean() / spins:2.6f} \u00B1 {(energies / spins).std(ddof=1) / math.sqrt(steps):2.6f}  [\u03C3={(energies / spins).std(ddof=1):2.6f}  E_min={energies.min() / spins:2.6f}]"
+    )
+    print(f"Duration {datetime.now() - start_time}")
+    return configs, energies
+
+
+def parallel_tempering(
+    spins: int,
+    betas: List[float],
+    steps: int,
+    couplings_path: str,
+    replicas: int = 1,
+    sweeps: int = 0,
+    burnt: int = 0,
+    swap_every: int = 1,
+    adapt_betas: bool = False,
+    houdayer_every: int = 0,
+    seed: int = 42,
+    verbose: bool = False,
+    disable_bar: bool = False,
+    save: bool = False,
+    save_dir: Optional[str] = None,
+    reorder: bool = False,
+    precision: str = "double",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Parallel Tempering (Replica Exchange Monte Carlo), https://doi.org/10.1143/JPSJ.65.1604.
+    One or more Single Spin Flip chains run at each inverse temperature and configurations
+    at neighbouring temperatures are swapped every swap_every steps.
+    With adapt_betas the inner temperatures are moved during the burn-in steps
+    to equalize the swap acceptance rates, then the ladder is kept fixed.
+    With houdayer_every > 0 pairs of replicas at the same temperature undergo
+    a Houdayer cluster move every houdayer_every steps.
+
+    Args:
+        spins (int): Number of spins of the ravel spin glass.
+        betas (List[float]): Inverse temperatures.
+        steps (int): Steps of the Monte Carlo simulation.
+        couplings_path (str): Path to the couplings, they define a Hamiltonian.
+        replicas (int, optional): Number of chains at each temperature. Defaults to 1.
+        sweeps (int, optional): Number of attemps to flip each spin before save. Defaults to 0.
+        burnt (int, optional): Number of steps to skip before starting to save. Default to 0.
+        swap_every (int, optional): Steps between two swap attempts. Defaults to 1.
+        adapt_betas (bool, optional): Adapt the temperatures during burn-in. Defaults to False.
+        houdayer_every (int, optional): Steps between two cluster moves, 0 to disable them. Defaults to 0.
+        seed (int, optional): Seed to sample the starting point configurations. Defaults to 42.
+        verbose (bool, optional): Set verbose prints. Defaults to False.
+        disable_bar (bool, optional): Set true to disable the bar. Defaults to False.
+        save (bool, optional): Save the samples after MCMC. Defaults to False.
+        save_dir (str, optional): Directory where to save the samples. Default to None.
+        reorder (bool, optional): Relabel the spins to improve memory locality, the samples keep the original order. Defaults to False.
+        precision (str, optional): Floating point precision of couplings and local fields, 'single' or 'double'. Defaults to 'double'.
+
+    Raises:
+        ValueError: Cluster moves with a single replica per temperature, or temperatures adapted without burn-in steps.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Sample and their energy, with temperatures and replicas on the first two axes, and the swap acceptance rate of each pair of neighbouring temperatures.
+    """
+    if houdayer_every > 0 and replicas < 2:
+        raise ValueError("Houdayer cluster moves need at least two replicas")
+    if adapt_betas and burnt < 1:
+        raise ValueError("Temperatures are adapted during burn-in, set at least one burn-in step")
+
+    start_time = datetime.now()
+    ladder = np.sort(np.asarray(betas, dtype=np.double))
+    num_betas = ladder.shape[0]
+    print(
+        f"\nStart Parallel Tempering {start_time}\nbeta={ladder} seed={seed} replicas={replicas}"
+    )
+
+    if save_dir is not None:
+        if not Path(save_dir).is_dir():
+            print(f"'{save_dir}' not found")
+            raise FileNotFoundError
+
+    # get neighbourhood matrix
+    spin_side = int(math.sqrt(spins))
+    neighbours, couplings, len_neighbours, order = _load_couplings(
+        spin_side, couplings_path, reorder, precision
+    )
+
+    # initialize starting points, ordered by temperature
+    np.random.seed(seed)
+    samples = 2 * np.random.randint(2, size=(num_betas * replicas, spins)) - 1
+    samples = samples.astype(np.int8)
+    if order is not None:
+        # same starting point, in the new labels
+        samples = samples[:, order]
+    # the compiled kernels draw from their own random stream
+    seed_kernels(seed)
+
+    chain = ChainState(samples, neighbours, couplings, len_neighbours)
+    samples, engs = chain.samples, chain.engs
+    buffer = SampleBuffer(
+        steps, (num_betas * replicas, spins), eng_shape=(num_betas * replicas,)
+    )
+    chain_betas = np.repeat(ladder, replicas)
+    accepted = 0
+    swaps = np.zeros(num_betas - 1, dtype=np.int64)
+    swap_attempts = 0
+    cluster_flips, cluster_moves = 0, 0
+    # adapt the temperatures ten times during burn-in
+    adapt_every = max(burnt // (10 * swap_every), 1) * swap_every
+
+    # disable bar in parallel processing too
+    disable = disable_bar + verbose
+    pbar = tqdm(range(steps + burnt), disable=disable)
+    # use sweeps to reduce correlation
+    skip_steps = 1 if sweeps == 0 else sweeps * spins
+    for step in pbar:
+        accepted += chain.sweep(chain_betas, skip_steps).sum()
+
+        if (step + 1) % swap_every == 0:
+            replica_exchange(samples, chain.fields, engs, chain_betas, replicas, swaps)
+            swap_attempts += replicas
+
+        if houdayer_every > 0 and (step + 1) % houdayer_every == 0:
+            cluster_flips += chain.cluster_move(replicas)
+            cluster_moves += num_betas * (replicas // 2)
+
+        if adapt_betas and step < burnt and (step + 1) % adapt_every == 0:
+            # shrink the gaps with low swap acceptance, keeping the extremes fixed
+            swap_rate = swaps / max(swap_attempts, 1) + 1e-3
+            gaps = np.diff(ladder) * np.sqrt(swap_rate / swap_rate.mean())
+            gaps *= (ladder[-1] - ladder[0]) / gaps.sum()
+            ladder[1:-1] = ladder[0] + np.cumsum(gaps)[:-1]
+            chain_betas = np.repeat(ladder, replicas)
+            swaps[:], swap_attempts = 0, 0
+
+        if step == burnt - 1:
+            # count the swaps of the saved steps only
+            swaps[:], swap_attempts = 0, 0
+
+        pbar.set_description(
+            f"eng: {engs[-replicas:].mean() / spins:2.5f}", refresh=False
+        )
+
+        # do not save first N_burnt steps
+        if step > burnt - 1:
+            buffer.append(samples, engs)
+
+        if verbose:
+            print(f"{step:6d}  " + "  ".join(f"{e / spins:2.4f}" for e in engs))
+
+    swap_rate = swaps / max(swap_attempts, 1)
+    # temperatures and replicas on the first axes
+    configs = np.moveaxis(buffer.samples.reshape(-1, num_betas, replicas, spins), 0, 2)
+    if order is not None:
+        # back to the original labels
+        configs = configs[..., np.argsort(order)]
+    energies = np.moveaxis(buffer.energies.reshape(-1, num_betas, replicas), 0, 2)
+    if save:
+        file = f"{spins}spins-seed{seed}-pt{num_betas}betas-replicas{replicas}-sample{steps}-sweeps{sweeps}"
+        # add parent directory
+        if save_dir is not None:
+            file = save_dir + file
+        out = {
+            "beta": ladder,
+            "swap_rate": swap_rate,
+            "sample": configs,
+            "energy": energies,
+        }
+        np.savez(file, **out)
+        print(f"Saved in {file}.npz")
+
+    single_step = (steps + burnt) * skip_steps * num_betas * replicas
+    print(f"\nParallel Tempering: Seed={seed} Replicas={replicas}")
+    print(f"Steps: {steps + burnt:6d}  A_r={accepted / single_step * 100:2.2f}%")
+    for b, beta in enumerate(ladder):
+        eng = energies[b] / spins
+        print(
+            f"Beta={beta:2.4f}  E={eng.mean():2.6f}  [\u03C3={eng.std(ddof=1):2.6f}  E_min={eng.min():2.6f}]"
+            + (f"  swap={swap_rate[b] * 100:2.2f}%" if b < num_betas - 1 else "")
+        )
+    if cluster_moves > 0:
+        print(
+            f"Cluster moves: {cluster_moves}  mean size={cluster_flips / cluster_moves / spins * 100:2.2f}%"
+        )
+    print(f"Duration {datetime.now() - start_time}")
+    return configs, energies, swap_rate
+
+
 def neural_mcmc(
     beta: float,
     steps: int,
@@ -140,6 +796,11 @@ def neural_mcmc(
     save: bool = False,
     save_every: int = 1,
     disable_bar: bool = False,
+    energy_backend: str = "auto",
+    cache_size: int = 0,
+    stream: bool = False,
+    queue_size: int = 2,
+    tries: int = 1,
 ) -> Tuple[np.ndarray, np.ndarray, float]:
     """Performs Markov Chain Monte Carlo using ansatz generated by a neural network.
     Args:
@@ -153,111 +814,199 @@ def neural_mcmc(
         save (bool, optional): Set True to save data after simulation. Defaults to False.
         save_every (int): Save every n steps to get uncorrelated data. Defaults to 1.
         disable_bar(bool, optional): Set True to disable the progress bar. Defaults to False.
+        energy_backend (str, optional): Backend scoring the proposals, see batch_energies. Defaults to 'auto'.
+        cache_size (int, optional): Number of distinct proposals kept in the energy cache, 0 to disable it. Defaults to 0.
+        stream (bool, optional): Generate the proposals in a background thread while the chain consumes them, one batch at a time. Defaults to False.
+        queue_size (int, optional): Maximum number of streamed batches waiting in memory. Defaults to 2.
+        tries (int, optional): Candidates drawn at each step, more than one for multiple-try Metropolis, see multiple_try_scan. Defaults to 1.
+
+    Raises:
+        ValueError: Less than one try per step, or no proposal with a finite log-probability and energy.
 
     Returns:
         Tuple[np.ndarray, np.ndarray, float]: Sample, energy and acceptance rate.
     """
+    if tries < 1:
+        raise ValueError(f"At least one try per step is needed, got {tries}")
     start_time = datetime.now()
     # generate more data than needed
     steps = steps * save_every
+    # each step of the chain consumes tries proposals, after the starting one
+    num_proposals = (steps - save_every) * tries + 1
     # load data generate by the NN
-    proposals, log_probs = load_data(
-        path, model=model, steps=steps, batch_size=batch_size, verbose=verbose
+    batches, producer = _open_proposals(
+        path, model, steps * tries, batch_size, verbose, stream, queue_size
     )
-    assert log_probs.shape[0] > steps - save_every
-
-    # get the dimension of the sample from the data
-    spin_side = proposals[0].shape[-1]
-    spins = spin_side ** 2
-    proposals = np.reshape(proposals, (proposals.shape[0], -1))
-
-    accepted_log_prob = np.nan
-    # get the first sample and its energy
-    while not np.isfinite(accepted_log_prob):
-        accepted_sample, accepted_log_prob = proposals[0], log_probs[0]
 
-    # get neighbourhood and couplings matrix
-    neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
-
-    # initialisation
-    energies = []
-    samples = []
-    transition_prob = []
-    log_prob_ratio = []
+    # initialisation, the chain starts from the first finite proposal
+    chain_len = 0
     accepted = 0
-
-    # compute the energy of the new configuration
-    accepted_eng = compute_energy(
-        accepted_sample, neighbours, couplings, len_neighbours
-    )
-    # compute boltzmann probability
-    accepted_boltz_log_prob = compute_boltz_prob(accepted_eng, beta, spin_side ** 2)
-
-    print(f"\nPerforming Neural MCMC at beta={beta}")
+    skipped = 0
+    discarded = 0
+    consumed = 0
+    # state of the chain and proposals left over by the previous batch
+    carry = None
 
     disable = disable_bar + verbose
-    pbar = tqdm(range(steps - save_every), disable=disable)
-    for idx in pbar:
-        # get next sample and its energy
-        trial_sample, trial_log_prob = proposals[idx + 1], log_probs[idx + 1]
-        if not np.isfinite(trial_log_prob):
-            print("NAN in log_prob")
-            continue
-
-        trial_eng = compute_energy(trial_sample, neighbours, couplings, len_neighbours)
-        if not np.isfinite(trial_eng):
-            print("NAN in trial_eng")
-            continue
-
-        # compute Boltzmann probability
-        trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spin_side ** 2)
-        if not np.isfinite(trial_boltz_log_prob):
-            print("NAN in trial_boltz_log_prob")
-            continue
-
-        # get the transition probability
-        log_prob_ratio.append(
-            +accepted_log_prob
-            - trial_log_prob
-            + trial_boltz_log_prob
-            - accepted_boltz_log_prob
-        )
-        if not np.isfinite(log_prob_ratio[idx]):
-            print("NAN in prob_ratio")
-            continue
-
-        transition_prob.append(min(0.0, log_prob_ratio[idx]))
-
-        if verbose:
-            print(
-                f"{idx+1:6d}  neural  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob[idx]:2.4f}"
-            )
-
-        if transition_prob[idx] >= 0.0 or (
-            np.log(np.random.random_sample()) < transition_prob[idx]
-        ):
-            # update energy, prob and sample
-            accepted_eng = np.copy(trial_eng)
-            accepted_log_prob = np.copy(trial_log_prob)
-            accepted_sample = np.copy(trial_sample)
-            accepted_boltz_log_prob = np.copy(trial_boltz_log_prob)
-            accepted += 1
-
-        pbar.set_description(f"eng: {accepted_eng / spin_side**2:2.5f}", refresh=False)
-
-        # save acceped sample and its energy
-        samples.append(accepted_sample)
-        energies.append(accepted_eng)
+    pbar = tqdm(total=num_proposals - 1, disable=disable)
+    try:
+        for proposals, log_probs in batches:
+            if consumed == 0:
+                if not stream:
+                    assert log_probs.shape[0] >= num_proposals
+                # get the dimension of the sample from the data
+                spin_side = proposals[0].shape[-1]
+                spins = spin_side ** 2
+                # get neighbourhood and couplings matrix
+                neighbours, couplings, len_neighbours = get_couplings(
+                    spin_side, couplings_path
+                )
+                cache = get_proposal_cache(spin_side, couplings_path, cache_size)
+                score = _proposal_scorer(
+                    neighbours, couplings, len_neighbours, energy_backend, cache
+                )
+                # only every save_every steps of the chain are stored
+                buffer = SampleBuffer(
+                    math.ceil((steps - save_every) / save_every), spins
+                )
+                print(f"\nPerforming Neural MCMC at beta={beta}")
+
+            proposals = np.reshape(proposals, (proposals.shape[0], -1))
+            proposals = proposals[: num_proposals - consumed]
+            log_probs = log_probs[: proposals.shape[0]]
+            consumed += proposals.shape[0]
+            # score all the proposals of the batch at once
+            proposal_engs = score(proposals)
+            if carry is not None:
+                # the chain carries on from its last state, first in the batch
+                proposals = np.concatenate([carry[0], proposals])
+                log_probs = np.concatenate([carry[1], log_probs])
+                proposal_engs = np.concatenate([carry[2], proposal_engs])
+            # Boltzmann probability of the proposals, see compute_boltz_prob
+            boltz_log_probs = -beta * proposal_engs
+            if carry is None:
+                # the chain cannot start from a proposal with NAN
+                start = first_finite(log_probs, boltz_log_probs)
+                discarded += start
+                pbar.update(start)
+                if start == proposals.shape[0]:
+                    if consumed >= num_proposals:
+                        break
+                    continue
+                proposals = proposals[start:]
+                log_probs = log_probs[start:]
+                proposal_engs = proposal_engs[start:]
+                boltz_log_probs = boltz_log_probs[start:]
+
+            # the accept/reject decisions run in compiled blocks
+            block = 1 << 16
+            if tries == 1:
+                # state of the chain after each proposal, as an index of the proposals
+                chain = np.zeros(proposals.shape[0], dtype=np.int64)
+                # at most one uniform number per proposal, in the order a sequential loop draws them
+                uniforms = np.random.random_sample(proposals.shape[0])
+                state, draws = 0, 0
+                for first in range(1, proposals.shape[0], block):
+                    last = min(first + block, proposals.shape[0])
+                    state, accepted_block, draws = independent_mh_scan(
+                        log_probs,
+                        boltz_log_probs,
+                        uniforms,
+                        chain,
+                        state,
+                        first,
+                        last,
+                        draws,
+                    )
+                    accepted += accepted_block
+                    pbar.update(last - first)
+                    pbar.set_description(
+                        f"eng: {proposal_engs[state] / spins:2.5f}", refresh=False
+                    )
+                chain = chain[1:]
+                trials = np.arange(1, proposals.shape[0])
+                used = proposals.shape[0]
+            else:
+                num_steps = (proposals.shape[0] - 1) // tries
+                # state of the chain after each step and candidate it selected
+                chain = np.zeros(num_steps, dtype=np.int64)
+                trials = np.zeros(num_steps, dtype=np.int64)
+                uniforms = np.random.random_sample((num_steps, 2))
+                state = 0
+                for first in range(0, num_steps, block):
+                    last = min(first + block, num_steps)
+                    state, accepted_block = multiple_try_scan(
+                        log_probs,
+                        boltz_log_probs,
+                        uniforms,
+                        chain,
+                        trials,
+                        state,
+                        tries,
+                        first,
+                        last,
+                    )
+                    accepted += accepted_block
+                    pbar.update((last - first) * tries)
+                    pbar.set_description(
+                        f"eng: {proposal_engs[state] / spins:2.5f}", refresh=False
+                    )
+                used = 1 + num_steps * tries
+
+            # proposals with NAN do not advance the chain
+            valid = chain >= 0
+            steps_chain = chain[valid]
+            skipped += chain.shape[0] - steps_chain.shape[0]
+            if verbose:
+                for trial, now, previous in zip(
+                    trials[valid], steps_chain, np.append(0, steps_chain[:-1])
+                ):
+                    print(
+                        f"{trial:6d}  neural  {proposal_engs[previous]/spins:2.4f}  {proposal_engs[trial]/spins:2.4f}  {log_probs[previous]:3.2f}  {log_probs[trial]:3.2f}  {boltz_log_probs[previous]:4.2f}  {boltz_log_probs[trial]:4.2f}  {now == trial}"
+                    )
+
+            # save the accepted samples, gathered by index
+            saved = steps_chain[-chain_len % save_every :: save_every]
+            buffer.extend(proposals[saved], proposal_engs[saved])
+            chain_len += steps_chain.shape[0]
+            # candidates of an incomplete step wait for the next batch
+            kept = np.append(state, np.arange(used, proposals.shape[0]))
+            carry = (proposals[kept], log_probs[kept], proposal_engs[kept])
+            if consumed >= num_proposals:
+                break
+    finally:
+        pbar.close()
+        if producer is not None:
+            producer.close()
+    if discarded > 0:
+        print(f"NAN in the first {discarded} proposals, the chain starts after them")
+    if skipped > 0:
+        if tries == 1:
+            print(f"NAN in {skipped} proposals, skipped")
+        else:
+            print(f"NAN in all the tries of {skipped} steps, skipped")
+    if carry is None:
+        raise ValueError("No proposal has a finite log-probability and energy")
+
+    samples, energies = buffer.samples, buffer.energies
+    _neural_summary(samples, energies, accepted, steps, spins, beta, save)
+    if cache is not None:
+        print(cache.summary())
+    print(f"Duration {datetime.now() - start_time}")
+    return (samples, energies, accepted / steps * 100)
 
-        if verbose:
-            print(
-                f"{idx+1:6d}  neural  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob[idx]:2.4f}"
-            )
 
-    avg_eng, std_eng = np.asarray(energies).mean(), np.asarray(energies).std(ddof=1)
-    # reduce save data
-    samples = np.asarray(samples).astype("int8")[::save_every, ...]
-    energies = np.asarray(energies).astype(np.double)[::save_every]
+def _neural_summary(
+    samples: np.ndarray,
+    energies: np.ndarray,
+    accepted: int,
+    steps: int,
+    spins: int,
+    beta: float,
+    save: bool,
+) -> None:
+    """Print the statistics of a neural chain and save it if requested."""
+    avg_eng, std_eng = energies.mean(), energies.std(ddof=1)
     if save:
         filename = f"{str(spins)}spins_beta{beta}_neural-mcmc_{steps}steps"
         out = {
@@ -273,8 +1022,201 @@ def neural_mcmc(
     print(
         f"Steps: {steps:6d} A_r={accepted / steps * 100:2.2f}%\nE={energies.mean() / spins:2.6f} \u00B1 {(energies / spins).std(ddof=1) / math.sqrt(steps):2.6f}  [\u03C3={(energies / spins).std(ddof=1):2.6f}  E_min={energies.min() / spins:2.6f}]"
     )
+
+
+def _sequential_chains(
+    log_probs: np.ndarray,
+    engs: np.ndarray,
+    betas: np.ndarray,
+    start: int,
+    disable_bar: bool,
+) -> Iterator[Tuple[int, np.ndarray, int]]:
+    """Chains of independent_mh_betas one beta after the other, keeping a single
+    chain in memory. Each chain is overwritten by the next one."""
+    uniforms = np.empty((1, log_probs.shape[0]))
+    chain = np.empty((1, log_probs.shape[0]), dtype=np.int64)
+    for b in tqdm(range(betas.shape[0]), disable=disable_bar):
+        uniforms[0] = np.random.random_sample(log_probs.shape[0])
+        accepted = independent_mh_betas(
+            log_probs, engs, betas[b : b + 1], uniforms, chain, start
+        )
+        yield b, chain[0], accepted[0]
+
+
+def neural_mcmc_betas(
+    betas: List[float],
+    steps: int,
+    path: Union[str, Dict[str, np.ndarray]],
+    couplings_path: str,
+    model: str,
+    batch_size: int = 20000,
+    verbose: bool = False,
+    save: bool = False,
+    save_every: int = 1,
+    disable_bar: bool = False,
+    energy_backend: str = "auto",
+    cache_size: int = 0,
+    parallel: bool = False,
+) -> Dict[int, Tuple[np.ndarray, np.ndarray, float]]:
+    """Neural MCMC at several temperatures from a single pool of proposals.
+    Independent proposals do not depend on the temperature, so they are generated
+    and scored once, then a chain runs over the whole pool for each beta.
+    With the same seed, each chain matches a call of neural_mcmc in the order of betas.
+
+    Args:
+        betas (List[float]): Inverse temperatures.
+        steps (int): Monte Carlo simulation steps.
+        path (Union[str, Dict[str, np.ndarray]]): Path to the generated sample or path to the model to sample or sample itself.
+        couplings_path (str): Path to the couplings.
+        model (str): Name of the model to use.
+        batch_size (int, optional): Number of parallel cofigurations to generate. Defaults to 20000.
+        verbose (bool, optional): Set True to print information during the simulations. Defaults to False.
+        save (bool, optional): Set True to save data after simulation. Defaults to False.
+        save_every (int): Save every n steps to get uncorrelated data. Defaults to 1.
+        disable_bar(bool, optional): Set True to disable the progress bar. Defaults to False.
+        energy_backend (str, optional): Backend scoring the proposals, see batch_energies. Defaults to 'auto'.
+        cache_size (int, optional): Number of distinct proposals kept in the energy cache, 0 to disable it. Defaults to 0.
+        parallel (bool, optional): Run the chains of all the betas at once on the available cores, instead of one after the other. Defaults to False.
+
+    Raises:
+        ValueError: No proposal with a finite log-probability and energy.
+
+    Returns:
+        Dict[int, Tuple[np.ndarray, np.ndarray, float]]: Sample, energy and acceptance rate of each beta, keyed by its index in betas.
+    """
+    start_time = datetime.now()
+    # generate more data than needed
+    steps = steps * save_every
+    num_proposals = steps - save_every + 1
+    # load data generate by the NN, once for all the betas
+    proposals, log_probs = load_data(
+        path, model=model, steps=steps, batch_size=batch_size, verbose=verbose
+    )
+    assert log_probs.shape[0] > steps - save_every
+
+    # get the dimension of the sample from the data
+    spin_side = proposals[0].shape[-1]
+    spins = spin_side ** 2
+    proposals = np.reshape(proposals, (proposals.shape[0], -1))[:num_proposals]
+    log_probs = np.ascontiguousarray(log_probs[:num_proposals])
+
+    # get neighbourhood and couplings matrix
+    neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
+    # score the pool once
+    cache = get_proposal_cache(spin_side, couplings_path, cache_size)
+    proposal_engs = _proposal_scorer(
+        neighbours, couplings, len_neighbours, energy_backend, cache
+    )(proposals)
+    if cache is not None:
+        print(cache.summary())
+
+    # every chain starts from the first finite proposal of the pool
+    start = first_finite(log_probs, proposal_engs)
+    if start == num_proposals:
+        raise ValueError("No proposal has a finite log-probability and energy")
+    # the uniform numbers are drawn beta after beta, as by consecutive neural_mcmc
+    betas = np.asarray(betas, dtype=np.double)
+    if parallel:
+        uniforms = np.random.random_sample((betas.shape[0], num_proposals))
+        chains = np.empty((betas.shape[0], num_proposals), dtype=np.int64)
+        accepted = independent_mh_betas(
+            log_probs, proposal_engs, betas, uniforms, chains, start
+        )
+        runs = [(b, chains[b], accepted[b]) for b in range(betas.shape[0])]
+    else:
+        runs = _sequential_chains(log_probs, proposal_engs, betas, start, disable_bar)
+
+    results = {}
+    for b, chain, accepted_beta in runs:
+        beta = float(betas[b])
+        print(f"\nPerforming Neural MCMC at beta={beta}")
+        # proposals with NAN do not advance the chain
+        steps_chain = chain[start + 1 :][chain[start + 1 :] >= 0]
+        skipped = num_proposals - 1 - start - steps_chain.shape[0]
+        if start > 0:
+            print(f"NAN in the first {start} proposals, the chain starts after them")
+        if skipped > 0:
+            print(f"NAN in {skipped} proposals, skipped")
+        # save the accepted samples, gathered by index
+        saved = steps_chain[::save_every]
+        samples = np.ascontiguousarray(proposals[saved], dtype=np.int8)
+        energies = proposal_engs[saved]
+        _neural_summary(samples, energies, accepted_beta, steps, spins, beta, save)
+        results[b] = (samples, energies, accepted_beta / steps * 100)
     print(f"Duration {datetime.now() - start_time}")
-    return (samples, energies, accepted / steps * 100)
+    return results
+
+
+def importance_sampling(
+    betas: List[float],
+    num_sample: int,
+    path: Union[str, Dict[str, np.ndarray]],
+    couplings_path: str,
+    model: str,
+    batch_size: int = 20000,
+    verbose: bool = False,
+    save: bool = False,
+    energy_backend: str = "auto",
+    cache_size: int = 0,
+    min_ess_ratio: float = 0.01,
+) -> Dict[str, np.ndarray]:
+    """Estimates the Boltzmann averages at several temperatures by reweighting the
+    proposals of a neural network, without a Markov chain, see importance_estimates.
+    A small effective sample size means the model is too far from the Boltzmann
+    distribution at that temperature, for importance sampling and neural MCMC alike.
+
+    Args:
+        betas (List[float]): Inverse temperatures.
+        num_sample (int): Number of proposals.
+        path (Union[str, Dict[str, np.ndarray]]): Path to the generated sample or path to the model to sample or sample itself.
+        couplings_path (str): Path to the couplings.
+        model (str): Name of the model to use.
+        batch_size (int, optional): Number of parallel cofigurations to generate. Defaults to 20000.
+        verbose (bool, optional): Set verbose prints. Defaults to False.
+        save (bool, optional): Set True to save the estimates. Defaults to False.
+        energy_backend (str, optional): Backend scoring the proposals, see batch_energies. Defaults to 'auto'.
+        cache_size (int, optional): Number of distinct proposals kept in the energy cache, 0 to disable it. Defaults to 0.
+        min_ess_ratio (float, optional): Fraction of the proposals under which the effective sample size is flagged. Defaults to 0.01.
+
+    Returns:
+        Dict[str, np.ndarray]: Estimates of each beta, see importance_estimates.
+    """
+    start_time = datetime.now()
+    proposals, log_probs = load_data(
+        path, model=model, steps=num_sample, batch_size=batch_size, verbose=verbose
+    )
+
+    # get the dimension of the sample from the data
+    spin_side = proposals[0].shape[-1]
+    spins = spin_side ** 2
+    proposals = np.reshape(proposals, (proposals.shape[0], -1))
+
+    # get neighbourhood and couplings matrix
+    neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
+    cache = get_proposal_cache(spin_side, couplings_path, cache_size)
+    proposal_engs = _proposal_scorer(
+        neighbours, couplings, len_neighbours, energy_backend, cache
+    )(proposals)
+
+    print(f"\nImportance sampling of {proposals.shape[0]} proposals")
+    skipped = np.count_nonzero(~(np.isfinite(log_probs) & np.isfinite(proposal_engs)))
+    if skipped > 0:
+        print(f"NAN in {skipped} proposals, skipped")
+    out = importance_estimates(log_probs, proposal_engs, betas, spins)
+    for i, beta in enumerate(out["beta"]):
+        flag = "  low ESS" if out["ess_ratio"][i] < min_ess_ratio else ""
+        print(
+            f"Beta={beta:2.4f}  E={out['energy'][i]:2.6f} \u00B1 {out['energy_err'][i]:2.6f}  [C={out['heat'][i]:2.4f}  F={out['free_energy'][i]:2.6f}]  ESS={out['ess'][i]:.1f} ({out['ess_ratio'][i] * 100:2.2f}%){flag}"
+        )
+
+    if save:
+        filename = f"{str(spins)}spins_{proposals.shape[0]}importance-sampling"
+        print("\nSaving importance sampling output as {0}".format(filename))
+        np.savez(filename, **out)
+    if cache is not None:
+        print(cache.summary())
+    print(f"Duration {datetime.now() - start_time}")
+    return out
 
 
 def hybrid_mcmc(
@@ -290,6 +1232,10 @@ def hybrid_mcmc(
     save: bool = False,
     save_every: int = 1,
     disable_bar: bool = False,
+    energy_backend: str = "auto",
+    cache_size: int = 0,
+    stream: bool = False,
+    queue_size: int = 2,
 ) -> Tuple[np.ndarray, np.ndarray, float]:
     """Hybrid MCMC performs a simulations where it choses with probability
     prob_single a single spin flip step instead of sampling from the neural network.
@@ -307,215 +1253,220 @@ def hybrid_mcmc(
         save (bool, optional): Set True to save data after simulation. Defaults to False.
         save_every (int, optional): Steps to skip before save. Defaults to 1.
         disable_bar (bool, optional): Save the samples after MCMC. Defaults to False.
+        energy_backend (str, optional): Backend scoring the proposals, see batch_energies. Defaults to 'auto'.
+        cache_size (int, optional): Number of distinct proposals kept in the energy cache, 0 to disable it. Defaults to 0.
+        stream (bool, optional): Generate the proposals in a background thread while the chain consumes them, one batch at a time. Defaults to False.
+        queue_size (int, optional): Maximum number of streamed batches waiting in memory. Defaults to 2.
 
     Returns:
         Tuple[np.ndarray, np.ndarray, float]: Sample, energy and acceptance rate.
     """
     start_time = datetime.now()
-    # set a limit to prevent memory/timeout errors
-    MAX_STEPS = 1e7
     # increase steps to avoid correlation
     steps *= save_every
     # load data generate by the NN
     # when sample on-the-fly sample 10% more than expected
-    proposals, log_probs = load_data(
-        path, model, math.ceil(steps * (1.1 - prob_single)), batch_size, verbose
-    )
-
-    # load the model
-    if model_path is not None:
-        model = Made.load_from_checkpoint(model_path)
-    else:
-        model = Made.load_from_checkpoint(path)
-
-    # get the dimension of the sample from the data
-    spin_side = proposals[0].shape[-1]
-    spins = spin_side ** 2
-    proposals = np.reshape(proposals, (proposals.shape[0], -1))
-
-    accepted_log_prob = np.nan
-    # get the first sample and its energy
-    while np.isnan(accepted_log_prob):
-        accepted_sample, accepted_log_prob = proposals[0], log_probs[0]
-
-    # get neighbourhood and couplings matrix
-    neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
-
-    # initialisation
-    energies = []
-    samples = []
-    transition_prob = []
-    log_prob_ratio = []
-    accepted = 1
-    accepted_single = 0
-    accepted_neural = 1
-    type_accepted = "neural"
-    neural_after_single = 0
-
-    # compute the energy of the new configuration
-    accepted_eng = compute_energy(
-        accepted_sample, neighbours, couplings, len_neighbours
+    batches, producer = _open_proposals(
+        path,
+        model,
+        math.ceil(steps * (1.1 - prob_single)),
+        batch_size,
+        verbose,
+        stream,
+        queue_size,
     )
-    # compute boltzmann probability
-    accepted_boltz_log_prob = compute_boltz_prob(accepted_eng, beta, spins)
 
-    print(f"\nPerforming Hybrid MCMC at beta={beta}")
-
-    steps_neural = 1
-    steps_single = 0
-    disable = verbose + disable_bar
-    pbar = tqdm(range(steps - 1), disable=disable)
-    for step in pbar:
-        # take the sample from the neural network with desired prob
-        if np.random.uniform() <= (1 - prob_single):
-            trial_sample, trial_log_prob = (
-                proposals[steps_neural],
-                log_probs[steps_neural],
-            )
-            if not np.isfinite(trial_log_prob):
-                print("NAN in trial_log_prob")
-                continue
-
-            steps_neural += 1
-            # flag to count accepted sample from the model
-            neural = True
-            # compute sample's configuration
-            trial_eng = compute_energy(
-                trial_sample, neighbours, couplings, len_neighbours
-            )
-            if not np.isfinite(trial_eng):
-                print("NAN in trial_eng")
-                continue
-            # compute Boltzmann probability
-            trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
-            if not np.isfinite(trial_boltz_log_prob):
-                print("NAN in trial_boltz_log_prob")
-                continue
+    try:
+        # load the model
+        if model_path is not None:
+            model = Made.load_from_checkpoint(model_path)
         else:
-            # try a single spin flip move
-            k = np.random.randint(0, spins)
-            trial_sample = accepted_sample.copy()
-            trial_sample[k] *= -1
-            steps_single += 1
-            neural = False
-            # Metropolis-Hastings algorithm https://doi.org/10.2307/2334940
-            deltah = compute_delta_h(
-                k,
-                accepted_sample,
-                neighbours[k].astype(int),
-                couplings[k],
-                len_neighbours[k],
-            )
-            # compute energy using delta energy
-            trial_eng = accepted_eng + deltah
-            if not np.isfinite(trial_eng):
-                print("NAN in trial_eng")
-                continue
-            # compute prob via the trained model
-            # model accepts as input x in {0,1}
-            trial_log_prob = (
-                model.forward(torch.from_numpy((trial_sample + 1) / 2).float())
-                .detach()
-                .numpy()
-            )
-            if not np.isfinite(trial_log_prob):
-                print("NAN in trial_log_prob")
-                continue
-            # compute Boltzmann probability
-            trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
-            if not np.isfinite(trial_boltz_log_prob):
-                print("NAN in trial_boltz_log_prob")
-                continue
-
-        if np.sum(np.abs(trial_sample - accepted_sample)) == 2:
-            # if the samples differ only for a spin,
-            # we compute the entire acceptance ratio
-            log_prob_reverse_moving = np.log(
-                prob_single / spins
-                + (1 - prob_single) * np.exp(np.longdouble(accepted_log_prob))
-            )
-            if not np.isfinite(log_prob_reverse_moving):
-                print("NAN in log_prob_reverse_moving")
-                continue
-
-            log_prob_moving = np.log(
-                prob_single / spins
-                + (1 - prob_single) * np.exp(np.longdouble(trial_log_prob))
-            )
-            if not np.isfinite(log_prob_moving):
-                print("NAN in log_prob_moving")
-                continue
-
-            # get the transition probability
-            log_prob_ratio.append(
-                +trial_boltz_log_prob
-                - accepted_boltz_log_prob
-                + log_prob_reverse_moving
-                - log_prob_moving
-            )
-        else:
-            log_prob_ratio.append(
-                +trial_boltz_log_prob
-                - accepted_boltz_log_prob
-                + accepted_log_prob
-                - trial_log_prob
-            )
+            model = Made.load_from_checkpoint(path)
+
+        # get the dimension of the sample from the first batch
+        first_batch = next(batches)
+        spin_side = first_batch[0][0].shape[-1]
+        spins = spin_side ** 2
+
+        # get neighbourhood and couplings matrix
+        neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
+        # proposals are scored one batch at a time
+        cache = get_proposal_cache(spin_side, couplings_path, cache_size)
+        proposals = ProposalStream(
+            itertools.chain([first_batch], batches),
+            _proposal_scorer(neighbours, couplings, len_neighbours, energy_backend, cache),
+        )
 
-        if not np.isfinite(log_prob_ratio[step]):
-            print("NAN in prob_ratio")
-            continue
-        transition_prob.append(min(0.0, log_prob_ratio[step]))
-
-        if transition_prob[step] >= 0.0 or (
-            np.log(np.random.random_sample()) < transition_prob[step]
-        ):
-            # update energy, prob and sample
-            accepted_eng = np.copy(trial_eng)
-            accepted_log_prob = np.copy(trial_log_prob)
-            accepted_sample = np.copy(trial_sample)
-            accepted_boltz_log_prob = np.copy(trial_boltz_log_prob)
-            # count mix steps
-            if type_accepted == "single" and neural:
-                neural_after_single += 1
-            type_accepted = "neural" if neural else "single"
-
-            if neural:
-                accepted_neural += 1
+        accepted_log_prob = np.nan
+        # get the first sample and its energy
+        while np.isnan(accepted_log_prob):
+            accepted_sample, accepted_log_prob, accepted_eng = proposals.get(0)
+
+        # initialisation
+        # only every save_every steps of the chain are stored
+        buffer = SampleBuffer(math.ceil((steps - 1) / save_every), spins)
+        transition_probs = np.empty(steps - 1, dtype=np.double)
+        chain_len = 0
+        accepted = 1
+        accepted_single = 0
+        accepted_neural = 1
+        type_accepted = "neural"
+        neural_after_single = 0
+
+        # compute boltzmann probability
+        accepted_boltz_log_prob = compute_boltz_prob(accepted_eng, beta, spins)
+
+        print(f"\nPerforming Hybrid MCMC at beta={beta}")
+
+        steps_neural = 1
+        steps_single = 0
+        disable = verbose + disable_bar
+        pbar = tqdm(range(steps - 1), disable=disable)
+        for step in pbar:
+            # take the sample from the neural network with desired prob
+            if np.random.uniform() <= (1 - prob_single):
+                trial_sample, trial_log_prob, trial_eng = proposals.get(steps_neural)
+                if not np.isfinite(trial_log_prob):
+                    print("NAN in trial_log_prob")
+                    continue
+
+                steps_neural += 1
+                # flag to count accepted sample from the model
+                neural = True
+                if not np.isfinite(trial_eng):
+                    print("NAN in trial_eng")
+                    continue
+                # compute Boltzmann probability
+                trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
+                if not np.isfinite(trial_boltz_log_prob):
+                    print("NAN in trial_boltz_log_prob")
+                    continue
             else:
-                accepted_single += 1
-            accepted += 1
-
-        pbar.update()
-        pbar.set_description(f"eng: {accepted_eng / spins:2.5f}", refresh=False)
-
-        # save acceped sample and its energy
-        samples.append(accepted_sample)
-        energies.append(accepted_eng)
+                # try a single spin flip move
+                k = np.random.randint(0, spins)
+                trial_sample = accepted_sample.copy()
+                trial_sample[k] *= -1
+                steps_single += 1
+                neural = False
+                # Metropolis-Hastings algorithm https://doi.org/10.2307/2334940
+                deltah = compute_delta_h(
+                    k,
+                    accepted_sample,
+                    neighbours[k].astype(int),
+                    couplings[k],
+                    len_neighbours[k],
+                )
+                # compute energy using delta energy
+                trial_eng = accepted_eng + deltah
+                if not np.isfinite(trial_eng):
+                    print("NAN in trial_eng")
+                    continue
+                # compute prob via the trained model
+                # model accepts as input x in {0,1}
+                trial_log_prob = (
+                    model.forward(torch.from_numpy((trial_sample + 1) / 2).float())
+                    .detach()
+                    .numpy()
+                )
+                if not np.isfinite(trial_log_prob):
+                    print("NAN in trial_log_prob")
+                    continue
+                # compute Boltzmann probability
+                trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
+                if not np.isfinite(trial_boltz_log_prob):
+                    print("NAN in trial_boltz_log_prob")
+                    continue
+
+            if np.sum(np.abs(trial_sample - accepted_sample)) == 2:
+                # if the samples differ only for a spin,
+                # we compute the entire acceptance ratio
+                log_prob_reverse_moving = np.log(
+                    prob_single / spins
+                    + (1 - prob_single) * np.exp(np.longdouble(accepted_log_prob))
+                )
+                if not np.isfinite(log_prob_reverse_moving):
+                    print("NAN in log_prob_reverse_moving")
+                    continue
 
-        if verbose:
-            if neural:
-                print(
-                    f"{step+1:6d}  neural  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob[step]:2.4f}"
+                log_prob_moving = np.log(
+                    prob_single / spins
+                    + (1 - prob_single) * np.exp(np.longdouble(trial_log_prob))
+                )
+                if not np.isfinite(log_prob_moving):
+                    print("NAN in log_prob_moving")
+                    continue
+
+                # get the transition probability
+                log_prob_ratio = (
+                    +trial_boltz_log_prob
+                    - accepted_boltz_log_prob
+                    + log_prob_reverse_moving
+                    - log_prob_moving
                 )
             else:
-                # update mean and std of energies for print
-                print(
-                    f"{step+1:6d}  single  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob[step]:2.4f}"
+                log_prob_ratio = (
+                    +trial_boltz_log_prob
+                    - accepted_boltz_log_prob
+                    + accepted_log_prob
+                    - trial_log_prob
                 )
-        if step > MAX_STEPS:
-            print("Steps limit")
-            break
 
-    avg_eng, std_eng = np.asarray(energies).mean(), np.asarray(energies).std(ddof=1)
-    samples = np.asarray(samples).astype("int8")[::save_every, ...]
-    energies = np.asarray(energies).astype(np.double)[::save_every]
+            if not np.isfinite(log_prob_ratio):
+                print("NAN in prob_ratio")
+                continue
+            transition_prob = min(0.0, log_prob_ratio)
+            transition_probs[chain_len] = transition_prob
+
+            if transition_prob >= 0.0 or (
+                np.log(np.random.random_sample()) < transition_prob
+            ):
+                # update energy, prob and sample
+                accepted_eng = np.copy(trial_eng)
+                accepted_log_prob = np.copy(trial_log_prob)
+                accepted_sample = np.copy(trial_sample)
+                accepted_boltz_log_prob = np.copy(trial_boltz_log_prob)
+                # count mix steps
+                if type_accepted == "single" and neural:
+                    neural_after_single += 1
+                type_accepted = "neural" if neural else "single"
+
+                if neural:
+                    accepted_neural += 1
+                else:
+                    accepted_single += 1
+                accepted += 1
+
+            pbar.update()
+            pbar.set_description(f"eng: {accepted_eng / spins:2.5f}", refresh=False)
+
+            # save acceped sample and its energy
+            if chain_len % save_every == 0:
+                buffer.append(accepted_sample, accepted_eng)
+            chain_len += 1
+
+            if verbose:
+                if neural:
+                    print(
+                        f"{step+1:6d}  neural  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob:2.4f}"
+                    )
+                else:
+                    # update mean and std of energies for print
+                    print(
+                        f"{step+1:6d}  single  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob:2.4f}"
+                    )
+    finally:
+        if producer is not None:
+            producer.close()
+
+    samples, energies = buffer.samples, buffer.energies
+    avg_eng, std_eng = energies.mean(), energies.std(ddof=1)
     if save:
         filename = f"{str(spins)}spins_beta{beta}_{steps+1}hybrid-mcmc_single_prob{prob_single}"
         out = {
             "accepted": accepted,
             "avg_eng": avg_eng,
             "std_eng": std_eng,
-            "trans_prob": transition_prob,
+            "trans_prob": transition_probs[:chain_len],
             "sample": samples,
             "energy": energies,
         }
@@ -532,6 +1483,8 @@ def hybrid_mcmc(
         f"Steps: {step + 1:6d}  A_r={accepted / steps * 100:2.2f}%  E={avg_eng / spins:2.6f} \u00B1 {std_eng / spins / math.sqrt(step+1):2.6f}  [\u03C3={std_eng / spins:2.6f}  E_min={energies.min() / spins:2.6f}]"
     )
     print(f"Accepted Neural after Single {neural_after_single}")
+    if cache is not None:
+        print(cache.summary())
     print(f"Duration {datetime.now() - start_time}\n")
     return (samples, energies, accepted / steps * 100)
 
@@ -549,6 +1502,10 @@ def seq_hybrid_mcmc(
     save: bool = False,
     save_every: int = 1,
     disable_bar: bool = False,
+    energy_backend: str = "auto",
+    cache_size: int = 0,
+    stream: bool = False,
+    queue_size: int = 2,
 ) -> Tuple[np.ndarray, np.ndarray, float]:
     """Sequential Hybrid MCMC performs a simulations where two simulation,
     one neural and the one single spin flip, merged together sequentially.
@@ -566,190 +1523,191 @@ def seq_hybrid_mcmc(
         save (bool, optional):  Set True to save data after simulation. Defaults to False.
         save_every (int, optional): Save every n steps to get uncorrelated data. Defaults to 1.
         disable_bar (bool, optional): Set True to disable the progress bar. Defaults to False.
+        energy_backend (str, optional): Backend scoring the proposals, see batch_energies. Defaults to 'auto'.
+        cache_size (int, optional): Number of distinct proposals kept in the energy cache, 0 to disable it. Defaults to 0.
+        stream (bool, optional): Generate the proposals in a background thread while the chain consumes them, one batch at a time. Defaults to False.
+        queue_size (int, optional): Maximum number of streamed batches waiting in memory. Defaults to 2.
 
     Returns:
         Tuple[np.ndarray, np.ndarray, float]: Sample, energy and acceptance rate.
     """
 
     start_time = datetime.now()
-    # set a limit to prevent memory/timeout errors
-    MAX_STEPS = 1e10
     # increase steps to avoid correlation
     steps *= save_every
     # load data generate by the NN
     # when sample on-the-fly sample 10% more than expected
-    proposals, log_probs = load_data(
-        path, model, math.ceil(steps / len_seq_single) + 1, batch_size, verbose
+    batches, producer = _open_proposals(
+        path,
+        model,
+        math.ceil(steps / len_seq_single) + 1,
+        batch_size,
+        verbose,
+        stream,
+        queue_size,
     )
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-
-    # load the model
-    if model_path is not None:
-        model = Made.load_from_checkpoint(model_path).to(device)
-    else:
-        model = Made.load_from_checkpoint(path).to(device)
-
-    # get the dimension of the sample from the data
-    spin_side = proposals[0].shape[-1]
-    spins = spin_side ** 2
-    proposals = np.reshape(proposals, (proposals.shape[0], -1))
-
-    accepted_log_prob = np.nan
-    # get the first sample and its energy
-    while np.isnan(accepted_log_prob):
-        accepted_sample, accepted_log_prob = proposals[0], log_probs[0]
-
-    # get neighbourhood and couplings matrix
-    neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
-
-    # initialisation
-    energies = []
-    samples = []
-    accepted = 1
-    accepted_single = 0
-    accepted_neural = 1
-    type_accepted = "neural"
-    neural_after_single = 0
-
-    # compute the energy of the new configuration
-    accepted_eng = compute_energy(
-        accepted_sample, neighbours, couplings, len_neighbours
-    )
-    # compute boltzmann probability
-    accepted_boltz_log_prob = compute_boltz_prob(accepted_eng, beta, spins)
-
-    print(f"\nPerforming Sequential Hybrid MCMC at beta={beta}")
-
-    steps_neural = 1
-    steps_single = 0
-    disable = verbose + disable_bar
-    pbar = tqdm(range(steps - 1), disable=disable)
-    for step in pbar:
-        # take the sample from the neural network with desired prob
-        if step % len_seq_single == 0:
-            trial_sample, trial_log_prob = (
-                proposals[steps_neural],
-                log_probs[steps_neural],
-            )
-            if not np.isfinite(trial_log_prob):
-                print("NAN in trial_log_prob")
-                continue
-
-            # compute prob of the old accepted sample
-            # via the trained model
-            # model accepts input in {0,1}
-            accepted_log_prob = (
-                model.forward(
-                    torch.from_numpy((accepted_sample + 1) / 2).float().to(device)
-                )
-                .detach()
-                .cpu()
-                .numpy()
-            )
-            if not np.isfinite(trial_log_prob):
-                print("NAN in trial_log_prob")
-                continue
-
-            steps_neural += 1
-            # flag to count accepted sample from the model
-            neural = True
-            # compute sample's configuration
-            trial_eng = compute_energy(
-                trial_sample, neighbours, couplings, len_neighbours
-            )
-            if not np.isfinite(trial_eng):
-                print("NAN in trial_eng")
-                continue
-            # compute Boltzmann probability
-            trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
-            if not np.isfinite(trial_boltz_log_prob):
-                print("NAN in trial_boltz_log_prob")
-                continue
+    try:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
 
-            # compute log prob ratio
-            # for single -> neural
-            log_prob_ratio = (
-                trial_boltz_log_prob
-                - accepted_boltz_log_prob
-                + accepted_log_prob
-                - trial_log_prob
-            )
+        # load the model
+        if model_path is not None:
+            model = Made.load_from_checkpoint(model_path).to(device)
         else:
-            # try a single spin flip move
-            k = np.random.randint(0, spins)
-            trial_sample = accepted_sample.copy()
-            trial_sample[k] *= -1
-            # update count
-            steps_single += 1
-            neural = False
-            # Metropolis-Hastings algorithm https://doi.org/10.2307/2334940
-            deltah = compute_delta_h(
-                k,
-                accepted_sample,
-                neighbours[k].astype(int),
-                couplings[k],
-                len_neighbours[k],
-            )
-            # compute energy using delta energy
-            trial_eng = accepted_eng + deltah
-            if not np.isfinite(trial_eng):
-                print("NAN in trial_eng")
-                continue
-
-            # compute Boltzmann probability
-            trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
-            if not np.isfinite(trial_boltz_log_prob):
-                print("NAN in trial_boltz_log_prob")
-                continue
-
-            # get the transition probability
-            log_prob_ratio = trial_boltz_log_prob - accepted_boltz_log_prob
-
-        transition_prob = min(0.0, log_prob_ratio)
-
-        if transition_prob >= 0.0 or (
-            np.log(np.random.random_sample()) < transition_prob
-        ):
-            # update energy, prob and sample
-            accepted_eng = np.copy(trial_eng)
-            accepted_log_prob = np.copy(trial_log_prob)
-            accepted_sample = np.copy(trial_sample)
-            accepted_boltz_log_prob = np.copy(trial_boltz_log_prob)
-            # count mix steps
-            if type_accepted == "single" and neural:
-                neural_after_single += 1
-            type_accepted = "neural" if neural else "single"
-
-            if neural:
-                accepted_neural += 1
-            else:
-                accepted_single += 1
-            accepted += 1
-
-        pbar.update()
-        pbar.set_description(f"eng: {accepted_eng / spins:2.5f}", refresh=False)
-
-        if step % save_every == 0:
-            # save acceped sample and its energy
-            samples.append(accepted_sample)
-            energies.append(accepted_eng)
+            model = Made.load_from_checkpoint(path).to(device)
+
+        # get the dimension of the sample from the first batch
+        first_batch = next(batches)
+        spin_side = first_batch[0][0].shape[-1]
+        spins = spin_side ** 2
+
+        # get neighbourhood and couplings matrix
+        neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
+        # proposals are scored one batch at a time
+        cache = get_proposal_cache(spin_side, couplings_path, cache_size)
+        proposals = ProposalStream(
+            itertools.chain([first_batch], batches),
+            _proposal_scorer(neighbours, couplings, len_neighbours, energy_backend, cache),
+        )
 
-        if verbose:
-            if neural:
-                print(
-                    f"{step+1:6d}  neural  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob:2.4f}"
+        accepted_log_prob = np.nan
+        # get the first sample and its energy
+        while np.isnan(accepted_log_prob):
+            accepted_sample, accepted_log_prob, accepted_eng = proposals.get(0)
+
+        # initialisation
+        buffer = SampleBuffer(math.ceil((steps - 1) / save_every), spins)
+        accepted = 1
+        accepted_single = 0
+        accepted_neural = 1
+        type_accepted = "neural"
+        neural_after_single = 0
+
+        # compute boltzmann probability
+        accepted_boltz_log_prob = compute_boltz_prob(accepted_eng, beta, spins)
+
+        print(f"\nPerforming Sequential Hybrid MCMC at beta={beta}")
+
+        steps_neural = 1
+        steps_single = 0
+        disable = verbose + disable_bar
+        pbar = tqdm(range(steps - 1), disable=disable)
+        for step in pbar:
+            # take the sample from the neural network with desired prob
+            if step % len_seq_single == 0:
+                trial_sample, trial_log_prob, trial_eng = proposals.get(steps_neural)
+                if not np.isfinite(trial_log_prob):
+                    print("NAN in trial_log_prob")
+                    continue
+
+                # compute prob of the old accepted sample
+                # via the trained model
+                # model accepts input in {0,1}
+                accepted_log_prob = (
+                    model.forward(
+                        torch.from_numpy((accepted_sample + 1) / 2).float().to(device)
+                    )
+                    .detach()
+                    .cpu()
+                    .numpy()
+                )
+                if not np.isfinite(trial_log_prob):
+                    print("NAN in trial_log_prob")
+                    continue
+
+                steps_neural += 1
+                # flag to count accepted sample from the model
+                neural = True
+                if not np.isfinite(trial_eng):
+                    print("NAN in trial_eng")
+                    continue
+                # compute Boltzmann probability
+                trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
+                if not np.isfinite(trial_boltz_log_prob):
+                    print("NAN in trial_boltz_log_prob")
+                    continue
+
+                # compute log prob ratio
+                # for single -> neural
+                log_prob_ratio = (
+                    trial_boltz_log_prob
+                    - accepted_boltz_log_prob
+                    + accepted_log_prob
+                    - trial_log_prob
                 )
             else:
-                print(
-                    f"{step+1:6d}  single  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob:2.4f}"
+                # try a single spin flip move
+                k = np.random.randint(0, spins)
+                trial_sample = accepted_sample.copy()
+                trial_sample[k] *= -1
+                # update count
+                steps_single += 1
+                neural = False
+                # Metropolis-Hastings algorithm https://doi.org/10.2307/2334940
+                deltah = compute_delta_h(
+                    k,
+                    accepted_sample,
+                    neighbours[k].astype(int),
+                    couplings[k],
+                    len_neighbours[k],
                 )
-        if step > MAX_STEPS:
-            print("Steps limit")
-            break
+                # compute energy using delta energy
+                trial_eng = accepted_eng + deltah
+                if not np.isfinite(trial_eng):
+                    print("NAN in trial_eng")
+                    continue
+
+                # compute Boltzmann probability
+                trial_boltz_log_prob = compute_boltz_prob(trial_eng, beta, spins)
+                if not np.isfinite(trial_boltz_log_prob):
+                    print("NAN in trial_boltz_log_prob")
+                    continue
+
+                # get the transition probability
+                log_prob_ratio = trial_boltz_log_prob - accepted_boltz_log_prob
+
+            transition_prob = min(0.0, log_prob_ratio)
+
+            if transition_prob >= 0.0 or (
+                np.log(np.random.random_sample()) < transition_prob
+            ):
+                # update energy, prob and sample
+                accepted_eng = np.copy(trial_eng)
+                accepted_log_prob = np.copy(trial_log_prob)
+                accepted_sample = np.copy(trial_sample)
+                accepted_boltz_log_prob = np.copy(trial_boltz_log_prob)
+                # count mix steps
+                if type_accepted == "single" and neural:
+                    neural_after_single += 1
+                type_accepted = "neural" if neural else "single"
+
+                if neural:
+                    accepted_neural += 1
+                else:
+                    accepted_single += 1
+                accepted += 1
 
-    samples = np.asarray(samples).astype(np.int8)
-    energies = np.asarray(energies).astype(np.double)
+            pbar.update()
+            pbar.set_description(f"eng: {accepted_eng / spins:2.5f}", refresh=False)
+
+            if step % save_every == 0:
+                # save acceped sample and its energy
+                buffer.append(accepted_sample, accepted_eng)
+
+            if verbose:
+                if neural:
+                    print(
+                        f"{step+1:6d}  neural  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob:2.4f}"
+                    )
+                else:
+                    print(
+                        f"{step+1:6d}  single  {accepted_eng/spins:2.4f}  {trial_eng/spins:2.4f}  {accepted_log_prob:3.2f}  {trial_log_prob:3.2f}  {accepted_boltz_log_prob:4.2f}  {trial_boltz_log_prob:4.2f}  {transition_prob:2.4f}"
+                    )
+    finally:
+        if producer is not None:
+            producer.close()
+
+    samples, energies = buffer.samples, buffer.energies
     avg_eng = energies.mean()
     err_eng = energies.std(ddof=1) / math.sqrt(energies.shape[0])
     if save:
@@ -771,6 +1729,8 @@ def seq_hybrid_mcmc(
         f"Steps: {step + 2:6d}  A_r={accepted / steps * 100:2.2f}%  E={avg_eng / spins:2.6f} \u00B1 {err_eng / spins:2.6f}  [\u03C3={energies.std(ddof=1) / spins:2.6f}  E_min={energies.min() / spins:2.6f}]"
     )
     print(f"Accepted Neural after Single {neural_after_single}")
+    if cache is not None:
+        print(cache.summary())
     print(f"Duration {datetime.now() - start_time}\n")
     return (samples, energies, accepted / steps * 100)
 
@@ -814,15 +1774,13 @@ def gibbs_rbm(
     neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
 
     # initialisation
-    energies = []
-    samples = []
+    buffer = SampleBuffer(steps, spins)
+    eng_sum, eng_sq_sum = 0.0, 0.0
     hamming_dist_sum = 0
     # start with a random sample
     accepted_sample = torch.bernoulli(torch.ones(spins, device=device) * 0.5)
 
     disable = verbose + disable_bar
-    # reduce correlation
-    steps *= save_every
     pbar = tqdm(range(steps), disable=disable)
     for step in pbar:
         h = model._to_hidden(accepted_sample)
@@ -841,28 +1799,29 @@ def gibbs_rbm(
         accepted_sample = sample
         if step % save_every == 0:
             sample = sample.detach().cpu().numpy() * 2 - 1
-            samples.append(sample)
-            energies.append(
-                compute_energy(
-                    sample,
-                    neighbours,
-                    couplings,
-                    len_neighbours,
-                )
+            eng = compute_energy(
+                sample,
+                neighbours,
+                couplings,
+                len_neighbours,
             )
+            buffer.append(sample, eng)
+            # running moments for the progress bar
+            eng_sum += eng
+            eng_sq_sum += eng ** 2
 
+        mean_eng = eng_sum / len(buffer)
         pbar.set_postfix(
             {
-                "eng": np.asarray(energies).mean() / spins,
-                "err": np.asarray(energies).std()
-                / math.sqrt(len(energies))
+                "eng": mean_eng / spins,
+                "err": math.sqrt(max(eng_sq_sum / len(buffer) - mean_eng ** 2, 0.0))
+                / math.sqrt(len(buffer))
                 / spins ** 2,
                 "hamming": hamming_dist_sum / (step + 1),
             }
         )
 
-    samples = np.asarray(samples).astype("int8")
-    energies = np.asarray(energies).astype(np.float)
+    samples, energies = buffer.samples, buffer.energies
     if save:
         filename = f"{str(spins)}spins_beta{beta}_{math.ceil(steps/save_every)}rbm-{path.parts[-4]}_{path.parts[-3]}-mcmc"
         out = {
@@ -916,11 +1875,13 @@ def exchange_rbm(
     spin_side = int(math.sqrt(spins))
     neighbours, couplings, len_neighbours = get_couplings(spin_side, couplings_path)
 
+    # reduce correlation
+    steps *= save_every
+
     # initialisation
-    energies_rbm = []
-    samples_rbm = []
-    energies_single = []
-    samples_single = []
+    # one saved step every save_every
+    buffer_rbm = SampleBuffer(math.ceil(steps / save_every), spins)
+    buffer_single = SampleBuffer(math.ceil(steps / save_every), spins)
     accepted = 0
     swap = 0
 
@@ -934,8 +1895,6 @@ def exchange_rbm(
     # print(eng_single)
 
     disable = verbose + disable_bar
-    # reduce correlation
-    steps *= save_every
     pbar = tqdm(range(steps), disable=disable)
     for step in pbar:
         # single spin flip step
@@ -968,10 +1927,8 @@ def exchange_rbm(
         )
 
         if step % save_every == 0:
-            samples_rbm.append(sample_rbm.detach().numpy() * 2 - 1)
-            energies_rbm.append(eng_rbm)
-            samples_single.append(sample_single.copy())
-            energies_single.append(eng_single)
+            buffer_rbm.append(sample_rbm.detach().numpy() * 2 - 1, eng_rbm)
+            buffer_single.append(sample_single, eng_single)
 
         boltz_log_prob_single = compute_boltz_prob(eng_single, beta, spins)
         boltz_log_prob_rbm = compute_boltz_prob(eng_rbm, beta, spins)
@@ -1004,15 +1961,13 @@ def exchange_rbm(
 
         pbar.set_postfix(
             {
-                "eng-single": energies_single[-1] / spins,
-                "eng-rbm": energies_rbm[-1] / spins,
+                "eng-single": buffer_single.energies[-1] / spins,
+                "eng-rbm": buffer_rbm.energies[-1] / spins,
             }
         )
 
-    samples_single = np.asarray(samples_single).astype("int8")
-    energies_single = np.asarray(energies_single).astype(np.float)
-    samples_rbm = np.asarray(samples_rbm).astype("int8")
-    energies_rbm = np.asarray(energies_rbm).astype(np.float)
+    samples_single, energies_single = buffer_single.samples, buffer_single.energies
+    energies_rbm = buffer_rbm.energies
     if save:
         filename = f"{str(spins)}spins_beta{beta}_{math.ceil(steps/save_every)}rbm{path.parts[-4]}_{path.parts[-3]}-single-mcmc"
         out = {
@@ -0,0 +1,275 @@
+import math
+from typing import Optional
+
+import numpy as np
+from numba import jit
+
+# a word holds one spin of 64 replicas, bit set for spin -1
+LANES = 64
+# bits of precision of the acceptance probabilities
+PROB_BITS = 32
+
+ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def pm_j_magnitude(couplings: np.ndarray, len_neighbours: np.ndarray) -> Optional[float]:
+    """Magnitude J of the couplings if the instance is ±J.
+
+    Args:
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        Optional[float]: Magnitude of the couplings, None if they are not all ±J.
+    """
+    mask = np.arange(couplings.shape[1]) < len_neighbours[:, None]
+    magnitudes = np.abs(couplings[mask])
+    if magnitudes.size == 0 or not np.all(magnitudes == magnitudes[0]):
+        return None
+    return float(magnitudes[0])
+
+
+def pack_spins(samples: np.ndarray) -> np.ndarray:
+    """Pack the replicas in words of 64 bits, bit r of word (w, i) is set
+    if spin i of replica 64 * w + r is -1.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1} of shape (replicas, spins).
+
+    Returns:
+        np.ndarray: Packed spins of shape (ceil(replicas / 64), spins).
+    """
+    replicas, spins = samples.shape
+    num_words = -(-replicas // LANES)
+    bits = np.zeros((num_words * LANES, spins), dtype=np.uint64)
+    bits[:replicas] = samples < 0
+    bits = bits.reshape(num_words, LANES, spins)
+    shifts = np.arange(LANES, dtype=np.uint64)[None, :, None]
+    return np.bitwise_or.reduce(bits << shifts, axis=1)
+
+
+def unpack_spins(words: np.ndarray, replicas: int) -> np.ndarray:
+    """Inverse of pack_spins.
+
+    Args:
+        words (np.ndarray): Packed spins of shape (ceil(replicas / 64), spins).
+        replicas (int): Number of replicas.
+
+    Returns:
+        np.ndarray: Spin configurations in {-1,+1} of shape (replicas, spins), as int8.
+    """
+    shifts = np.arange(LANES, dtype=np.uint64)[None, :, None]
+    bits = (words[:, None, :] >> shifts) & np.uint64(1)
+    bits = bits.reshape(-1, words.shape[1])[:replicas]
+    return (1 - 2 * bits).astype(np.int8)
+
+
+def sign_masks(couplings: np.ndarray) -> np.ndarray:
+    """Words with all the bits set for the negative couplings.
+
+    Args:
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+
+    Returns:
+        np.ndarray: Masks of the same shape of the couplings.
+    """
+    return np.where(couplings < 0, ONES, np.uint64(0)).astype(np.uint64)
+
+
+def acceptance_table(beta: float, magnitude: float, max_neighbours: int) -> np.ndarray:
+    """Metropolis acceptance probabilities of a single spin flip, as integers
+    of PROB_BITS bits. Flipping a spin with z neighbours, m of which have an
+    unsatisfied bond s_i J_ij s_j < 0, changes the energy by 2 J (2 m - z).
+
+    Args:
+        beta (float): Inverse temperature.
+        magnitude (float): Magnitude of the ±J couplings.
+        max_neighbours (int): Maximum number of neighbours.
+
+    Returns:
+        np.ndarray: Probabilities indexed by (z, m).
+    """
+    table = np.zeros((max_neighbours + 1, max_neighbours + 1), dtype=np.uint64)
+    for z in range(max_neighbours + 1):
+        for m in range(z + 1):
+            deltah = 2.0 * magnitude * (2 * m - z)
+            prob = min(1.0, math.exp(-beta * deltah))
+            table[z, m] = min(int(prob * 2**PROB_BITS), 2**PROB_BITS)
+    return table
+
+
+@jit(nopython=True)
+def xorshift(state: np.ndarray) -> np.uint64:
+    """xorshift64* generator, https://doi.org/10.18637/jss.v008.i14.
+
+    Args:
+        state (np.ndarray): Generator state, a single nonzero uint64 updated in place.
+
+    Returns:
+        np.uint64: 64 random bits.
+    """
+    x = state[0]
+    x ^= x >> np.uint64(12)
+    x ^= x << np.uint64(25)
+    x ^= x >> np.uint64(27)
+    state[0] = x
+    return x * np.uint64(0x2545F4914F6CDD1D)
+
+
+@jit(nopython=True)
+def bernoulli_word(prob: np.uint64, state: np.ndarray) -> np.uint64:
+    """64 independent bits, each set with probability prob / 2**PROB_BITS.
+    The bits of prob are consumed from the least significant one, at each
+    step the probability of a set bit becomes (bit + p) / 2.
+
+    Args:
+        prob (np.uint64): Probability as an integer of PROB_BITS bits.
+        state (np.ndarray): Generator state.
+
+    Returns:
+        np.uint64: Random word.
+    """
+    if prob >= np.uint64(1) << np.uint64(PROB_BITS):
+        return ONES
+    word = np.uint64(0)
+    for b in range(PROB_BITS):
+        if (prob >> np.uint64(b)) & np.uint64(1):
+            word |= xorshift(state)
+        else:
+            word &= xorshift(state)
+    return word
+
+
+@jit(nopython=True)
+def popcount(x: np.uint64) -> int:
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + (
+        (x >> np.uint64(2)) & np.uint64(0x3333333333333333)
+    )
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return int((x * np.uint64(0x0101010101010101)) >> np.uint64(56))
+
+
+@jit(nopython=True)
+def multispin_sweep(
+    words: np.ndarray,
+    lanes: np.ndarray,
+    signs: np.ndarray,
+    neighbours: np.ndarray,
+    len_neighbours: np.ndarray,
+    table: np.ndarray,
+    num_flips: int,
+) -> int:
+    """Metropolis single spin flip attempts on 64 replicas per word. For each attempt
+    a random site is chosen, the unsatisfied bonds of every replica are counted with
+    a bit-sliced adder and the flips are accepted lane by lane with the acceptance
+    table. Every replica draws its own acceptance bits, but the sequence of sites is
+    shared by the 64 replicas of a word, so they are correlated chains, each with the
+    correct stationary distribution. Words are updated in place.
+
+    Args:
+        words (np.ndarray): Packed spins, see pack_spins.
+        lanes (np.ndarray): Mask of the replicas in use of each word.
+        signs (np.ndarray): Masks of the negative couplings, see sign_masks.
+        neighbours (np.ndarray): Neighbours of each spin.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        table (np.ndarray): Acceptance probabilities, see acceptance_table.
+        num_flips (int): Number of flip attempts for each replica.
+
+    Returns:
+        int: Number of accepted flips summed over the replicas.
+    """
+    spins = words.shape[1]
+    num_bits = 1
+    while (1 << num_bits) <= neighbours.shape[1]:
+        num_bits += 1
+    counter = np.zeros(num_bits, dtype=np.uint64)
+    state = np.ones(1, dtype=np.uint64)
+    state[0] = np.uint64(np.random.randint(1, 2**62))
+    accepted = 0
+    for w in range(words.shape[0]):
+        for _ in range(num_flips):
+            k = np.random.randint(0, spins)
+            z = len_neighbours[k]
+            # count the unsatisfied bonds of each replica
+            counter[:] = 0
+            for j in range(z):
+                carry = words[w, k] ^ words[w, neighbours[k, j]] ^ signs[k, j]
+                for b in range(num_bits):
+                    t = counter[b] & carry
+                    counter[b] ^= carry
+                    carry = t
+            flip = np.uint64(0)
+            for m in range(z + 1):
+                # replicas with m unsatisfied bonds
+                level = lanes[w]
+                for b in range(num_bits):
+                    if (m >> b) & 1:
+                        level &= counter[b]
+                    else:
+                        level &= ~counter[b]
+                if level == 0:
+                    continue
+                if 2 * m <= z:
+                    flip |= level
+                elif table[z, m] > 0:
+                    flip |= level & bernoulli_word(table[z, m], state)
+            words[w, k] ^= flip
+            accepted += popcount(flip)
+    return accepted
+
+
+@jit(nopython=True)
+def multispin_energies(
+    words: np.ndarray,
+    signs: np.ndarray,
+    neighbours: np.ndarray,
+    len_neighbours: np.ndarray,
+    magnitude: float,
+    replicas: int,
+) -> np.ndarray:
+    """Energies of the packed replicas, without unpacking them. The unsatisfied bonds
+    of every replica are counted once with a bit-sliced adder, and a configuration
+    with u unsatisfied bonds out of b has energy J (b - 2 u).
+
+    Args:
+        words (np.ndarray): Packed spins, see pack_spins.
+        signs (np.ndarray): Masks of the negative couplings, see sign_masks.
+        neighbours (np.ndarray): Neighbours of each spin.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        magnitude (float): Magnitude J of the ±J couplings.
+        replicas (int): Number of replicas.
+
+    Returns:
+        np.ndarray: Energies of shape (replicas,).
+    """
+    spins = words.shape[1]
+    bonds = 0
+    for i in range(spins):
+        for j in range(len_neighbours[i]):
+            if neighbours[i, j] > i:
+                bonds += 1
+    num_bits = 1
+    while (1 << num_bits) <= bonds:
+        num_bits += 1
+    counter = np.zeros(num_bits, dtype=np.uint64)
+    engs = np.empty(words.shape[0] * LANES)
+    for w in range(words.shape[0]):
+        counter[:] = 0
+        for i in range(spins):
+            for j in range(len_neighbours[i]):
+                k = neighbours[i, j]
+                if k > i:
+                    carry = words[w, i] ^ words[w, k] ^ signs[i, j]
+                    b = 0
+                    while carry != 0:
+                        t = counter[b] & carry
+                        counter[b] ^= carry
+                        carry = t
+                        b += 1
+        for r in range(LANES):
+            unsatisfied = 0
+            for b in range(num_bits):
+                unsatisfied += int((counter[b] >> np.uint64(r)) & np.uint64(1)) << b
+            engs[w * LANES + r] = magnitude * (bonds - 2 * unsatisfied)
+    return engs[:replicas]
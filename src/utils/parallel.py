@@ -0,0 +1,194 @@
+import math
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.utils import get_couplings, register_couplings
+
+# shared memory blocks attached by this worker, kept alive for its whole life
+_attached: List[SharedMemory] = []
+
+
+def available_cpus() -> int:
+    """Number of cores this process is allowed to run on.
+
+    Returns:
+        int: Available cores.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class SharedCouplings:
+    """Couplings parsed once and copied in shared memory, so that the workers
+    of a pool can attach to them instead of parsing the couplings file again.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the couplings.
+    """
+
+    def __init__(self, spin_side: int, couplings_path: str):
+        self.spin_side = spin_side
+        self.couplings_path = couplings_path
+        self.blocks: List[SharedMemory] = []
+        # name, shape and dtype of each array, enough to attach from another process
+        self.spec: List[Tuple[str, Tuple[int, ...], str]] = []
+        for array in get_couplings(spin_side, couplings_path):
+            array = np.ascontiguousarray(array)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec.append((block.name, array.shape, array.dtype.str))
+
+    def close(self) -> None:
+        """Release the shared memory blocks."""
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self) -> "SharedCouplings":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attach_couplings(
+    spin_side: int, couplings_path: str, spec: List[Tuple[str, Tuple[int, ...], str]]
+) -> None:
+    """Pool initializer, attach the shared couplings and register them for get_couplings.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the couplings.
+        spec (List[Tuple[str, Tuple[int, ...], str]]): See SharedCouplings.spec.
+    """
+    arrays = []
+    for name, shape, dtype in spec:
+        block = SharedMemory(name=name)
+        _attached.append(block)
+        arrays.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf))
+    register_couplings(spin_side, couplings_path, *arrays)
+
+
+def run_job(
+    func: Callable, args: Tuple[Any, ...], return_samples: bool = False
+) -> Dict[str, Any]:
+    """Run a Monte Carlo driver, catching its failure.
+
+    Args:
+        func (Callable): Driver returning samples and energies first.
+        args (Tuple[Any, ...]): Positional arguments of the driver.
+        return_samples (bool, optional): Send back the samples as well. Defaults to False.
+
+    Returns:
+        Dict[str, Any]: Energies, samples, duration in seconds and error traceback of the job.
+    """
+    start_time = time.time()
+    result = {"energies": None, "samples": None, "error": None}
+    try:
+        out = func(*args)
+        result["energies"] = np.asarray(out[1])
+        if return_samples:
+            result["samples"] = np.asarray(out[0])
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["duration"] = time.time() - start_time
+    return result
+
+
+def run_grid(
+    func: Callable,
+    jobs: Dict[Hashable, Tuple[Any, ...]],
+    spins: int,
+    couplings_path: str,
+    processes: Optional[int] = None,
+    return_samples: bool = False,
+) -> Dict[Hashable, Dict[str, Any]]:
+    """Run a grid of Monte Carlo jobs, e.g. over seeds and temperatures, on a pool
+    of processes sharing the couplings. Every job runs to completion even if some
+    of them fail, then a summary is printed and the failures are raised.
+
+    Args:
+        func (Callable): Driver returning samples and energies first.
+        jobs (Dict[Hashable, Tuple[Any, ...]]): Positional arguments of each job, by key.
+        spins (int): Number of spins of the ravel spin glass.
+        couplings_path (str): Path to the couplings.
+        processes (Optional[int], optional): Number of processes. Defaults to the available cores.
+        return_samples (bool, optional): Collect the samples as well. Defaults to False.
+
+    Raises:
+        RuntimeError: Some of the jobs failed.
+
+    Returns:
+        Dict[Hashable, Dict[str, Any]]: Result of each job, see run_job.
+    """
+    if processes is None:
+        processes = available_cpus()
+    processes = max(min(processes, len(jobs)), 1)
+
+    spin_side = int(math.sqrt(spins))
+    results = {}
+    with SharedCouplings(spin_side, couplings_path) as shared:
+        with ProcessPoolExecutor(
+            processes,
+            initializer=attach_couplings,
+            initargs=(spin_side, couplings_path, shared.spec),
+        ) as pool:
+            pending = {
+                key: pool.submit(run_job, func, args, return_samples)
+                for key, args in jobs.items()
+            }
+            for key, future in pending.items():
+                try:
+                    results[key] = future.result()
+                except Exception:
+                    # the job could not be sent or its result could not be received,
+                    # a killed worker breaks the pool and fails the pending jobs
+                    results[key] = {
+                        "energies": None,
+                        "samples": None,
+                        "error": traceback.format_exc(),
+                        "duration": float("nan"),
+                    }
+
+    print_summary(results, spins)
+    failed = [key for key, result in results.items() if result["error"] is not None]
+    if failed:
+        for key in failed:
+            print(f"\nJob {key} failed:\n{results[key]['error']}")
+        raise RuntimeError(f"{len(failed)} of {len(results)} jobs failed: {failed}")
+    return results
+
+
+def print_summary(results: Dict[Hashable, Dict[str, Any]], spins: int) -> None:
+    """Print the mean and the minimum energy per spin of each job.
+
+    Args:
+        results (Dict[Hashable, Dict[str, Any]]): Result of each job, see run_job.
+        spins (int): Number of spins of the ravel spin glass.
+    """
+    sigma = "\u03C3"
+    print(f"\n{'Job':>24}  {'E':>10}  {sigma:>10}  {'E_min':>10}  {'Duration':>10}")
+    for key, result in results.items():
+        if result["error"] is not None:
+            print(f"{str(key):>24}  {'failed':>10}")
+            continue
+        engs = result["energies"] / spins
+        # parallel tempering has the temperatures on the first axis
+        rows = [(key, engs)]
+        if engs.ndim == 3:
+            rows = [((key, b), eng) for b, eng in enumerate(engs)]
+        for row, eng in rows:
+            print(
+                f"{str(row):>24}  {eng.mean():10.6f}  {eng.std(ddof=1):10.6f}  {eng.min():10.6f}  {result['duration']:9.1f}s"
+            )
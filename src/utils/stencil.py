@@ -0,0 +1,233 @@
+import math
+from typing import Optional, Union
+
+import numpy as np
+from numba import jit, prange
+
+
+@jit(nopython=True, parallel=True)
+def stencil_energies(
+    samples: np.ndarray, offsets: np.ndarray, planes: np.ndarray
+) -> np.ndarray:
+    """Energies of a batch of lattice configurations, computed in parallel over the batch.
+    The bonds along each direction are a shifted copy of the lattice, so the inner loops
+    run over contiguous rows, split at the periodic wrap.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1} of shape (n, side, side).
+        offsets (np.ndarray): Direction of the bonds, of shape (directions, 2).
+        planes (np.ndarray): Coupling of each site with its neighbour along each direction, of shape (directions, side, side).
+
+    Returns:
+        np.ndarray: Energies of shape (n,).
+    """
+    side = samples.shape[1]
+    engs = np.zeros(samples.shape[0])
+    for n in prange(samples.shape[0]):
+        sample = samples[n]
+        eng = 0.0
+        for d in range(offsets.shape[0]):
+            shift = offsets[d, 1] % side
+            for x in range(side):
+                row = sample[(x + offsets[d, 0]) % side]
+                for y in range(side - shift):
+                    eng += planes[d, x, y] * sample[x, y] * row[y + shift]
+                for y in range(side - shift, side):
+                    eng += planes[d, x, y] * sample[x, y] * row[y + shift - side]
+        engs[n] = eng
+    return engs
+
+
+@jit(nopython=True)
+def stencil_site_field(
+    sample: np.ndarray,
+    x: int,
+    y: int,
+    offsets: np.ndarray,
+    planes: np.ndarray,
+) -> float:
+    """Local field of a site of the lattice.
+
+    Args:
+        sample (np.ndarray): Spin configuration of shape (side, side).
+        x (int): Row of the site.
+        y (int): Column of the site.
+        offsets (np.ndarray): Direction of the bonds, both ways, see Stencil.
+        planes (np.ndarray): Couplings along each direction, both ways, see Stencil.
+
+    Returns:
+        float: Local field.
+    """
+    side = sample.shape[0]
+    field = 0.0
+    for d in range(offsets.shape[0]):
+        field += (
+            planes[d, x, y]
+            * sample[(x + offsets[d, 0]) % side, (y + offsets[d, 1]) % side]
+        )
+    return field
+
+
+@jit(nopython=True, parallel=True)
+def stencil_colour_sweep(
+    samples: np.ndarray,
+    engs: np.ndarray,
+    betas: np.ndarray,
+    offsets: np.ndarray,
+    planes: np.ndarray,
+    colours: np.ndarray,
+    num_colours: int,
+    sweeps: int,
+) -> np.ndarray:
+    """Metropolis sweeps updating one colour class at a time, see colour_sweep.
+    The local field of each site of the current colour is read from the coupling
+    planes, the other sites are skipped. Rows are processed in parallel. Samples and
+    energies are updated in place.
+
+    Args:
+        samples (np.ndarray): Spin configurations of shape (replicas, side, side).
+        engs (np.ndarray): Energies of the replicas.
+        betas (np.ndarray): Inverse temperature of each replica.
+        offsets (np.ndarray): Direction of the bonds, both ways, see Stencil.
+        planes (np.ndarray): Couplings along each direction, both ways, see Stencil.
+        colours (np.ndarray): Colour of each site, of shape (side, side).
+        num_colours (int): Number of colours.
+        sweeps (int): Number of sweeps of the whole lattice.
+
+    Returns:
+        np.ndarray: Number of accepted flips of each replica.
+    """
+    side = samples.shape[1]
+    accepted = np.zeros(samples.shape[0], dtype=np.int64)
+    for r in range(samples.shape[0]):
+        sample = samples[r]
+        for _ in range(sweeps):
+            for colour in range(num_colours):
+                # draw outside the parallel loop to keep the stream reproducible
+                rand = np.random.random((side, side))
+                delta_eng = 0.0
+                accepted_colour = 0
+                for x in prange(side):
+                    for y in range(side):
+                        if colours[x, y] == colour:
+                            field = stencil_site_field(sample, x, y, offsets, planes)
+                            deltah = -2.0 * sample[x, y] * field
+                            if deltah < 0.0 or rand[x, y] < math.exp(-betas[r] * deltah):
+                                sample[x, y] = -sample[x, y]
+                                delta_eng += deltah
+                                accepted_colour += 1
+                engs[r] += delta_eng
+                accepted[r] += accepted_colour
+    return accepted
+
+
+class Stencil:
+    """Couplings of a square lattice with the same bond directions at every site,
+    e.g. the instances of Adjacency.create_adjacency, stored as one coupling plane
+    per direction instead of neighbour lists. Open boundaries are bonds of
+    coupling 0 across the edge.
+
+    Args:
+        offsets (np.ndarray): Direction of the bonds, one per bond, of shape (directions, 2).
+        planes (np.ndarray): Coupling of site (x, y) with site (x + dx, y + dy), modulo the side, of shape (directions, side, side).
+    """
+
+    def __init__(self, offsets: np.ndarray, planes: np.ndarray):
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        self.planes = np.ascontiguousarray(planes)
+        self.side = self.planes.shape[-1]
+        # the field of a site collects its bonds along both ways of each direction
+        backward = np.stack(
+            [
+                np.roll(plane, tuple(offset), axis=(0, 1))
+                for offset, plane in zip(self.offsets, self.planes)
+            ]
+        )
+        self.field_offsets = np.concatenate([self.offsets, -self.offsets])
+        self.field_planes = np.ascontiguousarray(
+            np.concatenate([self.planes, backward])
+        )
+
+    @classmethod
+    def from_couplings(
+        cls, neighbours: np.ndarray, couplings: np.ndarray, len_neighbours: np.ndarray
+    ) -> Optional["Stencil"]:
+        """Recognize a square lattice in the neighbours layout of get_couplings.
+
+        Args:
+            neighbours (np.ndarray): Neighbours of each spin.
+            couplings (np.ndarray): Couplings of each spin with its neighbours.
+            len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+        Returns:
+            Optional[Stencil]: Stencil of the couplings, None if they are not a regular square lattice.
+        """
+        spins = neighbours.shape[0]
+        side = math.isqrt(spins)
+        if side * side != spins or side < 3:
+            return None
+        mask = np.arange(neighbours.shape[1]) < len_neighbours[:, None]
+        sites = np.repeat(np.arange(spins), len_neighbours)
+        others = neighbours[mask]
+        x, y = np.divmod(sites, side)
+        dx, dy = np.divmod(others, side)
+        dx, dy = (dx - x) % side, (dy - y) % side
+        dx = np.where(dx > side // 2, dx - side, dx)
+        dy = np.where(dy > side // 2, dy - side, dy)
+        if np.any(2 * dx == side) or np.any(2 * dy == side):
+            # half the side away both ways, the direction is ambiguous
+            return None
+        # each bond once, from the site it points away from
+        forward = (dx > 0) | ((dx == 0) & (dy > 0))
+        bonds = np.stack([dx[forward], dy[forward]], axis=1)
+        offsets, direction = np.unique(bonds, axis=0, return_inverse=True)
+        if offsets.shape[0] == 0 or 2 * offsets.shape[0] > neighbours.shape[1]:
+            # more directions than neighbours, not a lattice
+            return None
+        planes = np.zeros((offsets.shape[0], side, side), dtype=couplings.dtype)
+        planes[direction.reshape(-1), x[forward], y[forward]] = couplings[mask][forward]
+        return cls(offsets, planes)
+
+    def energies(self, samples: np.ndarray) -> np.ndarray:
+        """Energies of a batch of configurations.
+
+        Args:
+            samples (np.ndarray): Spin configurations in {-1,+1}, one per row once flattened.
+
+        Returns:
+            np.ndarray: Energies of shape (n,).
+        """
+        samples = np.ascontiguousarray(samples).reshape(-1, self.side, self.side)
+        return stencil_energies(samples, self.offsets, self.planes)
+
+    def colour_sweep(
+        self,
+        samples: np.ndarray,
+        engs: np.ndarray,
+        betas: Union[float, np.ndarray],
+        colours: np.ndarray,
+        sweeps: int,
+    ) -> np.ndarray:
+        """Metropolis sweeps updating one colour class at a time, in place.
+
+        Args:
+            samples (np.ndarray): Contiguous spin configurations of shape (replicas, spins).
+            engs (np.ndarray): Energies of the replicas.
+            betas (Union[float, np.ndarray]): Inverse temperature, shared or of each replica.
+            colours (np.ndarray): Colour of each spin, see greedy_colouring.
+            sweeps (int): Number of sweeps of the whole lattice.
+
+        Returns:
+            np.ndarray: Number of accepted flips of each replica.
+        """
+        betas = np.broadcast_to(np.asarray(betas, dtype=np.double), engs.shape)
+        return stencil_colour_sweep(
+            samples.reshape(-1, self.side, self.side),
+            engs,
+            np.ascontiguousarray(betas),
+            self.field_offsets,
+            self.field_planes,
+            colours.reshape(self.side, self.side),
+            colours.max() + 1,
+            sweeps,
+        )
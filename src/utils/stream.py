@@ -0,0 +1,118 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, Tuple
+
+import numpy as np
+
+# marks the end of the batches in the queue
+_DONE = object()
+
+
+class BatchProducer:
+    """Produce batches in a background thread and hand them over through a bounded
+    queue, so that generating the next batches overlaps with consuming the current
+    one, and at most max_batches wait in memory. Errors of the producer are raised
+    in the consumer.
+
+    Args:
+        batches (Iterable[Any]): Batches to produce, e.g. proposal_batches.
+        max_batches (int, optional): Maximum number of batches waiting in the queue. Defaults to 2.
+    """
+
+    def __init__(self, batches: Iterable[Any], max_batches: int = 2):
+        self.queue = queue.Queue(maxsize=max(max_batches, 1))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._produce, args=(iter(batches),), daemon=True
+        )
+        self.thread.start()
+
+    def _put(self, item: Any) -> bool:
+        # wait for a free slot, unless the consumer is gone
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, batches: Iterator[Any]) -> None:
+        try:
+            for batch in batches:
+                if not self._put(batch):
+                    return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(_DONE)
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        """Stop the producer after its current batch."""
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self) -> "BatchProducer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ProposalStream:
+    """Sequential access to proposals arriving in batches. Each batch is scored when
+    it is reached and dropped once the proposals move past it.
+
+    Args:
+        batches (Iterable[Tuple[np.ndarray, np.ndarray]]): Batches of samples and their log probability.
+        score (Callable[[np.ndarray], np.ndarray]): Energies of a batch of samples of shape (n, spins).
+    """
+
+    def __init__(
+        self,
+        batches: Iterable[Tuple[np.ndarray, np.ndarray]],
+        score: Callable[[np.ndarray], np.ndarray],
+    ):
+        self.batches = iter(batches)
+        self.score = score
+        self.start = 0
+        self.samples = np.empty((0, 0), dtype=np.int8)
+        self.log_probs = np.empty(0)
+        self.engs = np.empty(0)
+
+    def get(self, idx: int) -> Tuple[np.ndarray, float, float]:
+        """Sample, log probability and energy of a proposal.
+
+        Args:
+            idx (int): Index of the proposal, not before the current batch.
+
+        Raises:
+            IndexError: The proposal was dropped or the batches are over.
+
+        Returns:
+            Tuple[np.ndarray, float, float]: Sample, log probability and energy.
+        """
+        if idx < self.start:
+            raise IndexError(f"Proposal {idx} already dropped")
+        while idx >= self.start + self.engs.shape[0]:
+            try:
+                samples, log_probs = next(self.batches)
+            except StopIteration:
+                raise IndexError(
+                    f"Only {self.start + self.engs.shape[0]} proposals"
+                ) from None
+            self.start += self.engs.shape[0]
+            self.samples = np.reshape(samples, (samples.shape[0], -1))
+            self.log_probs = log_probs
+            self.engs = self.score(self.samples)
+        i = idx - self.start
+        return self.samples[i], self.log_probs[i], self.engs[i]
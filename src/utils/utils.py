@@ -2,20 +2,24 @@ import logging
 import math
 import os
 import warnings
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pytorch_lightning as pl
 import rich.syntax
 import rich.tree
-from numba import jit
+from numba import jit, prange
 from omegaconf import DictConfig, OmegaConf
 from pytorch_lightning.utilities import rank_zero_only
+from scipy import sparse
+from scipy.sparse.csgraph import reverse_cuthill_mckee
 from torch import Tensor, set_num_threads
 from torch.nn import BCEWithLogitsLoss
 
-from src.utils.adjacency import Adjacency
+from src.utils.cache import ProposalCache
+from src.utils.couplings import load_couplings
+from src.utils.stencil import Stencil
 
 
 def get_logger(name=__name__, level=logging.INFO) -> logging.Logger:
@@ -233,6 +237,168 @@ def compute_energy(
     return energy / 2
 
 
+@jit(nopython=True, parallel=True)
+def compute_energy_batch(
+    samples: np.ndarray,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+    block: int = 64,
+) -> np.ndarray:
+    """Energies of a batch of configurations, computed in parallel over blocks of the batch.
+    Each block is transposed so that the innermost loop runs over the configurations,
+    and each bond is counted once. Works directly on int8 samples.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1} of shape (n, spins).
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        block (int, optional): Number of configurations per block. Defaults to 64.
+
+    Returns:
+        np.ndarray: Energies of shape (n,).
+    """
+    num, spins = samples.shape
+    engs = np.empty(num)
+    for b in prange((num + block - 1) // block):
+        start = b * block
+        size = min(block, num - start)
+        chunk = np.empty((spins, size), dtype=couplings.dtype)
+        for r in range(size):
+            for i in range(spins):
+                chunk[i, r] = samples[start + r, i]
+        eng = np.zeros(size)
+        for i in range(spins):
+            for j in range(len_neighbours[i]):
+                k = neighbours[i, j]
+                if k > i:
+                    for r in range(size):
+                        eng[r] += couplings[i, j] * chunk[i, r] * chunk[k, r]
+        engs[start : start + size] = eng
+    return engs
+
+
+@jit(nopython=True, parallel=True)
+def compute_local_fields_batch(
+    samples: np.ndarray,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+) -> np.ndarray:
+    """Local fields of a batch of configurations, computed in parallel over the batch,
+    see compute_local_fields.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1} of shape (n, spins).
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        np.ndarray: Local fields of shape (n, spins).
+    """
+    fields = np.zeros((samples.shape[0], neighbours.shape[0]))
+    for n in prange(samples.shape[0]):
+        for i in range(neighbours.shape[0]):
+            for j in range(len_neighbours[i]):
+                fields[n, i] += couplings[i, j] * samples[n, neighbours[i, j]]
+    return fields
+
+
+def batch_energies(
+    samples: np.ndarray,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+    backend: str = "auto",
+    stencil: Optional[Stencil] = None,
+) -> np.ndarray:
+    """Energies of a batch of configurations with the chosen backend.
+    With 'auto' the lattice stencil is used on regular square lattices,
+    the numba kernel otherwise. Callers scoring many batches should detect
+    the stencil once and pass it.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1}, one per row once flattened.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        backend (str, optional): Either 'auto', the multi-threaded 'numba' kernel, the 'sparse' matrix product or the lattice 'stencil'. Defaults to 'auto'.
+        stencil (Optional[Stencil], optional): Stencil of the couplings, detected from them if None. Defaults to None.
+
+    Raises:
+        ValueError: Unknown backend, or stencil backend on couplings that are not a square lattice.
+
+    Returns:
+        np.ndarray: Energies of shape (n,).
+    """
+    samples = np.reshape(samples, (-1, neighbours.shape[0]))
+    if backend in ("auto", "stencil"):
+        if stencil is None:
+            stencil = Stencil.from_couplings(neighbours, couplings, len_neighbours)
+        if stencil is not None:
+            return stencil.energies(samples)
+        if backend == "stencil":
+            raise ValueError("The couplings are not a regular square lattice")
+        backend = "numba"
+    if backend == "numba":
+        return compute_energy_batch(samples, neighbours, couplings, len_neighbours)
+    elif backend == "sparse":
+        return compute_energies(
+            samples, get_sparse_couplings(neighbours, couplings, len_neighbours)
+        )
+    raise ValueError(f"Unknown backend '{backend}'")
+
+
+def get_sparse_couplings(
+    neighbours: np.ndarray, couplings: np.ndarray, len_neighbours: np.ndarray
+) -> sparse.csr_matrix:
+    """Symmetric sparse coupling matrix J, the same of Adjacency.get_sparse(),
+    built from the padded neighbours layout returned by get_couplings.
+
+    Args:
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        sparse.csr_matrix: Coupling matrix of shape (spins, spins).
+    """
+    spins = neighbours.shape[0]
+    mask = np.arange(neighbours.shape[1]) < len_neighbours[:, None]
+    rows = np.repeat(np.arange(spins), len_neighbours)
+    return sparse.csr_matrix(
+        (couplings[mask], (rows, neighbours[mask])), shape=(spins, spins)
+    )
+
+
+def compute_energies(
+    samples: np.ndarray, sparse_couplings: sparse.spmatrix, batch_size: int = 1024
+) -> np.ndarray:
+    """Energies E = 1/2 s^T J s of a batch of configurations.
+    The samples are converted to floating point one chunk at a time, so int8
+    batches are never upcast as a whole. Each bond is counted once through the
+    upper triangle of J.
+
+    Args:
+        samples (np.ndarray): Spin configurations in {-1,+1} of shape (n, spins).
+        sparse_couplings (sparse.spmatrix): Coupling matrix, see get_sparse_couplings.
+        batch_size (int, optional): Number of configurations per chunk. Defaults to 1024.
+
+    Returns:
+        np.ndarray: Energies of shape (n,).
+    """
+    samples = np.reshape(samples, (-1, sparse_couplings.shape[0]))
+    upper = sparse.triu(sparse_couplings, format="csr")
+    engs = np.empty(samples.shape[0], dtype=np.double)
+    for i in range(0, samples.shape[0], batch_size):
+        # spins on the rows, so that J acts on contiguous configurations
+        chunk = np.ascontiguousarray(samples[i : i + batch_size].T, dtype=np.double)
+        engs[i : i + batch_size] = np.einsum("ij,ij->j", chunk, upper @ chunk)
+    return engs
+
+
 @jit(nopython=True)
 def compute_delta_h(
     num_spin: int,
@@ -247,6 +413,529 @@ def compute_delta_h(
     return 2 * delta_h
 
 
+@jit(nopython=True)
+def compute_local_fields(
+    sample: np.ndarray,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+) -> np.ndarray:
+    """Local field acting on each spin, h_i = sum_j J_ij s_j.
+    Flipping spin i changes the energy by -2 s_i h_i.
+
+    Args:
+        sample (np.ndarray): Spin configuration in {-1,+1}.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        np.ndarray: Local fields.
+    """
+    fields = np.zeros(neighbours.shape[0], dtype=couplings.dtype)
+    for i in range(neighbours.shape[0]):
+        for j in range(len_neighbours[i]):
+            fields[i] += couplings[i, j] * sample[neighbours[i, j]]
+    return fields
+
+
+@jit(nopython=True)
+def flip_spin(
+    num_spin: int,
+    sample: np.ndarray,
+    fields: np.ndarray,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: int,
+) -> None:
+    """Flip a spin and update the cached local fields of its neighbours in place.
+
+    Args:
+        num_spin (int): Spin to flip.
+        sample (np.ndarray): Spin configuration in {-1,+1}.
+        fields (np.ndarray): Local fields, see compute_local_fields.
+        neighbours (np.ndarray): Neighbours of the spin.
+        couplings (np.ndarray): Couplings of the spin with its neighbours.
+        len_neighbours (int): Number of neighbours of the spin.
+    """
+    sample[num_spin] = -sample[num_spin]
+    for j in range(len_neighbours):
+        fields[neighbours[j]] += 2.0 * couplings[j] * sample[num_spin]
+
+
+@jit(nopython=True)
+def seed_kernels(seed: int) -> None:
+    """Seed the random number generator used inside the compiled kernels.
+    Numba keeps its own random state, independent from the NumPy global one.
+
+    Args:
+        seed (int): Seed of the kernels' random stream.
+    """
+    np.random.seed(seed)
+
+
+@jit(nopython=True)
+def single_spin_flip_sweep(
+    sample: np.ndarray,
+    fields: np.ndarray,
+    eng: float,
+    beta: float,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+    num_flips: int,
+) -> Tuple[float, int]:
+    """Perform num_flips Metropolis single spin flip attempts in a single compiled call.
+    The energy change of a flip is read from the cached local fields, which are updated
+    only when a flip is accepted. Sample and fields are updated in place.
+
+    Args:
+        sample (np.ndarray): Spin configuration in {-1,+1}.
+        fields (np.ndarray): Local fields, see compute_local_fields.
+        eng (float): Energy of the configuration.
+        beta (float): Inverse temperature.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        num_flips (int): Number of flip attempts.
+
+    Returns:
+        Tuple[float, int]: Energy after the attempts and number of accepted flips.
+    """
+    spins = sample.shape[0]
+    accepted = 0
+    for _ in range(num_flips):
+        k = np.random.randint(0, spins)
+        # Metropolis-Hastings algorithm https://doi.org/10.2307/2334940
+        deltah = -2.0 * sample[k] * fields[k]
+        if deltah < 0.0 or np.random.random() < math.exp(-beta * deltah):
+            flip_spin(k, sample, fields, neighbours[k], couplings[k], len_neighbours[k])
+            eng += deltah
+            accepted += 1
+    return eng, accepted
+
+
+@jit(nopython=True)
+def replica_spin_flip_sweep(
+    samples: np.ndarray,
+    fields: np.ndarray,
+    engs: np.ndarray,
+    betas: np.ndarray,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+    num_flips: int,
+) -> np.ndarray:
+    """Advance a batch of independent replicas by num_flips Metropolis single spin flip
+    attempts each. Samples, fields and energies are updated in place.
+
+    Args:
+        samples (np.ndarray): Spin configurations of shape (replicas, spins).
+        fields (np.ndarray): Local fields of the replicas, same shape of samples.
+        engs (np.ndarray): Energies of the replicas.
+        betas (np.ndarray): Inverse temperature of each replica.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        num_flips (int): Number of flip attempts for each replica.
+
+    Returns:
+        np.ndarray: Number of accepted flips of each replica.
+    """
+    accepted = np.zeros(samples.shape[0], dtype=np.int64)
+    for r in range(samples.shape[0]):
+        engs[r], accepted[r] = single_spin_flip_sweep(
+            samples[r],
+            fields[r],
+            engs[r],
+            betas[r],
+            neighbours,
+            couplings,
+            len_neighbours,
+            num_flips,
+        )
+    return accepted
+
+
+@jit(nopython=True)
+def greedy_colouring(neighbours: np.ndarray, len_neighbours: np.ndarray) -> np.ndarray:
+    """Colour the coupling graph so that no two coupled spins share the same colour.
+    Spins are visited in order and each one takes the smallest colour not used by its
+    neighbours, giving a checkerboard on nearest-neighbours square lattices.
+
+    Args:
+        neighbours (np.ndarray): Neighbours of each spin.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        np.ndarray: Colour of each spin.
+    """
+    spins = neighbours.shape[0]
+    colours = -np.ones(spins, dtype=np.int64)
+    # mark the colours taken by the neighbours of spin i with i + 1
+    taken = np.zeros(len_neighbours.max() + 1, dtype=np.int64)
+    for i in range(spins):
+        for j in range(len_neighbours[i]):
+            colour = colours[neighbours[i, j]]
+            if colour >= 0:
+                taken[colour] = i + 1
+        colour = 0
+        while taken[colour] == i + 1:
+            colour += 1
+        colours[i] = colour
+    return colours
+
+
+def get_colour_classes(
+    neighbours: np.ndarray, len_neighbours: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Group the spins in colour classes, i.e., sets of spins with no couplings
+    between them that can be updated at the same time.
+
+    Args:
+        neighbours (np.ndarray): Neighbours of each spin.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Spins sorted by colour and the offsets of each colour class.
+    """
+    colours = greedy_colouring(neighbours, len_neighbours)
+    colour_sites = np.argsort(colours, kind="stable")
+    colour_offsets = np.zeros(colours.max() + 2, dtype=np.int64)
+    colour_offsets[1:] = np.cumsum(np.bincount(colours))
+    return colour_sites, colour_offsets
+
+
+@jit(nopython=True, parallel=True)
+def colour_sweep(
+    samples: np.ndarray,
+    engs: np.ndarray,
+    betas: np.ndarray,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+    colour_sites: np.ndarray,
+    colour_offsets: np.ndarray,
+    sweeps: int,
+) -> np.ndarray:
+    """Metropolis sweeps updating one colour class at a time. Spins of the same class
+    are not coupled, so they are updated in parallel. Samples and energies are updated
+    in place.
+
+    Args:
+        samples (np.ndarray): Spin configurations of shape (replicas, spins).
+        engs (np.ndarray): Energies of the replicas.
+        betas (np.ndarray): Inverse temperature of each replica.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        colour_sites (np.ndarray): Spins sorted by colour, see get_colour_classes.
+        colour_offsets (np.ndarray): Offsets of each colour class, see get_colour_classes.
+        sweeps (int): Number of sweeps of the whole lattice.
+
+    Returns:
+        np.ndarray: Number of accepted flips of each replica.
+    """
+    accepted = np.zeros(samples.shape[0], dtype=np.int64)
+    for r in range(samples.shape[0]):
+        sample = samples[r]
+        for _ in range(sweeps):
+            for colour in range(colour_offsets.shape[0] - 1):
+                start = colour_offsets[colour]
+                size = colour_offsets[colour + 1] - start
+                # draw outside the parallel loop to keep the stream reproducible
+                rand = np.random.random(size)
+                delta_eng = 0.0
+                accepted_colour = 0
+                for idx in prange(size):
+                    k = colour_sites[start + idx]
+                    deltah = compute_delta_h(
+                        k, sample, neighbours[k], couplings[k], len_neighbours[k]
+                    )
+                    if deltah < 0.0 or rand[idx] < math.exp(-betas[r] * deltah):
+                        sample[k] = -sample[k]
+                        delta_eng += deltah
+                        accepted_colour += 1
+                engs[r] += delta_eng
+                accepted[r] += accepted_colour
+    return accepted
+
+
+@jit(nopython=True)
+def flip_rate(spin: float, field: float, beta: float) -> float:
+    """Metropolis acceptance probability of flipping a spin in a given local field.
+
+    Args:
+        spin (float): Spin value in {-1,+1}.
+        field (float): Local field acting on the spin.
+        beta (float): Inverse temperature.
+
+    Returns:
+        float: Flip rate, min(1, exp(-beta * delta_h)).
+    """
+    exponent = 2.0 * beta * spin * field
+    if exponent >= 0.0:
+        return 1.0
+    return math.exp(exponent)
+
+
+@jit(nopython=True)
+def build_rate_tree(sample: np.ndarray, fields: np.ndarray, beta: float) -> np.ndarray:
+    """Binary sum tree of the spin flip rates. Leaves start at the first power of two
+    greater or equal to the number of spins, each node holds the sum of its children
+    and the root (index 1) the total rate.
+
+    Args:
+        sample (np.ndarray): Spin configuration in {-1,+1}.
+        fields (np.ndarray): Local fields, see compute_local_fields.
+        beta (float): Inverse temperature.
+
+    Returns:
+        np.ndarray: Rate tree.
+    """
+    size = 1
+    while size < sample.shape[0]:
+        size *= 2
+    tree = np.zeros(2 * size)
+    for i in range(sample.shape[0]):
+        tree[size + i] = flip_rate(sample[i], fields[i], beta)
+    for p in range(size - 1, 0, -1):
+        tree[p] = tree[2 * p] + tree[2 * p + 1]
+    return tree
+
+
+@jit(nopython=True)
+def update_rate_tree(tree: np.ndarray, num_spin: int, rate: float) -> None:
+    """Set the flip rate of a spin and update its ancestors in the rate tree.
+
+    Args:
+        tree (np.ndarray): Rate tree, see build_rate_tree.
+        num_spin (int): Spin to update.
+        rate (float): New flip rate.
+    """
+    p = tree.shape[0] // 2 + num_spin
+    tree[p] = rate
+    p //= 2
+    while p >= 1:
+        # recompute from the children to avoid accumulating round-off
+        tree[p] = tree[2 * p] + tree[2 * p + 1]
+        p //= 2
+
+
+@jit(nopython=True)
+def nfold_way_sweep(
+    sample: np.ndarray,
+    eng: float,
+    fields: np.ndarray,
+    tree: np.ndarray,
+    beta: float,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+    clock: float,
+    end_clock: float,
+) -> Tuple[float, float, int]:
+    """Rejection-free n-fold way (BKL) dynamics, https://doi.org/10.1016/0021-9991(75)90060-1.
+    Every event flips a spin, chosen with probability proportional to its rate, while
+    the clock advances by the number of Metropolis attempts the single spin flip
+    algorithm would have rejected in the meantime. The waiting time is geometric,
+    so the sample at end_clock has the same law as after end_clock random site attempts.
+    Sample, fields and tree are updated in place.
+
+    Args:
+        sample (np.ndarray): Spin configuration in {-1,+1}.
+        eng (float): Energy of the configuration.
+        fields (np.ndarray): Local fields, see compute_local_fields.
+        tree (np.ndarray): Rate tree, see build_rate_tree.
+        beta (float): Inverse temperature.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+        clock (float): Current time, in single spin flip attempts.
+        end_clock (float): Time to reach, in single spin flip attempts.
+
+    Returns:
+        Tuple[float, float, int]: Energy, clock (equal to end_clock) and number of flips.
+    """
+    spins = sample.shape[0]
+    size = tree.shape[0] // 2
+    flips = 0
+    while True:
+        total = tree[1]
+        if total <= 0.0:
+            # frozen configuration
+            break
+        # attempts until the next accepted flip
+        waiting = np.random.geometric(min(total / spins, 1.0))
+        if clock + waiting > end_clock:
+            # the waiting time is memoryless, we can restart from end_clock
+            break
+        clock += waiting
+
+        # pick a spin with probability proportional to its rate
+        target = np.random.random() * total
+        p = 1
+        while p < size:
+            if target < tree[2 * p] or tree[2 * p + 1] <= 0.0:
+                p = 2 * p
+            else:
+                target -= tree[2 * p]
+                p = 2 * p + 1
+        k = p - size
+
+        eng += -2.0 * sample[k] * fields[k]
+        flip_spin(k, sample, fields, neighbours[k], couplings[k], len_neighbours[k])
+        flips += 1
+        # update neighbours' rates
+        for j in range(len_neighbours[k]):
+            n = neighbours[k, j]
+            update_rate_tree(tree, n, flip_rate(sample[n], fields[n], beta))
+        update_rate_tree(tree, k, flip_rate(sample[k], fields[k], beta))
+    return eng, end_clock, flips
+
+
+@jit(nopython=True)
+def replica_exchange(
+    samples: np.ndarray,
+    fields: np.ndarray,
+    engs: np.ndarray,
+    betas: np.ndarray,
+    replicas: int,
+    swaps: np.ndarray,
+) -> None:
+    """Attempt to swap the configurations of neighbouring temperatures, accepting with
+    probability min(1, exp((beta_i - beta_j) * (E_i - E_j))). The samples are ordered
+    by temperature, with the replicas of the same temperature next to each other.
+    Samples, local fields, energies and swap counters are updated in place.
+
+    Args:
+        samples (np.ndarray): Spin configurations of shape (betas * replicas, spins).
+        fields (np.ndarray): Local fields of the configurations, same shape of samples.
+        engs (np.ndarray): Energies of the configurations.
+        betas (np.ndarray): Inverse temperature of each configuration.
+        replicas (int): Number of replicas at each temperature.
+        swaps (np.ndarray): Accepted swaps between each pair of neighbouring temperatures.
+    """
+    for c in range(replicas):
+        for b in range(samples.shape[0] // replicas - 1):
+            i = b * replicas + c
+            j = i + replicas
+            log_ratio = (betas[i] - betas[j]) * (engs[i] - engs[j])
+            if log_ratio >= 0.0 or np.random.random() < math.exp(log_ratio):
+                for k in range(samples.shape[1]):
+                    samples[i, k], samples[j, k] = samples[j, k], samples[i, k]
+                    fields[i, k], fields[j, k] = fields[j, k], fields[i, k]
+                engs[i], engs[j] = engs[j], engs[i]
+                swaps[b] += 1
+
+
+@jit(nopython=True)
+def houdayer_move(
+    samples: np.ndarray,
+    fields: np.ndarray,
+    engs: np.ndarray,
+    a: int,
+    b: int,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+) -> int:
+    """Houdayer cluster move between two replicas at the same temperature,
+    https://doi.org/10.1007/s100510170242. A cluster of connected spins with negative
+    overlap is grown from a random site and flipped in both replicas. The sum of the
+    two energies is conserved, so the move is always accepted.
+    Samples, local fields and energies are updated in place.
+
+    Args:
+        samples (np.ndarray): Spin configurations of shape (replicas, spins).
+        fields (np.ndarray): Local fields of the replicas, same shape of samples.
+        engs (np.ndarray): Energies of the replicas.
+        a (int): First replica.
+        b (int): Second replica.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        int: Size of the flipped cluster, 0 if the replicas have no negative overlap.
+    """
+    spins = samples.shape[1]
+    # sites with negative overlap
+    sites = np.empty(spins, dtype=np.int64)
+    num_sites = 0
+    for i in range(spins):
+        if samples[a, i] != samples[b, i]:
+            sites[num_sites] = i
+            num_sites += 1
+    if num_sites == 0:
+        return 0
+
+    # grow the cluster with a depth first search
+    in_cluster = np.zeros(spins, dtype=np.bool_)
+    stack = np.empty(spins, dtype=np.int64)
+    stack[0] = sites[np.random.randint(0, num_sites)]
+    in_cluster[stack[0]] = True
+    top = 1
+    size = 0
+    while top > 0:
+        top -= 1
+        k = stack[top]
+        size += 1
+        for j in range(len_neighbours[k]):
+            n = neighbours[k, j]
+            if (
+                couplings[k, j] != 0.0
+                and not in_cluster[n]
+                and samples[a, n] != samples[b, n]
+            ):
+                in_cluster[n] = True
+                stack[top] = n
+                top += 1
+        # flipping both replicas leaves the overlap unchanged
+        for r in (a, b):
+            engs[r] += -2.0 * samples[r, k] * fields[r, k]
+            flip_spin(
+                k, samples[r], fields[r], neighbours[k], couplings[k], len_neighbours[k]
+            )
+    return size
+
+
+@jit(nopython=True)
+def houdayer_sweep(
+    samples: np.ndarray,
+    fields: np.ndarray,
+    engs: np.ndarray,
+    replicas: int,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+) -> int:
+    """Houdayer cluster moves between consecutive pairs of replicas. The samples are
+    grouped by temperature, with the replicas of the same temperature next to each other;
+    with an odd number of replicas the last one of each temperature is left untouched.
+
+    Args:
+        samples (np.ndarray): Spin configurations of shape (betas * replicas, spins).
+        fields (np.ndarray): Local fields of the configurations, same shape of samples.
+        engs (np.ndarray): Energies of the configurations.
+        replicas (int): Number of replicas at each temperature.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        int: Total number of spins flipped in each replica of the pairs.
+    """
+    flipped = 0
+    for g in range(samples.shape[0] // replicas):
+        for c in range(replicas // 2):
+            a = g * replicas + 2 * c
+            flipped += houdayer_move(
+                samples, fields, engs, a, a + 1, neighbours, couplings, len_neighbours
+            )
+    return flipped
+
+
 def load_data(
     sample_path: Union[str, Dict[str, np.ndarray]],
     model: Optional[str] = None,
@@ -289,13 +978,183 @@ def load_data(
     )
 
 
+def proposal_batches(
+    sample_path: Union[str, Dict[str, np.ndarray]],
+    model: Optional[str] = None,
+    num_sample: Optional[int] = None,
+    batch_size: int = 20000,
+    verbose: bool = False,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Samples and their log probability one batch at a time, see load_data.
+    Models generate each batch on demand, so the samples never need to fit in memory at once.
+
+    Args:
+        sample_path (Union[str, Dict[str, np.ndarray]]): Path to the generated sample, to the model or to the samples theirself.
+        model (Optional[str], optional): Model to use. Defaults to None.
+        num_sample (Optional[int], optional): Number of samples, all the saved ones if None. Defaults to None.
+        batch_size (int, optional): Size of each batch. Defaults to 20000.
+        verbose (bool, optional): Set verbose prints. Defaults to False.
+
+    Raises:
+        ValueError: Wrong path or corrupted data.
+
+    Yields:
+        Iterator[Tuple[np.ndarray, np.ndarray]]: Batches of samples and their log probability.
+    """
+    if isinstance(sample_path, str) and sample_path.split(".")[-1] == "ckpt":
+        # import here to avoid circular imports
+        from src.generate import generate_batches
+
+        for data in generate_batches(
+            sample_path, model, num_sample, batch_size=batch_size, verbose=verbose
+        ):
+            yield data["sample"], data["log_prob"]
+        return
+
+    samples, log_probs = load_data(sample_path)
+    num_sample = samples.shape[0] if num_sample is None else num_sample
+    for start in range(0, min(num_sample, samples.shape[0]), batch_size):
+        stop = min(start + batch_size, num_sample)
+        yield samples[start:stop], log_probs[start:stop]
+
+
+# floating point type of the couplings and local fields for each precision
+PRECISIONS = {"single": np.float32, "double": np.float64}
+
+# couplings already loaded in this process, keyed by path, modification time
+# and side of the lattice, e.g. memory-mapped from the cache or attached from shared memory
+_registered_couplings: Dict[Tuple[str, int, int], Tuple[np.ndarray, ...]] = {}
+_reordered_couplings: Dict[Tuple[str, int, int], Tuple[np.ndarray, ...]] = {}
+# energy caches of the neural proposals, shared by the drivers of this process
+_proposal_caches: Dict[Tuple[str, int, int], ProposalCache] = {}
+
+
+def _registry_key(spin_side: int, couplings_path: str) -> Tuple[str, int, int]:
+    return (
+        os.path.abspath(couplings_path),
+        os.stat(couplings_path).st_mtime_ns,
+        spin_side,
+    )
+
+
+def register_couplings(
+    spin_side: int,
+    couplings_path: str,
+    neighbours: np.ndarray,
+    couplings: np.ndarray,
+    len_neighbours: np.ndarray,
+) -> None:
+    """Make get_couplings return the given arrays instead of loading the couplings file.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the couplings.
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+    """
+    _registered_couplings[_registry_key(spin_side, couplings_path)] = (
+        neighbours,
+        couplings,
+        len_neighbours,
+    )
+
+
 def get_couplings(spin_side: int, couplings_path: str) -> Tuple[Any]:
-    adjacency = Adjacency(spin_side)
-    adjacency.loadtxt(couplings_path)
-    # get neighbourhood and couplings matrix
-    neighbours, couplings = adjacency.get_neighbours()
-    len_neighbours = np.sum(couplings != 0, axis=-1)
-    return neighbours.astype(int), couplings, len_neighbours
+    """Neighbours and couplings of each spin, loaded once per process from the binary
+    cache next to the couplings file, see src.utils.couplings.load_couplings.
+    Every caller gets the same arrays, read-only memory maps or shared memory
+    blocks, copy them before writing.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the couplings.
+
+    Returns:
+        Tuple[Any]: Neighbours, couplings and number of neighbours of each spin.
+    """
+    key = _registry_key(spin_side, couplings_path)
+    if key not in _registered_couplings:
+        arrays, _ = load_couplings(spin_side, couplings_path)
+        _registered_couplings[key] = (
+            arrays["neighbours"],
+            arrays["couplings"],
+            arrays["len_neighbours"],
+        )
+    return _registered_couplings[key]
+
+
+def reorder_couplings(
+    neighbours: np.ndarray, couplings: np.ndarray, len_neighbours: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Relabel the spins with the reverse Cuthill-McKee ordering, which reduces the
+    bandwidth of the coupling matrix, so that the neighbours of a spin lie close
+    in memory. Useful for irregular instances, e.g. D-Wave graphs.
+
+    Args:
+        neighbours (np.ndarray): Neighbours of each spin.
+        couplings (np.ndarray): Couplings of each spin with its neighbours.
+        len_neighbours (np.ndarray): Number of neighbours of each spin.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Neighbours, couplings and number of neighbours of each relabelled spin, and the original label of each of them. A sample in the original order is sample[..., order] in the new one, and sample[..., np.argsort(order)] goes back.
+    """
+    order = reverse_cuthill_mckee(
+        get_sparse_couplings(neighbours, couplings, len_neighbours), symmetric_mode=True
+    ).astype(np.int64)
+    inverse = np.argsort(order)
+    mask = np.arange(neighbours.shape[1]) < len_neighbours[:, None]
+    # padding keeps coupling 0, its neighbour index is irrelevant
+    new_neighbours = np.where(mask, inverse[neighbours], 0)[order].astype(
+        neighbours.dtype
+    )
+    return (
+        np.ascontiguousarray(new_neighbours),
+        np.ascontiguousarray(couplings[order]),
+        np.ascontiguousarray(len_neighbours[order]),
+        order,
+    )
+
+
+def get_reordered_couplings(spin_side: int, couplings_path: str) -> Tuple[Any]:
+    """Couplings of get_couplings relabelled by reorder_couplings, computed once per process.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the couplings.
+
+    Returns:
+        Tuple[Any]: Neighbours, couplings and number of neighbours of each spin, and the original label of each spin.
+    """
+    key = _registry_key(spin_side, couplings_path)
+    if key not in _reordered_couplings:
+        _reordered_couplings[key] = reorder_couplings(
+            *get_couplings(spin_side, couplings_path)
+        )
+    return _reordered_couplings[key]
+
+
+def get_proposal_cache(
+    spin_side: int, couplings_path: str, max_size: int
+) -> Optional[ProposalCache]:
+    """Energy cache of the proposals scored with the couplings of get_couplings, shared
+    by every driver call of this process, e.g. consecutive betas of the same instance.
+
+    Args:
+        spin_side (int): Side of the lattice.
+        couplings_path (str): Path to the couplings.
+        max_size (int): Number of distinct proposals kept, 0 to disable the cache.
+
+    Returns:
+        Optional[ProposalCache]: Shared cache, None if disabled.
+    """
+    if max_size < 1:
+        return None
+    key = _registry_key(spin_side, couplings_path)
+    cache = _proposal_caches.get(key)
+    if cache is None or cache.max_size != max_size:
+        cache = _proposal_caches[key] = ProposalCache(max_size)
+    return cache
 
 
 @jit(nopython=True)
@@ -313,6 +1172,200 @@ def compute_boltz_prob(eng: float, beta: float, num_spin: int) -> float:
     return -beta * eng
 
 
+@jit(nopython=True)
+def first_finite(log_probs: np.ndarray, boltz_log_probs: np.ndarray) -> int:
+    """First proposal a chain can be in, with finite log-probabilities. A chain
+    starting from a non finite proposal would reject every other proposal.
+
+    Args:
+        log_probs (np.ndarray): Model log-probabilities of the proposals.
+        boltz_log_probs (np.ndarray): Boltzmann log-probabilities of the proposals.
+
+    Returns:
+        int: Index of the first finite proposal, number of proposals if there is none.
+    """
+    for t in range(log_probs.shape[0]):
+        if np.isfinite(log_probs[t]) and np.isfinite(boltz_log_probs[t]):
+            return t
+    return log_probs.shape[0]
+
+
+@jit(nopython=True)
+def independent_mh_scan(
+    log_probs: np.ndarray,
+    boltz_log_probs: np.ndarray,
+    uniforms: np.ndarray,
+    chain: np.ndarray,
+    current: int,
+    first: int,
+    last: int,
+    draws: int,
+) -> Tuple[int, int, int]:
+    """Accept/reject scan of Metropolis-Hastings with independent proposals, whose
+    model and Boltzmann log-probabilities are all known in advance. Proposal t is
+    accepted with probability min(1, p(t) q(current) / (p(current) q(t))).
+    Proposals with non finite log-probabilities are skipped, the current one must be
+    finite, see first_finite. A uniform number is consumed only when the move is not
+    accepted outright, as in a sequential loop.
+
+    Args:
+        log_probs (np.ndarray): Model log-probabilities of the proposals.
+        boltz_log_probs (np.ndarray): Boltzmann log-probabilities of the proposals.
+        uniforms (np.ndarray): Uniform numbers in [0, 1), consumed in order.
+        chain (np.ndarray): Output, state of the chain after each proposal, -1 if skipped.
+        current (int): Proposal the chain is in before the scan.
+        first (int): First proposal to scan.
+        last (int): Proposal after the last one to scan.
+        draws (int): Uniform numbers already consumed.
+
+    Returns:
+        Tuple[int, int, int]: Proposal the chain is in after the scan, number of accepted proposals and uniform numbers consumed.
+    """
+    accepted = 0
+    for t in range(first, last):
+        log_prob_ratio = (
+            log_probs[current] - log_probs[t] + boltz_log_probs[t]
+        ) - boltz_log_probs[current]
+        if not (
+            np.isfinite(log_probs[t])
+            and np.isfinite(boltz_log_probs[t])
+            and np.isfinite(log_prob_ratio)
+        ):
+            chain[t] = -1
+            continue
+        if log_prob_ratio < 0.0:
+            accept = np.log(uniforms[draws]) < log_prob_ratio
+            draws += 1
+        else:
+            accept = True
+        if accept:
+            current = t
+            accepted += 1
+        chain[t] = current
+    return current, accepted, draws
+
+
+@jit(nopython=True)
+def multiple_try_scan(
+    log_probs: np.ndarray,
+    boltz_log_probs: np.ndarray,
+    uniforms: np.ndarray,
+    chain: np.ndarray,
+    selected: np.ndarray,
+    current: int,
+    tries: int,
+    first: int,
+    last: int,
+) -> Tuple[int, int]:
+    """Multiple-try Metropolis with independent proposals. Step s draws the tries
+    candidates starting at proposal 1 + s * tries, selects one of them with probability
+    proportional to its importance weight w = p / q and accepts it with probability
+    min(1, W / (W - w(selected) + w(current))), W being the total weight of the candidates.
+    Candidates with non finite log-probabilities have null weight, steps without any
+    valid candidate are skipped.
+
+    Args:
+        log_probs (np.ndarray): Model log-probabilities of the proposals.
+        boltz_log_probs (np.ndarray): Boltzmann log-probabilities of the proposals.
+        uniforms (np.ndarray): Uniform numbers in [0, 1) of shape (steps, 2), to select and to accept.
+        chain (np.ndarray): Output, state of the chain after each step, -1 if skipped.
+        selected (np.ndarray): Output, candidate selected at each step.
+        current (int): Proposal the chain is in before the scan.
+        tries (int): Number of candidates of each step.
+        first (int): First step to scan.
+        last (int): Step after the last one to scan.
+
+    Returns:
+        Tuple[int, int]: Proposal the chain is in after the scan and number of accepted candidates.
+    """
+    accepted = 0
+    weights = np.empty(tries)
+    for s in range(first, last):
+        start = 1 + s * tries
+        # importance weights relative to the largest one, to avoid overflows
+        largest = -np.inf
+        for k in range(tries):
+            weights[k] = boltz_log_probs[start + k] - log_probs[start + k]
+            if not np.isfinite(weights[k]):
+                weights[k] = -np.inf
+            elif weights[k] > largest:
+                largest = weights[k]
+        if largest == -np.inf:
+            chain[s] = -1
+            selected[s] = -1
+            continue
+        total = 0.0
+        for k in range(tries):
+            weights[k] = math.exp(weights[k] - largest)
+            total += weights[k]
+        # select a candidate by importance weight
+        threshold = uniforms[s, 0] * total
+        k = 0
+        cumulative = weights[0]
+        while cumulative <= threshold and k < tries - 1:
+            k += 1
+            cumulative += weights[k]
+        while weights[k] == 0.0:
+            k -= 1
+        selected[s] = start + k
+        # the reference set is the other candidates and the current state
+        current_weight = boltz_log_probs[current] - log_probs[current]
+        if np.isfinite(current_weight):
+            current_weight = math.exp(min(current_weight - largest, 700.0))
+        else:
+            current_weight = 0.0
+        reference = max(total - weights[k], 0.0) + current_weight
+        if uniforms[s, 1] * reference < total:
+            current = start + k
+            accepted += 1
+        chain[s] = current
+    return current, accepted
+
+
+@jit(nopython=True, parallel=True)
+def independent_mh_betas(
+    log_probs: np.ndarray,
+    engs: np.ndarray,
+    betas: np.ndarray,
+    uniforms: np.ndarray,
+    chains: np.ndarray,
+    start: int,
+) -> np.ndarray:
+    """Independent Metropolis-Hastings chains at several temperatures over the same
+    proposals, see independent_mh_scan. Proposals do not depend on the temperature,
+    so the chains share the model log-probabilities and energies and run in parallel.
+    Every chain starts from the same finite proposal, see first_finite.
+
+    Args:
+        log_probs (np.ndarray): Model log-probabilities of the proposals.
+        engs (np.ndarray): Energies of the proposals.
+        betas (np.ndarray): Inverse temperature of each chain.
+        uniforms (np.ndarray): Uniform numbers of each chain, of shape (betas, proposals).
+        chains (np.ndarray): Output, state of each chain after each proposal, of shape (betas, proposals).
+        start (int): Proposal every chain starts from, the ones before it are skipped.
+
+    Returns:
+        np.ndarray: Number of accepted proposals of each chain.
+    """
+    accepted = np.zeros(betas.shape[0], dtype=np.int64)
+    for b in prange(betas.shape[0]):
+        # Boltzmann probability of the proposals, see compute_boltz_prob
+        boltz_log_probs = -betas[b] * engs
+        chains[b, :start] = -1
+        chains[b, start] = start
+        _, accepted[b], _ = independent_mh_scan(
+            log_probs,
+            boltz_log_probs,
+            uniforms[b],
+            chains[b],
+            start,
+            start + 1,
+            log_probs.shape[0],
+            0,
+        )
+    return accepted
+
+
 def plot_hist(
     paths: List[str],
     couplings_path: str,
@@ -343,14 +1396,11 @@ def plot_hist(
 
     # laod couplings
     # TODO Adjancecy should wotk with spins, not spin side
-    neighbours, couplings, len_neighbours = get_couplings(
-        int(math.sqrt(spins)), couplings_path
+    sparse_couplings = get_sparse_couplings(
+        *get_couplings(int(math.sqrt(spins)), couplings_path)
     )
 
-    eng_truth = []
-    for t in truth:
-        eng_truth.append(compute_energy(t, neighbours, couplings, len_neighbours))
-    eng_truth = np.asarray(eng_truth) / spins
+    eng_truth = compute_energies(truth, sparse_couplings) / spins
 
     min_eng, max_eng = eng_truth.min(), eng_truth.max()
 
@@ -366,10 +1416,7 @@ def plot_hist(
         min_len_sample = min(min_len_sample, sample.shape[0])
         sample = np.reshape(sample, (-1, spins))
 
-        eng = []
-        for s in sample:
-            eng.append(compute_energy(s, neighbours, couplings, len_neighbours))
-        eng = np.asarray(eng) / spins
+        eng = compute_energies(sample, sparse_couplings) / spins
 
         min_eng = min(min_eng, eng.min())
         max_eng = max(max_eng, eng.max())
@@ -555,7 +1602,9 @@ def get_energy(
     Returns:
         List[np.array]: List of the sample configuration.
     """
-    neighbours, couplings, len_neighbours = get_couplings(square_spin, couplings_path)
+    sparse_couplings = get_sparse_couplings(
+        *get_couplings(square_spin, couplings_path)
+    )
 
     engs = []
     for path in paths:
@@ -569,10 +1618,7 @@ def get_energy(
         sample = sample.squeeze()
         sample = np.reshape(sample, (-1, square_spin ** 2))
 
-        eng = []
-        for s in sample:
-            eng.append(compute_energy(s, neighbours, couplings, len_neighbours))
-        eng = np.asarray(eng) / square_spin ** 2
+        eng = compute_energies(sample, sparse_couplings) / square_spin ** 2
 
         engs.append(eng)
     return engs
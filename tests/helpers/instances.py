@@ -0,0 +1,36 @@
+from typing import Tuple
+
+import numpy as np
+
+from src.utils.adjacency import Adjacency
+from src.utils.couplings import adjacency_arrays
+
+
+def lattice_couplings(
+    spin_side: int = 4,
+    connectivity: int = 1,
+    periodic: bool = True,
+    pm_j: bool = False,
+    seed: int = 12345,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Neighbours, couplings and number of neighbours of a random square lattice,
+    in the layout of get_couplings. With pm_j the couplings are ±1."""
+    adjacency = Adjacency(spin_side)
+    adjacency.create_adjacency(connectivity, seed=seed, periodic=periodic)
+    arrays = adjacency_arrays(adjacency)
+    couplings = arrays["couplings"]
+    if pm_j:
+        couplings = np.sign(couplings)
+    return arrays["neighbours"], couplings, arrays["len_neighbours"]
+
+
+def random_samples(num: int, spins: int, seed: int = 0) -> np.ndarray:
+    """Random configurations in {-1,+1} of shape (num, spins), as int8."""
+    rng = np.random.default_rng(seed)
+    return (2 * rng.integers(2, size=(num, spins)) - 1).astype(np.int8)
+
+
+def all_configurations(spins: int) -> np.ndarray:
+    """Every configuration of a few spins, of shape (2**spins, spins), as int8."""
+    bits = (np.arange(2 ** spins)[:, None] >> np.arange(spins)) & 1
+    return (1 - 2 * bits).astype(np.int8)
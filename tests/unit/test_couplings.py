@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.utils import couplings as couplings_module
+from src.utils.adjacency import Adjacency
+from src.utils.couplings import FIELDS, cache_dir, load_couplings
+from src.utils.utils import compute_energy, get_sparse_couplings, reorder_couplings
+from tests.helpers.instances import lattice_couplings, random_samples
+
+
+@pytest.fixture
+def couplings_path(tmp_path):
+    adjacency = Adjacency(4)
+    adjacency.create_adjacency(1, periodic=True)
+    path = str(tmp_path / "couplings.txt")
+    adjacency.savetxt(path)
+    return path
+
+
+@pytest.fixture
+def compiled(monkeypatch):
+    """Count the compilations of the text couplings."""
+    calls = []
+    compile_couplings = couplings_module.compile_couplings
+
+    def counted(*args):
+        calls.append(args)
+        return compile_couplings(*args)
+
+    monkeypatch.setattr(couplings_module, "compile_couplings", counted)
+    return calls
+
+
+def test_load_couplings_cache_hit(couplings_path, compiled):
+    arrays, content_hash = load_couplings(4, couplings_path)
+    cached, cached_hash = load_couplings(4, couplings_path)
+
+    assert len(compiled) == 1
+    assert cached_hash == content_hash
+    for name in FIELDS:
+        np.testing.assert_array_equal(cached[name], arrays[name])
+    # memory-mapped from the cache, read-only
+    assert not cached["couplings"].flags.writeable
+
+
+def test_load_couplings_touched(couplings_path, compiled):
+    load_couplings(4, couplings_path)
+    stat = os.stat(couplings_path)
+    os.utime(couplings_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    load_couplings(4, couplings_path)
+
+    # same content, the compiled arrays are kept
+    assert len(compiled) == 1
+
+
+def test_load_couplings_changed(couplings_path, compiled):
+    arrays, content_hash = load_couplings(4, couplings_path)
+    couplings = np.array(arrays["couplings"])
+    with open(couplings_path, "a") as f:
+        f.write("1 2 10.0\n")
+
+    changed, changed_hash = load_couplings(4, couplings_path)
+
+    assert len(compiled) == 2
+    assert changed_hash != content_hash
+    assert not np.array_equal(changed["couplings"], couplings)
+
+
+@pytest.mark.parametrize("damage", ["missing", "truncated"])
+def test_load_couplings_damaged(couplings_path, compiled, damage):
+    arrays, _ = load_couplings(4, couplings_path)
+    couplings = np.array(arrays["couplings"])
+    del arrays
+    path = os.path.join(cache_dir(couplings_path, 4), "couplings.npy")
+    if damage == "missing":
+        os.remove(path)
+    else:
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) // 2)
+
+    repaired, _ = load_couplings(4, couplings_path)
+
+    assert len(compiled) == 2
+    np.testing.assert_array_equal(repaired["couplings"], couplings)
+
+
+@pytest.mark.parametrize("connectivity", [1, 3])
+def test_reorder_couplings(connectivity):
+    neighbours, couplings, len_neighbours = lattice_couplings(
+        spin_side=6, connectivity=connectivity, periodic=False
+    )
+    samples = random_samples(10, neighbours.shape[0])
+
+    new_neighbours, new_couplings, new_len_neighbours, order = reorder_couplings(
+        neighbours, couplings, len_neighbours
+    )
+
+    assert new_neighbours.dtype == neighbours.dtype
+    np.testing.assert_array_equal(np.sort(order), np.arange(neighbours.shape[0]))
+    # relabelling and back is the identity
+    np.testing.assert_array_equal(samples[:, order][:, np.argsort(order)], samples)
+    # same coupling matrix, with permuted rows and columns
+    matrix = get_sparse_couplings(neighbours, couplings, len_neighbours).toarray()
+    new_matrix = get_sparse_couplings(
+        new_neighbours, new_couplings, new_len_neighbours
+    ).toarray()
+    np.testing.assert_array_equal(new_matrix, matrix[order][:, order])
+    for sample in samples:
+        assert compute_energy(
+            sample[order], new_neighbours, new_couplings, new_len_neighbours
+        ) == pytest.approx(compute_energy(sample, neighbours, couplings, len_neighbours))
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+import torch
+
+from src.utils.metrics import compute_energy_torch, get_torch_couplings
+from src.utils.stencil import Stencil
+from src.utils.utils import (
+    batch_energies,
+    compute_energies,
+    compute_energy,
+    compute_energy_batch,
+    get_sparse_couplings,
+)
+from tests.helpers.instances import lattice_couplings, random_samples
+
+
+def reference_energies(samples, neighbours, couplings, len_neighbours):
+    return np.array(
+        [compute_energy(s, neighbours, couplings, len_neighbours) for s in samples]
+    )
+
+
+@pytest.mark.parametrize("periodic", [True, False])
+def test_compute_energies(periodic):
+    neighbours, couplings, len_neighbours = lattice_couplings(
+        connectivity=2, periodic=periodic
+    )
+    samples = random_samples(100, neighbours.shape[0])
+
+    # int8 samples in chunks smaller than the batch
+    engs = compute_energies(
+        samples, get_sparse_couplings(neighbours, couplings, len_neighbours), 32
+    )
+
+    np.testing.assert_allclose(
+        engs, reference_energies(samples, neighbours, couplings, len_neighbours)
+    )
+
+
+@pytest.mark.parametrize("block", [1, 7, 64])
+def test_compute_energy_batch(block):
+    neighbours, couplings, len_neighbours = lattice_couplings(connectivity=2)
+    samples = random_samples(100, neighbours.shape[0])
+
+    engs = compute_energy_batch(samples, neighbours, couplings, len_neighbours, block)
+
+    np.testing.assert_allclose(
+        engs, reference_energies(samples, neighbours, couplings, len_neighbours)
+    )
+
+
+@pytest.mark.parametrize("backend", ["numba", "sparse"])
+def test_batch_energies_backends(backend):
+    neighbours, couplings, len_neighbours = lattice_couplings(connectivity=2)
+    samples = random_samples(100, neighbours.shape[0])
+
+    engs = batch_energies(samples, neighbours, couplings, len_neighbours, backend)
+
+    np.testing.assert_allclose(
+        engs, reference_energies(samples, neighbours, couplings, len_neighbours)
+    )
+
+
+def test_compute_energy_torch():
+    neighbours, couplings, len_neighbours = lattice_couplings(connectivity=2)
+    samples = random_samples(100, neighbours.shape[0])
+
+    engs = compute_energy_torch(
+        torch.from_numpy(samples),
+        get_torch_couplings(neighbours, couplings, len_neighbours),
+    )
+
+    assert engs.shape == (samples.shape[0],)
+    np.testing.assert_allclose(
+        engs.numpy(), reference_energies(samples, neighbours, couplings, len_neighbours)
+    )
+
+
+@pytest.mark.parametrize("connectivity", [1, 2, 3])
+@pytest.mark.parametrize("periodic", [True, False])
+def test_stencil_energies(connectivity, periodic):
+    neighbours, couplings, len_neighbours = lattice_couplings(
+        spin_side=7, connectivity=connectivity, periodic=periodic
+    )
+    samples = random_samples(100, neighbours.shape[0])
+    stencil = Stencil.from_couplings(neighbours, couplings, len_neighbours)
+
+    engs = stencil.energies(samples)
+
+    assert stencil is not None
+    reference = reference_energies(samples, neighbours, couplings, len_neighbours)
+    np.testing.assert_allclose(engs, reference)
+    np.testing.assert_allclose(
+        batch_energies(samples, neighbours, couplings, len_neighbours, "stencil"),
+        reference,
+    )
+    np.testing.assert_allclose(
+        batch_energies(
+            samples, neighbours, couplings, len_neighbours, "auto", stencil=stencil
+        ),
+        reference,
+    )
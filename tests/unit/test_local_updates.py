@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from src.utils.stencil import Stencil
+from src.utils.utils import (
+    build_rate_tree,
+    colour_sweep,
+    compute_delta_h,
+    compute_energy,
+    compute_local_fields,
+    get_colour_classes,
+    greedy_colouring,
+    nfold_way_sweep,
+    seed_kernels,
+    single_spin_flip_sweep,
+)
+from tests.helpers.instances import lattice_couplings, random_samples
+
+
+def assert_consistent(sample, eng, neighbours, couplings, len_neighbours, fields=None):
+    """Energy and local fields kept by a kernel match a computation from scratch."""
+    assert eng == pytest.approx(
+        compute_energy(sample, neighbours, couplings, len_neighbours), abs=1e-9
+    )
+    if fields is None:
+        return
+    np.testing.assert_allclose(
+        fields, compute_local_fields(sample, neighbours, couplings, len_neighbours)
+    )
+    for k in range(sample.shape[0]):
+        assert -2.0 * sample[k] * fields[k] == pytest.approx(
+            compute_delta_h(k, sample, neighbours[k], couplings[k], len_neighbours[k])
+        )
+
+
+@pytest.mark.parametrize("beta", [0.1, 1.0, 5.0])
+def test_single_spin_flip_sweep(beta):
+    neighbours, couplings, len_neighbours = lattice_couplings()
+    sample = random_samples(1, neighbours.shape[0])[0]
+    fields = compute_local_fields(sample, neighbours, couplings, len_neighbours)
+    eng = compute_energy(sample, neighbours, couplings, len_neighbours)
+
+    seed_kernels(0)
+    eng, accepted = single_spin_flip_sweep(
+        sample,
+        fields,
+        eng,
+        beta,
+        neighbours,
+        couplings,
+        len_neighbours,
+        10 * neighbours.shape[0],
+    )
+
+    assert accepted > 0
+    assert_consistent(sample, eng, neighbours, couplings, len_neighbours, fields)
+
+
+@pytest.mark.parametrize("periodic", [True, False])
+def test_colour_sweep(periodic):
+    neighbours, couplings, len_neighbours = lattice_couplings(
+        connectivity=2, periodic=periodic
+    )
+    colour_sites, colour_offsets = get_colour_classes(neighbours, len_neighbours)
+    samples = random_samples(3, neighbours.shape[0])
+    engs = np.array(
+        [compute_energy(s, neighbours, couplings, len_neighbours) for s in samples]
+    )
+    betas = np.array([0.1, 1.0, 5.0])
+
+    seed_kernels(0)
+    accepted = colour_sweep(
+        samples,
+        engs,
+        betas,
+        neighbours,
+        couplings,
+        len_neighbours,
+        colour_sites,
+        colour_offsets,
+        5,
+    )
+
+    assert np.all(accepted > 0)
+    # no two spins of a class are coupled
+    for colour in range(colour_offsets.shape[0] - 1):
+        sites = colour_sites[colour_offsets[colour] : colour_offsets[colour + 1]]
+        for k in sites:
+            assert not np.isin(neighbours[k, : len_neighbours[k]], sites).any()
+    for sample, eng in zip(samples, engs):
+        assert_consistent(sample, eng, neighbours, couplings, len_neighbours)
+
+
+@pytest.mark.parametrize("beta", [0.1, 1.0, 5.0])
+def test_nfold_way_sweep(beta):
+    neighbours, couplings, len_neighbours = lattice_couplings()
+    sample = random_samples(1, neighbours.shape[0])[0]
+    fields = compute_local_fields(sample, neighbours, couplings, len_neighbours)
+    eng = compute_energy(sample, neighbours, couplings, len_neighbours)
+    tree = build_rate_tree(sample, fields, beta)
+
+    seed_kernels(0)
+    eng, clock, flips = nfold_way_sweep(
+        sample,
+        eng,
+        fields,
+        tree,
+        beta,
+        neighbours,
+        couplings,
+        len_neighbours,
+        0.0,
+        100.0 * neighbours.shape[0],
+    )
+
+    assert clock == 100.0 * neighbours.shape[0]
+    assert flips > 0
+    assert_consistent(sample, eng, neighbours, couplings, len_neighbours, fields)
+    # the rates kept in the tree match the new configuration
+    np.testing.assert_allclose(tree, build_rate_tree(sample, fields, beta))
+
+
+@pytest.mark.parametrize("periodic", [True, False])
+def test_stencil_colour_sweep(periodic):
+    neighbours, couplings, len_neighbours = lattice_couplings(
+        spin_side=6, connectivity=2, periodic=periodic
+    )
+    stencil = Stencil.from_couplings(neighbours, couplings, len_neighbours)
+    colours = greedy_colouring(neighbours, len_neighbours)
+    samples = random_samples(3, neighbours.shape[0])
+    engs = np.array(
+        [compute_energy(s, neighbours, couplings, len_neighbours) for s in samples]
+    )
+
+    seed_kernels(0)
+    accepted = stencil.colour_sweep(samples, engs, np.array([0.1, 1.0, 5.0]), colours, 5)
+
+    assert np.all(accepted > 0)
+    for sample, eng in zip(samples, engs):
+        assert_consistent(sample, eng, neighbours, couplings, len_neighbours)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from src.utils.multispin import (
+    LANES,
+    acceptance_table,
+    multispin_energies,
+    multispin_sweep,
+    pack_spins,
+    pm_j_magnitude,
+    sign_masks,
+    unpack_spins,
+)
+from src.utils.utils import (
+    compute_energy,
+    compute_local_fields,
+    replica_spin_flip_sweep,
+    seed_kernels,
+)
+from tests.helpers.instances import lattice_couplings, random_samples
+
+
+@pytest.mark.parametrize("replicas", [1, 63, 64, 130])
+def test_pack_unpack(replicas):
+    samples = random_samples(replicas, 16)
+    words = pack_spins(samples)
+
+    assert words.shape == (-(-replicas // LANES), 16)
+    np.testing.assert_array_equal(unpack_spins(words, replicas), samples)
+
+
+def test_multispin_energies():
+    neighbours, couplings, len_neighbours = lattice_couplings(pm_j=True)
+    samples = random_samples(100, neighbours.shape[0])
+    magnitude = pm_j_magnitude(couplings, len_neighbours)
+
+    engs = multispin_energies(
+        pack_spins(samples),
+        sign_masks(couplings),
+        neighbours,
+        len_neighbours,
+        magnitude,
+        samples.shape[0],
+    )
+
+    assert magnitude == 1.0
+    np.testing.assert_allclose(
+        engs,
+        [compute_energy(s, neighbours, couplings, len_neighbours) for s in samples],
+    )
+
+
+def test_multispin_sweep_distribution():
+    neighbours, couplings, len_neighbours = lattice_couplings(pm_j=True)
+    spins = neighbours.shape[0]
+    replicas, beta, snapshots = 2 * LANES, 0.5, 20
+    samples = random_samples(replicas, spins)
+
+    # multi-spin coded chains
+    seed_kernels(0)
+    words = pack_spins(samples)
+    lanes = pack_spins(-np.ones((replicas, 1)))[:, 0]
+    signs = sign_masks(couplings)
+    table = acceptance_table(beta, 1.0, neighbours.shape[1])
+    multispin_engs = []
+    for step in range(2 * snapshots):
+        multispin_sweep(words, lanes, signs, neighbours, len_neighbours, table, spins)
+        if step >= snapshots:
+            multispin_engs.append(
+                multispin_energies(
+                    words, signs, neighbours, len_neighbours, 1.0, replicas
+                )
+            )
+
+    # scalar chains from the same starting points
+    scalar = samples.copy()
+    fields = np.stack(
+        [compute_local_fields(s, neighbours, couplings, len_neighbours) for s in scalar]
+    )
+    engs = np.array(
+        [compute_energy(s, neighbours, couplings, len_neighbours) for s in scalar]
+    )
+    betas = np.full(replicas, beta)
+    scalar_engs = []
+    for step in range(2 * snapshots):
+        replica_spin_flip_sweep(
+            scalar, fields, engs, betas, neighbours, couplings, len_neighbours, spins
+        )
+        if step >= snapshots:
+            scalar_engs.append(engs.copy())
+
+    # same mean energy per spin, within a few standard errors
+    assert np.mean(multispin_engs) / spins == pytest.approx(
+        np.mean(scalar_engs) / spins, abs=0.05
+    )
+    assert np.std(multispin_engs) / spins == pytest.approx(
+        np.std(scalar_engs) / spins, abs=0.05
+    )
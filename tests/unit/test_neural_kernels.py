@@ -0,0 +1,188 @@
+import numpy as np
+import pytest
+from scipy.special import logsumexp
+
+from src.utils.importance import importance_estimates
+from src.utils.utils import (
+    compute_energies,
+    first_finite,
+    get_sparse_couplings,
+    independent_mh_betas,
+    independent_mh_scan,
+    multiple_try_scan,
+)
+from tests.helpers.instances import all_configurations, lattice_couplings
+
+
+def exact_lattice(spin_side=4):
+    """Every configuration of a small lattice, with its energy."""
+    neighbours, couplings, len_neighbours = lattice_couplings(spin_side=spin_side)
+    configs = all_configurations(neighbours.shape[0])
+    engs = compute_energies(
+        configs, get_sparse_couplings(neighbours, couplings, len_neighbours)
+    )
+    return configs, engs
+
+
+def exact_estimates(engs, beta, spins):
+    """Energy, specific heat and free energy per spin of the Boltzmann distribution."""
+    log_z = logsumexp(-beta * engs)
+    probs = np.exp(-beta * engs - log_z)
+    energy = probs @ engs / spins
+    heat = beta ** 2 * spins * (probs @ (engs / spins) ** 2 - energy ** 2)
+    return energy, heat, -log_z / (beta * spins)
+
+
+def python_mh(log_probs, boltz_log_probs):
+    """Accept/reject loop of neural_mcmc before it was compiled, with the chain
+    state after each proposal, -1 if skipped."""
+    current, accepted, chain = 0, 0, [0]
+    for t in range(1, log_probs.shape[0]):
+        if not (np.isfinite(log_probs[t]) and np.isfinite(boltz_log_probs[t])):
+            chain.append(-1)
+            continue
+        log_prob_ratio = (
+            log_probs[current] - log_probs[t] + boltz_log_probs[t]
+        ) - boltz_log_probs[current]
+        if log_prob_ratio >= 0.0 or np.log(np.random.random_sample()) < log_prob_ratio:
+            current = t
+            accepted += 1
+        chain.append(current)
+    return np.array(chain), accepted
+
+
+@pytest.mark.parametrize("block", [7, 1000])
+def test_independent_mh_scan(block):
+    rng = np.random.default_rng(0)
+    num = 1000
+    log_probs = rng.normal(-10.0, 2.0, num)
+    boltz_log_probs = rng.normal(-10.0, 2.0, num)
+    log_probs[rng.integers(1, num, 20)] = np.nan
+    boltz_log_probs[rng.integers(1, num, 20)] = np.inf
+
+    np.random.seed(1)
+    reference, reference_accepted = python_mh(log_probs, boltz_log_probs)
+
+    np.random.seed(1)
+    uniforms = np.random.random_sample(num)
+    chain = np.zeros(num, dtype=np.int64)
+    state, accepted, draws = 0, 0, 0
+    for first in range(1, num, block):
+        state, accepted_block, draws = independent_mh_scan(
+            log_probs,
+            boltz_log_probs,
+            uniforms,
+            chain,
+            state,
+            first,
+            min(first + block, num),
+            draws,
+        )
+        accepted += accepted_block
+
+    np.testing.assert_array_equal(chain, reference)
+    assert accepted == reference_accepted
+    assert state == reference[reference >= 0][-1]
+
+
+def test_independent_mh_scan_nan_start():
+    rng = np.random.default_rng(0)
+    num = 1000
+    log_probs = rng.normal(-10.0, 2.0, num)
+    boltz_log_probs = rng.normal(-10.0, 2.0, num)
+    log_probs[0] = np.nan
+    boltz_log_probs[1] = -np.inf
+
+    start = first_finite(log_probs, boltz_log_probs)
+    assert start == 2
+    assert first_finite(np.full(3, np.nan), np.zeros(3)) == 3
+
+    np.random.seed(1)
+    reference, reference_accepted = python_mh(log_probs[start:], boltz_log_probs[start:])
+
+    np.random.seed(1)
+    uniforms = np.random.random_sample(num)
+    chain = np.full(num, -1, dtype=np.int64)
+    chain[start] = start
+    state, accepted, _ = independent_mh_scan(
+        log_probs, boltz_log_probs, uniforms, chain, start, start + 1, num, 0
+    )
+
+    # the chain moves as if the proposals before the first finite one did not exist
+    np.testing.assert_array_equal(chain[start:], np.where(reference >= 0, reference + start, -1))
+    assert accepted == reference_accepted > 0
+    assert state == reference[-1] + start
+
+
+def test_independent_mh_betas_nan_start():
+    rng = np.random.default_rng(0)
+    num = 1000
+    log_probs = rng.normal(-10.0, 2.0, num)
+    engs = rng.normal(-20.0, 4.0, num)
+    log_probs[0] = np.nan
+    betas = np.array([0.1, 0.5, 1.0])
+    uniforms = rng.random((betas.shape[0], num))
+    chains = np.empty((betas.shape[0], num), dtype=np.int64)
+
+    start = first_finite(log_probs, engs)
+    accepted = independent_mh_betas(log_probs, engs, betas, uniforms, chains, start)
+
+    for b, beta in enumerate(betas):
+        chain = np.full(num, -1, dtype=np.int64)
+        chain[start] = start
+        _, reference_accepted, _ = independent_mh_scan(
+            log_probs, -beta * engs, uniforms[b], chain, start, start + 1, num, 0
+        )
+        np.testing.assert_array_equal(chains[b], chain)
+        assert accepted[b] == reference_accepted > 0
+
+
+def test_importance_estimates_exact():
+    _, engs = exact_lattice()
+    spins = 16
+    betas = np.array([0.1, 0.5, 1.0, 2.0])
+    # every configuration once, proposed uniformly
+    log_probs = np.full(engs.shape[0], -spins * np.log(2.0))
+
+    out = importance_estimates(log_probs, engs, betas, spins, max_elements=3 * engs.shape[0])
+
+    for b, beta in enumerate(betas):
+        energy, heat, free_energy = exact_estimates(engs, beta, spins)
+        assert out["energy"][b] == pytest.approx(energy, abs=1e-10)
+        assert out["heat"][b] == pytest.approx(heat, rel=1e-8)
+        assert out["free_energy"][b] == pytest.approx(free_energy, abs=1e-10)
+    assert np.all(out["ess_ratio"] > 0.0) and np.all(out["ess_ratio"] <= 1.0)
+    # the weights flatten as the temperature grows
+    assert np.all(np.diff(out["ess"]) < 0.0)
+
+
+@pytest.mark.parametrize("tries", [1, 4])
+@pytest.mark.parametrize("beta", [0.2, 0.3])
+def test_multiple_try_scan_exact(tries, beta):
+    _, engs = exact_lattice()
+    spins = 16
+    rng = np.random.default_rng(0)
+    steps = 100000
+    # independent proposals, drawn uniformly among all the configurations
+    proposed = rng.integers(engs.shape[0], size=1 + steps * tries)
+    log_probs = np.full(proposed.shape[0], -spins * np.log(2.0))
+    log_probs[rng.integers(1, proposed.shape[0], 100)] = np.nan
+    boltz_log_probs = -beta * engs[proposed]
+
+    chain = np.zeros(steps, dtype=np.int64)
+    selected = np.zeros(steps, dtype=np.int64)
+    uniforms = rng.random((steps, 2))
+    _, accepted = multiple_try_scan(
+        log_probs, boltz_log_probs, uniforms, chain, selected, 0, tries, 0, steps
+    )
+
+    assert 0 < accepted < steps
+    # the selected candidates are finite and within their step
+    valid = selected >= 0
+    starts = 1 + np.arange(steps) * tries
+    assert np.all((selected[valid] >= starts[valid]) & (selected[valid] < starts[valid] + tries))
+    assert np.all(np.isfinite(log_probs[selected[valid]]))
+    # the chain samples the Boltzmann distribution, after a short burn-in
+    states = chain[chain >= 0][1000:]
+    energy, _, _ = exact_estimates(engs, beta, spins)
+    assert engs[proposed[states]].mean() / spins == pytest.approx(energy, abs=0.02)